@@ -0,0 +1,342 @@
+import copy
+import os
+import time
+from datetime import datetime
+from threading import Lock
+from flask import current_app
+from sqlalchemy import func, select
+from models import db, Chapter, Quiz, Question, Score, QuestionAttempt
+from db_profile import ANALYTICS_BIND, reading_from
+from rollups import version_stamps
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; callers fall back to the SQL reports
+    np = None
+
+DIFFICULTIES = ["Easy", "Medium", "Hard"]
+
+# Re-check the database for new or changed rows after this many seconds when
+# the app config does not set ANALYTICS_REFRESH_SECONDS
+DEFAULT_REFRESH_SECONDS = 60
+
+# Rows pulled from the database cursor per batch while building the arrays
+FETCH_SIZE = 50000
+
+EPOCH = datetime(1970, 1, 1)
+
+SCORE_FIELDS = {
+    "id": (Score.id, "int64"),
+    "user_id": (Score.user_id, "int64"),
+    "quiz_id": (Score.quiz_id, "int64"),
+    "total_scored": (Score.total_scored, "float64"),
+    "time_spent": (Score.time_spent, "int64"),
+    "timestamp": (Score.time_stamp_of_attempt, "int64"),
+    "completed": (Score.completion_status, "bool"),
+}
+
+ATTEMPT_FIELDS = {
+    "id": (QuestionAttempt.id, "int64"),
+    "score_id": (QuestionAttempt.score_id, "int64"),
+    "user_id": (QuestionAttempt.user_id, "int64"),
+    "question_id": (QuestionAttempt.question_id, "int64"),
+    "is_correct": (QuestionAttempt.is_correct, "bool"),
+    "time_spent": (QuestionAttempt.time_spent, "int64"),
+    "marks_awarded": (QuestionAttempt.marks_awarded, "float64"),
+}
+
+
+def analytics_available():
+    return np is not None
+
+
+def _convert(name, value):
+    if name == "timestamp":
+        return int((value - EPOCH).total_seconds()) if value else 0
+    if name == "completed":
+        return value == "Completed"
+    return value or 0
+
+
+def _fetch_columns(fields, min_id=0):
+    """Load `fields` for rows with id > min_id as a dict of NumPy arrays"""
+    model_id = fields["id"][0]
+    stmt = select(*[column for column, _ in fields.values()]).where(model_id > min_id).order_by(model_id)
+    names = list(fields)
+    chunks = {name: [] for name in names}
+    result = db.session.execute(stmt.execution_options(yield_per=FETCH_SIZE))
+    for partition in result.partitions():
+        for index, name in enumerate(names):
+            chunks[name].append(np.array([_convert(name, row[index]) for row in partition],
+                                         dtype=fields[name][1]))
+    return {name: (np.concatenate(parts) if parts else np.zeros(0, dtype=fields[name][1]))
+            for name, parts in chunks.items()}
+
+
+def _fingerprint(model, value_column):
+    """(row count, sum of a value column) used to detect updates and deletes"""
+    count, total = db.session.query(func.count(model.id), func.coalesce(func.sum(value_column), 0)).one()
+    return int(count), float(total)
+
+
+def _data_version():
+    # Read in the same transaction as the rows, so the rows include everything up to it
+    return version_stamps(["data"])["data"]
+
+
+def _lookup(pairs, default, dtype):
+    """Dense array indexed by id, for id -> value dimension lookups"""
+    pairs = list(pairs)
+    size = max((key for key, _ in pairs), default=0) + 1
+    array = np.full(size, default, dtype=dtype)
+    for key, value in pairs:
+        array[key] = value if value is not None else default
+    return array
+
+
+class AttemptSnapshot:
+    """
+    Column arrays of every Score and QuestionAttempt row.
+    Facts are appended incrementally; dimension lookups (quiz -> subject,
+    quiz -> total marks, question -> difficulty) are reloaded on each refresh.
+    """
+
+    def __init__(self, scores=None, attempts=None):
+        self.scores = scores or {name: np.zeros(0, dtype=dtype) for name, (_, dtype) in SCORE_FIELDS.items()}
+        self.attempts = attempts or {name: np.zeros(0, dtype=dtype) for name, (_, dtype) in ATTEMPT_FIELDS.items()}
+        self.quiz_subject = np.zeros(0, dtype="int64")
+        self.quiz_marks = np.zeros(0, dtype="float64")
+        self.question_difficulty = np.zeros(0, dtype="int8")
+        self.loaded_at = time.monotonic()
+        self.appended = 0  # rows added by the last refresh()
+        self.version = 0  # the 'data' version counter the rows were read at
+
+    # -- loading ---------------------------------------------------------
+
+    @classmethod
+    def from_database(cls):
+        version = _data_version()
+        snapshot = cls(_fetch_columns(SCORE_FIELDS), _fetch_columns(ATTEMPT_FIELDS))
+        snapshot.load_dimensions()
+        snapshot.version = version
+        return snapshot
+
+    @classmethod
+    def from_file(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            scores = {name: data[f"score_{name}"] for name in SCORE_FIELDS}
+            attempts = {name: data[f"attempt_{name}"] for name in ATTEMPT_FIELDS}
+        snapshot = cls(scores, attempts)
+        snapshot.load_dimensions()
+        return snapshot
+
+    def save(self, path):
+        arrays = {f"score_{name}": values for name, values in self.scores.items()}
+        arrays.update({f"attempt_{name}": values for name, values in self.attempts.items()})
+        temp_path = f"{path}.tmp.npz"
+        np.savez(temp_path, **arrays)
+        os.replace(temp_path, path)
+
+    def load_dimensions(self):
+        self.quiz_subject = _lookup(db.session.query(Quiz.id, Chapter.subject_id).join(
+            Chapter, Chapter.id == Quiz.chapter_id).all(), -1, "int64")
+        self.quiz_marks = _lookup(db.session.query(Quiz.id, Quiz.total_marks).all(), 0, "float64")
+        codes = {name: index for index, name in enumerate(DIFFICULTIES)}
+        self.question_difficulty = _lookup(
+            ((question_id, codes.get(difficulty, -1))
+             for question_id, difficulty in db.session.query(Question.id, Question.difficulty).all()),
+            -1, "int8")
+
+    def refresh(self):
+        """
+        Append rows added since the last refresh. Returns False when rows were
+        updated or deleted in the meantime (e.g. a regrade) and a full reload is needed.
+        """
+        version = _data_version()
+        last_score = int(self.scores["id"].max()) if len(self.scores["id"]) else 0
+        last_attempt = int(self.attempts["id"].max()) if len(self.attempts["id"]) else 0
+        new_scores = _fetch_columns(SCORE_FIELDS, last_score)
+        new_attempts = _fetch_columns(ATTEMPT_FIELDS, last_attempt)
+        self.scores = {name: np.concatenate([self.scores[name], new_scores[name]]) for name in SCORE_FIELDS}
+        self.attempts = {name: np.concatenate([self.attempts[name], new_attempts[name]]) for name in ATTEMPT_FIELDS}
+        self.load_dimensions()
+        self.loaded_at = time.monotonic()
+        self.appended = len(new_scores["id"]) + len(new_attempts["id"])
+        self.version = version
+        return (self._matches(_fingerprint(Score, Score.total_scored), self.scores, "total_scored") and
+                self._matches(_fingerprint(QuestionAttempt, QuestionAttempt.marks_awarded),
+                              self.attempts, "marks_awarded"))
+
+    @staticmethod
+    def _matches(fingerprint, columns, value_field):
+        count, total = fingerprint
+        return count == len(columns["id"]) and np.isclose(total, columns[value_field].sum())
+
+    # -- lookups ---------------------------------------------------------
+
+    @staticmethod
+    def _take(lookup, ids, default):
+        """lookup[ids] with `default` for ids beyond the lookup table"""
+        result = np.full(len(ids), default, dtype=lookup.dtype)
+        inside = ids < len(lookup)
+        result[inside] = lookup[ids[inside]]
+        return result
+
+    def score_percentages(self):
+        marks = self._take(self.quiz_marks, self.scores["quiz_id"], 0)
+        valid = marks > 0
+        percentages = np.zeros(len(marks), dtype="float64")
+        percentages[valid] = self.scores["total_scored"][valid] / marks[valid] * 100
+        return percentages, valid
+
+    def _score_mask(self, quiz_id=None, user_id=None):
+        mask = np.ones(len(self.scores["id"]), dtype=bool)
+        if quiz_id is not None:
+            mask &= self.scores["quiz_id"] == int(quiz_id)
+        if user_id is not None:
+            mask &= self.scores["user_id"] == int(user_id)
+        return mask
+
+    # -- analytics -------------------------------------------------------
+
+    def score_histogram(self, bins=10, quiz_id=None, user_id=None):
+        """Counts of attempts per score-percentage bucket"""
+        percentages, valid = self.score_percentages()
+        values = np.clip(percentages[valid & self._score_mask(quiz_id, user_id)], 0, 100)
+        counts, edges = np.histogram(values, bins=bins, range=(0, 100))
+        return {
+            "labels": [f"{edges[i]:.0f}-{edges[i + 1]:.0f}%" for i in range(len(counts))],
+            "counts": counts.tolist(),
+        }
+
+    def difficulty_accuracy(self, user_id=None):
+        """Attempted/correct per difficulty, shaped like reports.difficulty_stats()"""
+        codes = self._take(self.question_difficulty, self.attempts["question_id"], -1)
+        mask = codes >= 0
+        if user_id is not None:
+            mask &= self.attempts["user_id"] == int(user_id)
+        attempted = np.bincount(codes[mask], minlength=len(DIFFICULTIES))
+        correct = np.bincount(codes[mask], weights=self.attempts["is_correct"][mask], minlength=len(DIFFICULTIES))
+        return {
+            "difficulty_order": DIFFICULTIES,
+            "attempted_list": attempted.astype(int).tolist(),
+            "correct_list": correct.astype(int).tolist(),
+        }
+
+    def time_distribution(self, bins=10, quiz_id=None):
+        """Histogram (in minutes) and quartiles of time spent per attempt"""
+        times = self.scores["time_spent"][(self.scores["time_spent"] > 0) & self._score_mask(quiz_id)] / 60
+        if not len(times):
+            return {"labels": [], "counts": [], "percentiles": {}}
+        counts, edges = np.histogram(times, bins=bins)
+        quantiles = np.percentile(times, [25, 50, 75, 90])
+        return {
+            "labels": [f"{edges[i]:.1f}-{edges[i + 1]:.1f}" for i in range(len(counts))],
+            "counts": counts.tolist(),
+            "percentiles": dict(zip(("p25", "p50", "p75", "p90"), np.round(quantiles, 1).tolist())),
+        }
+
+    def subject_means(self):
+        """subject_id -> mean score percentage, as one weighted bincount"""
+        percentages, valid = self.score_percentages()
+        subjects = self._take(self.quiz_subject, self.scores["quiz_id"], -1)
+        valid &= subjects >= 0
+        if not valid.any():
+            return {}
+        totals = np.bincount(subjects[valid], weights=percentages[valid])
+        counts = np.bincount(subjects[valid])
+        present = np.nonzero(counts)[0]
+        return {int(subject_id): float(totals[subject_id] / counts[subject_id]) for subject_id in present}
+
+
+class SnapshotRegistry:
+    """
+    Process-wide AttemptSnapshot, persisted as .npz so restarts skip the full scan.
+    One request at a time builds or refreshes it, outside the lock readers take:
+    the others keep using the previous snapshot, or the SQL reports while there is none.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._lock = Lock()
+        self._building = Lock()
+
+    def _path(self):
+        return current_app.config.get("ANALYTICS_SNAPSHOT_PATH") or os.path.join(
+            current_app.instance_path, "analytics_snapshot.npz")
+
+    def _load(self):
+        path = self._path()
+        if os.path.exists(path):
+            try:
+                snapshot = AttemptSnapshot.from_file(path)
+                if snapshot.refresh():
+                    if snapshot.appended:
+                        snapshot.save(path)
+                    return snapshot
+                current_app.logger.info("Analytics snapshot on disk is stale, rebuilding")
+            except (OSError, ValueError, KeyError) as e:
+                current_app.logger.warning(f"Could not read analytics snapshot {path}: {e}")
+        snapshot = AttemptSnapshot.from_database()
+        self._save(snapshot, path)
+        return snapshot
+
+    def _save(self, snapshot, path):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            snapshot.save(path)
+        except OSError as e:
+            current_app.logger.warning(f"Could not write analytics snapshot {path}: {e}")
+
+    def _refreshed(self, current):
+        if current is None:
+            return self._load()
+        # refresh() replaces the arrays rather than changing them, so readers of
+        # `current` are unaffected by the shallow copy being brought up to date
+        snapshot = copy.copy(current)
+        if not snapshot.refresh():
+            snapshot = AttemptSnapshot.from_database()
+            self._save(snapshot, self._path())
+        elif snapshot.appended:
+            self._save(snapshot, self._path())
+        return snapshot
+
+    def get(self, min_version=None):
+        if np is None:
+            return None
+        refresh = current_app.config.get("ANALYTICS_REFRESH_SECONDS", DEFAULT_REFRESH_SECONDS)
+        with self._lock:
+            current = self._snapshot
+        # A snapshot read before `min_version` would be missing rows a response tagged with it promises
+        usable = current is not None and (min_version is None or current.version >= min_version)
+        if usable and time.monotonic() - current.loaded_at <= refresh:
+            return current
+        if not self._building.acquire(blocking=False):
+            # Another request is building; None sends callers to the SQL reports meanwhile
+            return current if usable else None
+        try:
+            # Always compared against the live data, also from views reading the database snapshot,
+            # so the incremental refresh never sees rows disappear
+            with reading_from(ANALYTICS_BIND):
+                snapshot = self._refreshed(current)
+            with self._lock:
+                self._snapshot = snapshot
+            return snapshot
+        finally:
+            self._building.release()
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+
+snapshots = SnapshotRegistry()
+
+
+def get_snapshot(min_version=None):
+    """
+    The current AttemptSnapshot, refreshed first when it was read before the
+    'data' version `min_version`. None when NumPy is not installed or another
+    request is still building a snapshot recent enough.
+    """
+    return snapshots.get(min_version)
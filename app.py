@@ -1,33 +1,130 @@
 from flask import Flask
 from routes import app_routes
 from models import db
+from grading_queue import grading_pool
+from quiz_content import quiz_content_warmer
+from fragment_cache import FragmentCacheExtension
+import assets
+import media_store
+import db_profile
+import snapshot_db
+from rollups import rebuild_rollups_command
+from quiz_totals import repair_quiz_totals_command, ensure_quiz_total_columns
+from item_analysis import item_analysis_command
+from db_maintenance import maintenance_scheduler, db_maintenance_command
 import os
 from jinja2 import ChoiceLoader, FileSystemLoader
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your_secret_key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///quiz_master.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'your_secret_key'
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///quiz_master.db'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # SQLite PRAGMAs per connection: 'production' (WAL, busy_timeout, synchronous=NORMAL, mmap, cache)
+    # or 'default'; SQLITE_PRAGMAS overrides single values
+    app.config['DATABASE_PROFILE'] = 'production'
+    app.config['SQLITE_PRAGMAS'] = {}
+    # Analytics and report views read through a second, read-only engine
+    # (ANALYTICS_DATABASE_URI defaults to the main database)
+    app.config['ANALYTICS_READ_ENGINE'] = True
+    app.config['ANALYTICS_DATABASE_URI'] = None
+    # Admin reports (summary, item analysis, exports) read a copy of the database refreshed every
+    # SNAPSHOT_DB_INTERVAL seconds (0 reads live); SNAPSHOT_DB_PATH defaults to instance/analytics_snapshot.db
+    app.config['SNAPSHOT_DB_INTERVAL'] = 300
+    app.config['SNAPSHOT_DB_PATH'] = None
+    # Background database maintenance, checked every DB_MAINTENANCE_INTERVAL seconds: ANALYZE tables whose
+    # row count drifted, incremental_vacuum in DB_VACUUM_PAGES batches during the quiet hours (local
+    # [start, end)), and a WAL checkpoint once the WAL exceeds DB_WAL_CHECKPOINT_BYTES (PASSIVE, which never
+    # holds up writers; TRUNCATE during the quiet hours)
+    app.config['DB_MAINTENANCE'] = True
+    app.config['DB_MAINTENANCE_INTERVAL'] = 300
+    app.config['DB_MAINTENANCE_QUIET_HOURS'] = (2, 5)
+    app.config['DB_VACUUM_PAGES'] = 256
+    app.config['DB_WAL_CHECKPOINT_BYTES'] = 64 * 1024 * 1024
+    # Log every graded question of a submission (noisy, for debugging only)
+    app.config['GRADING_DEBUG_LOG'] = False
+    # Queue submissions for the background grading pool instead of grading in the request
+    app.config['ASYNC_GRADING'] = False
+    app.config['GRADING_WORKERS'] = 2
+    # Marking policy for new submissions and regrades: "standard" or "negative"
+    app.config['MARKING_POLICY'] = 'standard'
+    # Reload a quiz's score distribution after this many seconds (picks up other processes' writes)
+    app.config['PERCENTILE_REFRESH_SECONDS'] = 300
+    # Reload leaderboards after this many seconds (picks up other processes' writes)
+    app.config['LEADERBOARD_REFRESH_SECONDS'] = 300
+    # Reload cached per-quiz attempt metrics after this many seconds (picks up other processes' writes)
+    app.config['QUIZ_STATS_REFRESH_SECONDS'] = 300
+    # NumPy analytics snapshot (optional dependency): refresh interval and .npz location
+    # (defaults to instance/analytics_snapshot.npz)
+    app.config['ANALYTICS_REFRESH_SECONDS'] = 60
+    app.config['ANALYTICS_SNAPSHOT_PATH'] = None
+    # Analytics pages re-request their chart JSON this often (a 304 when the data version is unchanged)
+    app.config['CHART_REFRESH_SECONDS'] = 60
+    # Pre-rendered quiz content: cached quiz versions, and how long before Quiz.start_time
+    # (checked every QUIZ_CONTENT_WARM_INTERVAL seconds) a quiz is warmed
+    app.config['QUIZ_CONTENT_CACHE_SIZE'] = 64
+    app.config['QUIZ_CONTENT_WARMER'] = True
+    app.config['QUIZ_CONTENT_WARM_AHEAD_SECONDS'] = 300
+    app.config['QUIZ_CONTENT_WARM_INTERVAL'] = 30
+    # Rendered template fragments ({% cache %} blocks) kept in memory
+    app.config['FRAGMENT_CACHE_SIZE'] = 256
+    # Question media store (defaults to instance/media). Set MEDIA_ACCEL_REDIRECT to an nginx
+    # internal location (e.g. '/_media/') or MEDIA_X_SENDFILE to let the web server send the files
+    app.config['MEDIA_STORE_PATH'] = None
+    app.config['MEDIA_ACCEL_REDIRECT'] = None
+    app.config['MEDIA_X_SENDFILE'] = False
+    # Resumable uploads (/api/uploads): chunk size handed to clients and the largest file accepted
+    app.config['MEDIA_CHUNK_SIZE'] = 8 * 1024 * 1024
+    app.config['MEDIA_MAX_UPLOAD_SIZE'] = 2 * 1024 * 1024 * 1024
+    if config:
+        app.config.update(config)
 
-# Configure template loader to handle subfolders
-template_dirs = [
-    os.path.join(app.root_path, 'templates'),
-    os.path.join(app.root_path, 'templates/authentication'),
-    os.path.join(app.root_path, 'templates/admin'),
-    os.path.join(app.root_path, 'templates/user')
-]
+    # Configure template loader to handle subfolders
+    template_dirs = [
+        os.path.join(app.root_path, 'templates'),
+        os.path.join(app.root_path, 'templates/authentication'),
+        os.path.join(app.root_path, 'templates/admin'),
+        os.path.join(app.root_path, 'templates/user')
+    ]
 
-app.jinja_loader = ChoiceLoader([
-    FileSystemLoader(template_dirs)
-])
+    app.jinja_loader = ChoiceLoader([
+        FileSystemLoader(template_dirs)
+    ])
+    app.jinja_env.add_extension(FragmentCacheExtension)
 
-# Initialize database
-db.init_app(app)
+    # Initialize database
+    db_profile.configure(app)
+    snapshot_db.configure(app)
+    db.init_app(app)
+    db_profile.init_app(app, db)
+    # Background copy of the database for the admin reports, and data_as_of() for their templates
+    snapshot_db.init_app(app)
+    # Tables added since the database was created (pending submissions, rollups, item analyses,
+    # media) and the Quiz.total_marks/question_count columns are created now, so the app also works
+    # under flask run or a WSGI server; both steps leave existing tables and data alone
+    with app.app_context():
+        db.create_all()
+        ensure_quiz_total_columns()
+    grading_pool.init_app(app)
+    quiz_content_warmer.init_app(app)
+    maintenance_scheduler.init_app(app)
+
+    # Register blueprints
+    app.register_blueprint(app_routes)
+    # Fingerprinted, pre-compressed static assets (flask build-assets) and asset_url()
+    assets.init_app(app)
+    # Content-addressed question media (/media/<sha256><ext>) and media_url()
+    media_store.init_app(app)
+
+    # CLI maintenance commands
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(repair_quiz_totals_command)
+    app.cli.add_command(item_analysis_command)
+    app.cli.add_command(db_maintenance_command)
 
-# Register blueprints
-app.register_blueprint(app_routes)
+    return app
+
+app = create_app()
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
     app.run(debug=True)
@@ -0,0 +1,226 @@
+import gzip
+import hashlib
+import html
+import json
+import mimetypes
+import os
+import re
+import shutil
+from urllib.parse import quote
+import click
+from flask import current_app, request, send_from_directory, url_for, abort
+from flask.cli import with_appcontext
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; only .gz variants are built without it
+    brotli = None
+
+# Fingerprinted copies, their compressed variants and manifest.json live here (under static/)
+BUILD_DIR = "build"
+
+# Never fingerprinted: user uploads and the build output itself
+SKIP_DIRS = {"uploads", BUILD_DIR}
+
+# Text assets worth storing pre-compressed; images are already compressed
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".html", ".map"}
+
+# Fingerprinted names never change content, so clients may cache them for a year
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+ICON_SUBSET = "vendor/icons.css"
+
+# Font Awesome 5/6 names used by the templates -> their Font Awesome 4.7 glyph
+ICON_ALIASES = {
+    "trash-alt": "trash-o",
+    "sync-alt": "refresh",
+    "chart-line": "line-chart",
+    "clock": "clock-o",
+}
+
+# fa-* classes that are modifiers rather than icons
+ICON_MODIFIERS = {"fw", "spin", "pulse", "lg", "xs", "sm", "2x", "3x", "4x", "5x", "border", "inverse"}
+
+
+def _fingerprint(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:10]
+
+
+def _compress_variants(path):
+    """Write path.gz (and path.br when Brotli is installed) next to a built asset"""
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data, quality=11))
+
+
+def build_assets(static_folder):
+    """
+    Copy every asset under `static_folder` to build/ with a content hash in its
+    name, pre-compress the text ones and write build/manifest.json
+    (logical path -> fingerprinted path). Returns the manifest.
+    """
+    build_root = os.path.join(static_folder, BUILD_DIR)
+    shutil.rmtree(build_root, ignore_errors=True)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        if root == static_folder:
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_folder).replace(os.sep, "/")
+            stem, ext = os.path.splitext(logical)
+            built = f"{stem}.{_fingerprint(source)}{ext}"
+            target = os.path.join(build_root, built)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+            if ext.lower() in COMPRESSIBLE:
+                _compress_variants(target)
+            manifest[logical] = built
+    with open(os.path.join(build_root, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def used_icons(template_folder):
+    """Icon names (without the fa- prefix) referenced anywhere in the templates"""
+    icons = set()
+    for root, _, files in os.walk(template_folder):
+        for name in files:
+            if name.endswith(".html"):
+                with open(os.path.join(root, name), encoding="utf-8") as f:
+                    icons.update(re.findall(r"\bfa-([a-z0-9-]+)", f.read()))
+    return sorted(icons - ICON_MODIFIERS)
+
+
+def build_icon_subset(font_svg, font_css, icons):
+    """
+    CSS for only `icons`, drawn from a Font Awesome 4.7 SVG font as CSS masks,
+    so <i class="fas fa-plus"> keeps working without the webfont or the CDN.
+    `font_css` is the matching font-awesome.css, used for name -> codepoint.
+    """
+    with open(font_css, encoding="utf-8") as f:
+        codepoints = {}
+        for selectors, codepoint in re.findall(r"((?:\.fa-[a-z0-9-]+:before,?)+)\{content:\"\\(f[0-9a-f]+)\"\}", f.read()):
+            for icon in re.findall(r"\.fa-([a-z0-9-]+):before", selectors):
+                codepoints[icon] = chr(int(codepoint, 16))
+    with open(font_svg, encoding="utf-8") as f:
+        glyphs = {}
+        for attributes in re.findall(r"<glyph\b([^>]*)/>", f.read()):
+            fields = dict(re.findall(r'([\w-]+)="([^"]*)"', attributes))
+            if "unicode" in fields and "d" in fields:
+                glyphs[html.unescape(fields["unicode"])] = (fields.get("horiz-adv-x", "1536"), fields["d"])
+
+    rules = []
+    missing = []
+    for icon in icons:
+        glyph = glyphs.get(codepoints.get(ICON_ALIASES.get(icon, icon)))
+        if glyph is None:
+            missing.append(icon)
+            continue
+        advance, path = glyph
+        svg = (f"<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 {advance} 1792'>"
+               f"<path transform='matrix(1 0 0 -1 0 1536)' d='{path}'/></svg>")
+        mask = f"url(\"data:image/svg+xml,{quote(svg, safe=' /=:,.-')}\")"
+        rules.append(f".fa-{icon}{{width:{int(advance) / 1792:.4g}em;"
+                     f"-webkit-mask-image:{mask};mask-image:{mask}}}")
+
+    header = ("/* Generated by `flask build-assets --icons-font ...` from Font Awesome 4.7.0 by @davegandy\n"
+              " * (http://fontawesome.io, font: SIL OFL 1.1). Only the icons used by the templates. */\n")
+    base = (".fa,.fas,.far,.fab{display:inline-block;width:1em;height:1em;vertical-align:-0.125em;"
+            "background-color:currentColor;-webkit-mask-repeat:no-repeat;mask-repeat:no-repeat;"
+            "-webkit-mask-position:center;mask-position:center;-webkit-mask-size:contain;mask-size:contain}\n")
+    return header + base + "\n".join(rules) + "\n", missing
+
+
+class AssetManifest:
+    """build/manifest.json, re-read when the build step replaces it"""
+
+    def __init__(self):
+        self._entries = {}
+        self._mtime = None
+
+    def _path(self):
+        return os.path.join(current_app.static_folder, BUILD_DIR, "manifest.json")
+
+    def entries(self):
+        path = self._path()
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            self._entries, self._mtime = {}, None
+            return self._entries
+        if mtime != self._mtime:
+            with open(path) as f:
+                self._entries = json.load(f)
+            self._mtime = mtime
+        return self._entries
+
+
+manifest = AssetManifest()
+
+
+def asset_url(filename):
+    """URL of a static asset: its fingerprinted build when one exists, else the plain static file"""
+    built = manifest.entries().get(filename)
+    if built is None:
+        return url_for("static", filename=filename)
+    return url_for("assets", filename=built)
+
+
+def serve_asset(filename):
+    """Serve a fingerprinted asset, picking its pre-compressed variant when the client accepts it"""
+    folder = os.path.join(current_app.static_folder, BUILD_DIR)
+    path = safe_join(folder, filename)
+    if path is None or filename == "manifest.json":
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    variant, encoding = filename, None
+    for suffix, name in ((".br", "br"), (".gz", "gzip")):
+        if name in request.accept_encodings and os.path.isfile(path + suffix):
+            variant, encoding = filename + suffix, name
+            break
+    response = send_from_directory(folder, variant, mimetype=mimetype)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE
+    return response
+
+
+def init_app(app):
+    app.add_url_rule("/assets/<path:filename>", "assets", serve_asset)
+    app.jinja_env.globals["asset_url"] = asset_url
+    app.cli.add_command(build_assets_command)
+
+
+@click.command("build-assets")
+@click.option("--icons-font", type=click.Path(exists=True, dir_okay=False),
+              help="Font Awesome 4.7 fontawesome-webfont.svg to regenerate the vendored icon subset from.")
+@click.option("--icons-css", type=click.Path(exists=True, dir_okay=False),
+              help="The matching font-awesome.css (icon name -> codepoint).")
+@with_appcontext
+def build_assets_command(icons_font, icons_css):
+    """Fingerprint and pre-compress static assets (optionally regenerating the icon subset first)."""
+    if icons_font or icons_css:
+        if not (icons_font and icons_css):
+            raise click.UsageError("--icons-font and --icons-css are used together.")
+        icons = used_icons(os.path.join(current_app.root_path, "templates"))
+        css, missing = build_icon_subset(icons_font, icons_css, icons)
+        target = os.path.join(current_app.static_folder, ICON_SUBSET)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "w") as f:
+            f.write(css)
+        click.echo(f"Wrote {len(icons) - len(missing)} icons to {ICON_SUBSET}.")
+        if missing:
+            click.echo(f"No glyph for: {', '.join(missing)}", err=True)
+    built = build_assets(current_app.static_folder)
+    click.echo(f"Built {len(built)} assets{'' if brotli else ' (gzip only, Brotli not installed)'}.")
@@ -0,0 +1,146 @@
+"""
+Benchmark mixed read/write throughput per database profile.
+
+Writer threads post submit_quiz while reader threads load the admin summary
+page and its chart JSON, for a fixed time against a throwaway SQLite database.
+Runs once with the stock SQLite settings on a single engine and once with the
+production profile (WAL, tuned PRAGMAs, read-only analytics engine).
+
+    python benchmarks/bench_mixed.py [--seconds 10] [--writers 4] [--readers 4] [--attempts 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db, User, Score
+from bench_submit import seed_quiz, build_form
+
+PROFILES = {
+    "default": {"DATABASE_PROFILE": "default", "ANALYTICS_READ_ENGINE": False},
+    "production": {"DATABASE_PROFILE": "production", "ANALYTICS_READ_ENGINE": True},
+}
+
+READ_URLS = ["/admin/summary", "/api/charts/admin_summary", "/api/charts/admin_dashboard"]
+
+
+def seed_history(quiz_id, num_attempts):
+    """Past attempts so the analytics reads have rows to aggregate"""
+    users = [User(username=f"history_{i}@gmail.com", password="x", role="user") for i in range(50)]
+    db.session.add_all(users)
+    db.session.flush()
+    now = datetime.now()
+    db.session.add_all([Score(
+        quiz_id=quiz_id,
+        user_id=users[i % len(users)].id,
+        total_scored=random.randint(0, 50),
+        time_spent=random.randint(60, 1200),
+        time_stamp_of_attempt=now - timedelta(minutes=i),
+        attempt_number=i // len(users) + 1,
+        completion_status="Completed"
+    ) for i in range(num_attempts)])
+    db.session.commit()
+
+
+class Worker(threading.Thread):
+    def __init__(self, app, deadline, action):
+        super().__init__(daemon=True)
+        self.client = app.test_client()
+        self.deadline = deadline
+        self.action = action
+        self.done = 0
+        self.errors = 0
+        self.latencies = []
+
+    def run(self):
+        while time.perf_counter() < self.deadline:
+            start = time.perf_counter()
+            try:
+                ok = self.action(self)
+            except Exception:
+                ok = False
+            self.latencies.append(time.perf_counter() - start)
+            if ok:
+                self.done += 1
+            else:
+                self.errors += 1
+
+
+def run(profile, args):
+    workdir = tempfile.mkdtemp(prefix="quizmaster-bench-")
+    app = create_app(dict(
+        PROFILES[profile],
+        SQLALCHEMY_DATABASE_URI="sqlite:///" + os.path.join(workdir, "bench.db"),
+        QUIZ_CONTENT_WARMER=False,
+        TESTING=True
+    ))
+    with app.app_context():
+        db.create_all()
+        quiz_id, questions, user_ids = seed_quiz(50, args.writers * 5000)
+        seed_history(quiz_id, args.attempts)
+        form = build_form(questions)
+    pending = iter(user_ids)
+    pending_lock = threading.Lock()
+
+    def write(worker):
+        with pending_lock:
+            user_id = next(pending)
+        with worker.client.session_transaction() as sess:
+            sess["user_id"] = user_id
+            sess["role"] = "user"
+        return worker.client.post(f"/user/submit_quiz/{quiz_id}", data=form).status_code == 302
+
+    def read(worker):
+        with worker.client.session_transaction() as sess:
+            sess["user_id"] = 1
+            sess["role"] = "admin"
+        response = worker.client.get(random.choice(READ_URLS))
+        response.get_data()
+        # The summary page flashes and redirects when a query fails
+        return response.status_code == 200
+
+    deadline = time.perf_counter() + args.seconds
+    writers = [Worker(app, deadline, write) for _ in range(args.writers)]
+    readers = [Worker(app, deadline, read) for _ in range(args.readers)]
+    for worker in writers + readers:
+        worker.start()
+    for worker in writers + readers:
+        worker.join()
+    return writers, readers
+
+
+def summarize(workers, seconds):
+    latencies = sorted(latency for worker in workers for latency in worker.latencies)
+    done = sum(worker.done for worker in workers)
+    errors = sum(worker.errors for worker in workers)
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0
+    return done / seconds, errors, p95
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--attempts", type=int, default=2000, help="Seeded past attempts for the reads to aggregate.")
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    args = parser.parse_args()
+
+    print(f"{'profile':>10} {'writes/s':>9} {'errors':>7} {'p95 ms':>8} {'reads/s':>9} {'errors':>7} {'p95 ms':>8}")
+    for profile in args.profiles:
+        writers, readers = run(profile, args)
+        write_rate, write_errors, write_p95 = summarize(writers, args.seconds)
+        read_rate, read_errors, read_p95 = summarize(readers, args.seconds)
+        print(f"{profile:>10} {write_rate:>9.1f} {write_errors:>7} {write_p95:>8.1f} "
+              f"{read_rate:>9.1f} {read_errors:>7} {read_p95:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark submit_quiz throughput.
+
+Seeds a throwaway SQLite database with one quiz per size and posts complete
+submissions through the Flask test client, one fresh student per submission.
+
+    python benchmarks/bench_submit.py [--submissions 200] [--sizes 50 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db, User, Subject, Chapter, Quiz, Question
+
+QUESTION_TYPES = ["single", "multiple", "true_false", "integer"]
+
+
+def seed_quiz(num_questions, num_users):
+    subject = Subject(name=f"Bench {num_questions}")
+    db.session.add(subject)
+    db.session.flush()
+    chapter = Chapter(name="Bench", subject_id=subject.id)
+    db.session.add(chapter)
+    db.session.flush()
+    quiz = Quiz(name=f"Bench quiz ({num_questions} questions)", chapter_id=chapter.id)
+    db.session.add(quiz)
+    db.session.flush()
+
+    questions = []
+    for i in range(num_questions):
+        question_type = QUESTION_TYPES[i % len(QUESTION_TYPES)]
+        correct_option = {
+            "single": "option2",
+            "multiple": "option1,option3",
+            "true_false": "true",
+            "integer": "42"
+        }[question_type]
+        questions.append(Question(
+            quiz_id=quiz.id,
+            question_statement=f"Question {i}",
+            option1="A", option2="B", option3="C", option4="D",
+            correct_option=correct_option,
+            question_type=question_type,
+            marks=1
+        ))
+    db.session.add_all(questions)
+
+    users = [User(username=f"bench{num_questions}_{i}@gmail.com", password="x", role="user")
+             for i in range(num_users)]
+    db.session.add_all(users)
+    db.session.commit()
+    return quiz.id, questions, [u.id for u in users]
+
+
+def build_form(questions):
+    form = {"total_time": "600"}
+    for q in questions:
+        form[f"times[{q.id}]"] = "5"
+        if q.question_type == "multiple":
+            form[f"answers[{q.id}][]"] = ["option1", "option3"]
+        elif q.question_type == "single":
+            form[f"answers[{q.id}]"] = "B"
+        elif q.question_type == "true_false":
+            form[f"answers[{q.id}]"] = "True"
+        else:
+            form[f"answers[{q.id}]"] = "42"
+    return form
+
+
+def run(num_questions, num_submissions, app):
+    with app.app_context():
+        quiz_id, questions, user_ids = seed_quiz(num_questions, num_submissions)
+        form = build_form(questions)
+
+    client = app.test_client()
+    start = time.perf_counter()
+    for user_id in user_ids:
+        with client.session_transaction() as sess:
+            sess["user_id"] = user_id
+            sess["role"] = "user"
+        response = client.post(f"/user/submit_quiz/{quiz_id}", data=form)
+        assert response.status_code == 302, response.status_code
+    elapsed = time.perf_counter() - start
+    return num_submissions / elapsed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--submissions", type=int, default=200)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200])
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="quizmaster-bench-")
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(workdir, "bench.db"),
+        "TESTING": True
+    })
+    with app.app_context():
+        db.create_all()
+
+    print(f"{'questions':>10} {'submissions':>12} {'seconds':>9} {'subs/sec':>9}")
+    for size in args.sizes:
+        rate, elapsed = run(size, args.submissions, app)
+        print(f"{size:>10} {args.submissions:>12} {elapsed:>9.2f} {rate:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
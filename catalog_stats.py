@@ -0,0 +1,75 @@
+from sqlalchemy import func, case
+from models import db, Subject, Chapter, Quiz, Question
+
+DIFFICULTY_WEIGHTS = {"Easy": 1, "Medium": 2, "Hard": 3}
+
+
+def difficulty_label(score):
+    """Map an average difficulty weight back to Easy/Medium/Hard"""
+    if score is None:
+        return "Medium"
+    if score <= 1.5:
+        return "Easy"
+    elif score <= 2.5:
+        return "Medium"
+    return "Hard"
+
+
+class ChapterCounts:
+    """Quiz/question counters and average difficulty of one chapter"""
+
+    def __init__(self, chapter_id, subject_id=None, quiz_count=0, question_count=0, difficulty_score=None):
+        self.chapter_id = chapter_id
+        self.subject_id = subject_id
+        self.quiz_count = quiz_count
+        self.question_count = question_count
+        self.difficulty_score = difficulty_score
+
+    @property
+    def avg_difficulty(self):
+        return difficulty_label(self.difficulty_score)
+
+
+class SubjectCounts:
+    """Quiz/question counters of one subject, summed from its chapters"""
+
+    def __init__(self, subject_id):
+        self.subject_id = subject_id
+        self.quiz_count = 0
+        self.question_count = 0
+
+
+def load_catalog_counts(subject_ids=None):
+    """
+    Counters for subjects and their chapters from a single GROUP BY over
+    chapters -> quizzes -> questions. Restricted to `subject_ids` when given.
+    Returns (subject_id -> SubjectCounts, chapter_id -> ChapterCounts).
+    """
+    weight = case(
+        *[(Question.difficulty == name, value) for name, value in DIFFICULTY_WEIGHTS.items()],
+        else_=DIFFICULTY_WEIGHTS["Medium"]
+    )
+    query = db.session.query(
+        Subject.id,
+        Chapter.id,
+        func.count(func.distinct(Quiz.id)),
+        func.count(Question.id),
+        # NULL for the outer-joined "no question" row so AVG skips it
+        func.avg(case((Question.id.is_(None), None), else_=weight))
+    ).outerjoin(Chapter, Chapter.subject_id == Subject.id
+    ).outerjoin(Quiz, Quiz.chapter_id == Chapter.id
+    ).outerjoin(Question, Question.quiz_id == Quiz.id
+    ).group_by(Subject.id, Chapter.id)
+    if subject_ids is not None:
+        query = query.filter(Subject.id.in_(list(subject_ids)))
+
+    subjects = {}
+    chapters = {}
+    for subject_id, chapter_id, quiz_count, question_count, difficulty_score in query.all():
+        subject = subjects.setdefault(subject_id, SubjectCounts(subject_id))
+        if chapter_id is None:
+            continue
+        chapters[chapter_id] = ChapterCounts(chapter_id, subject_id, quiz_count, question_count, difficulty_score)
+        subject.quiz_count += quiz_count
+        subject.question_count += question_count
+    return subjects, chapters
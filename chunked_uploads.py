@@ -0,0 +1,191 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from models import db, MediaUpload, MediaBlob
+from media_store import MEDIA_EXTENSIONS, CHUNK_SIZE as COPY_SIZE, store_root, temp_dir, add_file, parse_media_path
+
+# Chunk size handed to clients when the app config does not set MEDIA_CHUNK_SIZE
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Largest file accepted when the app config does not set MEDIA_MAX_UPLOAD_SIZE
+DEFAULT_MAX_UPLOAD_SIZE = 2 * 1024 * 1024 * 1024
+
+# Bytes read from the request body at a time, so a chunk is never held in memory whole
+READ_SIZE = 64 * 1024
+
+
+class UploadError(ValueError):
+    """Rejected upload request; the message is safe to show to the client"""
+
+
+class UploadBusy(UploadError):
+    """Another request is completing the upload; retrying shortly returns its result"""
+
+
+def _chunk_dir(upload_id):
+    return os.path.join(store_root(), "uploads", upload_id)
+
+
+def _chunk_path(upload_id, index):
+    return os.path.join(_chunk_dir(upload_id), f"{index:06d}.part")
+
+
+def start_upload(user_id, filename, total_size, kind):
+    """Register a new upload and return it; the client then PUTs chunk_count chunks"""
+    extension = os.path.splitext(filename or "")[1].lower()
+    if kind not in MEDIA_EXTENSIONS or extension not in MEDIA_EXTENSIONS[kind]:
+        raise UploadError(f"Unsupported {kind} file type: {extension or filename}")
+    max_size = current_app.config.get("MEDIA_MAX_UPLOAD_SIZE", DEFAULT_MAX_UPLOAD_SIZE)
+    if not isinstance(total_size, int) or total_size <= 0 or total_size > max_size:
+        raise UploadError(f"File size must be between 1 byte and {max_size} bytes")
+    upload = MediaUpload(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        kind=kind,
+        filename=os.path.basename(filename),
+        total_size=total_size,
+        chunk_size=current_app.config.get("MEDIA_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)
+    )
+    db.session.add(upload)
+    db.session.commit()
+    os.makedirs(_chunk_dir(upload.id), exist_ok=True)
+    return upload
+
+
+def received_chunks(upload):
+    """Indexes of chunks already stored, which is what a resuming client skips"""
+    try:
+        names = os.listdir(_chunk_dir(upload.id))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[:-5]) for name in names if name.endswith(".part"))
+
+
+def write_chunk(upload, index, stream, length, checksum):
+    """
+    Stream one chunk from `stream` to disk, verifying its length and SHA-256
+    (hex `checksum`). The chunk only becomes visible once complete and verified,
+    so a dropped connection leaves nothing to clean up but a temp file.
+    """
+    if upload.media_path:
+        raise UploadError("Upload already completed")
+    if not 0 <= index < upload.chunk_count:
+        raise UploadError(f"Chunk index must be between 0 and {upload.chunk_count - 1}")
+    expected = upload.expected_size(index)
+    if length is not None and length != expected:
+        raise UploadError(f"Chunk {index} must be {expected} bytes")
+    if not checksum:
+        raise UploadError("Missing chunk checksum")
+
+    digest = hashlib.sha256()
+    size = 0
+    target = _chunk_path(upload.id, index)
+    partial = f"{target}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        with open(partial, "wb") as out:
+            while size <= expected:
+                data = stream.read(READ_SIZE)
+                if not data:
+                    break
+                digest.update(data)
+                out.write(data)
+                size += len(data)
+        if size != expected:
+            raise UploadError(f"Chunk {index} must be {expected} bytes, got {size}")
+        if digest.hexdigest() != checksum.lower():
+            raise UploadError(f"Checksum mismatch for chunk {index}")
+        os.replace(partial, target)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+    upload.updated_at = datetime.utcnow()
+    db.session.commit()
+    return received_chunks(upload)
+
+
+def _completed_blob(upload):
+    return db.session.get(MediaBlob, parse_media_path(upload.media_path)[0])
+
+
+def complete_upload(upload, checksum=None):
+    """
+    Concatenate the chunks into the media store, copying COPY_SIZE bytes at a
+    time while hashing. Returns the MediaBlob. `checksum` optionally verifies
+    the SHA-256 of the whole file. A lock file in the chunk directory lets only
+    one request assemble; concurrent ones get UploadBusy.
+    """
+    if upload.media_path:
+        return _completed_blob(upload)
+    lock = os.path.join(_chunk_dir(upload.id), "complete.lock")
+    try:
+        os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        raise UploadBusy("Upload is already being completed")
+    except FileNotFoundError:
+        # The chunk directory is gone: completed by another request since this one loaded the row
+        db.session.commit()
+        if upload.media_path:
+            return _completed_blob(upload)
+        raise UploadError("Upload has expired")
+
+    try:
+        missing = sorted(set(range(upload.chunk_count)) - set(received_chunks(upload)))
+        if missing:
+            raise UploadError(f"Missing chunks: {missing[:20]}")
+
+        digest = hashlib.sha256()
+        fd, assembled = tempfile.mkstemp(dir=temp_dir())
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for index in range(upload.chunk_count):
+                    try:
+                        chunk = open(_chunk_path(upload.id, index), "rb")
+                    except FileNotFoundError:
+                        raise UploadError(f"Missing chunks: [{index}]")
+                    with chunk:
+                        for data in iter(lambda: chunk.read(COPY_SIZE), b""):
+                            digest.update(data)
+                            out.write(data)
+            if checksum and digest.hexdigest() != checksum.lower():
+                raise UploadError("Checksum mismatch for the assembled file")
+        except Exception:
+            os.remove(assembled)
+            raise
+
+        extension = os.path.splitext(upload.filename)[1].lower()
+        blob = add_file(assembled, digest.hexdigest(), upload.total_size, extension)
+        upload.media_path = blob.media_path
+        upload.updated_at = datetime.utcnow()
+        db.session.commit()
+    except Exception:
+        # Let the client retry the completion
+        os.remove(lock)
+        raise
+    shutil.rmtree(_chunk_dir(upload.id), ignore_errors=True)
+    return blob
+
+
+def completed_media_path(upload_id, user_id, kind):
+    """media_path of a finished upload by this user, for attaching it to a question; else None"""
+    upload = db.session.get(MediaUpload, upload_id) if upload_id else None
+    if upload is None or upload.user_id != user_id or upload.kind != kind or not upload.media_path:
+        return None
+    return upload.media_path
+
+
+def expire_uploads(grace_seconds):
+    """Delete unfinished uploads idle longer than the grace period, and their chunks"""
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    # Finished uploads keep their row: completed_media_path still resolves them for a question
+    stale = MediaUpload.query.filter(MediaUpload.media_path.is_(None), MediaUpload.updated_at < cutoff).all()
+    for upload in stale:
+        shutil.rmtree(_chunk_dir(upload.id), ignore_errors=True)
+        db.session.delete(upload)
+    db.session.commit()
+    return len(stale)
@@ -0,0 +1,313 @@
+import os
+import threading
+import time
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select
+from models import db, Score, QuestionAttempt
+from reports import attempts_query, apply_attempt_filters
+
+# Check whether any task is due this often when the app config does not set
+# DB_MAINTENANCE_INTERVAL
+DEFAULT_INTERVAL = 300
+
+# Re-analyze a table once its row count moved this much from the sqlite_stat1
+# figure (DB_ANALYZE_CHANGE_RATIO), ignoring tables that changed by fewer rows
+# than DB_ANALYZE_MIN_ROWS
+DEFAULT_CHANGE_RATIO = 0.2
+DEFAULT_MIN_ROWS = 500
+
+# Rows sampled per index by ANALYZE, so it stays fast on large tables (0 = all rows)
+DEFAULT_ANALYSIS_LIMIT = 1000
+
+# Local hours [start, end) in which free pages are returned to the filesystem
+DEFAULT_QUIET_HOURS = (2, 5)
+
+# incremental_vacuum batch size in pages, the pause between batches, and the
+# free-page count below which vacuuming is not worth it
+DEFAULT_VACUUM_PAGES = 256
+DEFAULT_VACUUM_PAUSE = 0.5
+DEFAULT_VACUUM_MIN_FREE_PAGES = 1024
+
+# Checkpoint the WAL once it is larger than this
+DEFAULT_WAL_LIMIT = 64 * 1024 * 1024
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+# table -> max(rowid) when this process last analyzed it; the baseline for later row-count estimates
+_analyzed_rowids = {}
+
+
+def _plan_queries():
+    """Queries whose plans are logged around ANALYZE: the hot paths the indexes exist for"""
+    return {
+        "quiz scores by date": select(Score.id).where(Score.quiz_id == 1).order_by(Score.time_stamp_of_attempt.desc()),
+        "user attempts of a quiz": select(Score.id).where(Score.user_id == 1, Score.quiz_id == 1),
+        "summary filtered by subject": apply_attempt_filters(attempts_query(Score.id), subject_filter=1,
+                                                             date_filter="week").statement,
+        "attempts of a question": select(QuestionAttempt.is_correct).where(QuestionAttempt.question_id == 1),
+    }
+
+
+def _connect():
+    # Outside any transaction: VACUUM, checkpoints and ANALYZE each manage their own
+    return db.engines[None].connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+def _pragma(connection, name):
+    return connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+
+def file_sizes():
+    """Bytes of the database file and its WAL"""
+    path = db.engines[None].url.database
+    sizes = {}
+    for label, name in (("db", path), ("wal", path + "-wal")):
+        try:
+            sizes[label] = os.path.getsize(name)
+        except OSError:
+            sizes[label] = 0
+    return sizes
+
+
+def _format_sizes(sizes):
+    return ", ".join(f"{label} {size / 1024 / 1024:.1f} MiB" for label, size in sizes.items())
+
+
+def query_plans(connection):
+    """name -> EXPLAIN QUERY PLAN text of each _plan_queries() statement"""
+    plans = {}
+    for name, stmt in _plan_queries().items():
+        sql = str(stmt.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+        rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + sql).all()
+        plans[name] = "; ".join(row[-1] for row in rows)
+    return plans
+
+
+def _max_rowid(connection, table):
+    # Found by seeking to the end of the table b-tree, unlike count(*) which reads every page
+    return connection.exec_driver_sql(f'SELECT max(rowid) FROM "{table}"').scalar() or 0
+
+
+def stale_tables(connection, change_ratio, min_rows):
+    """
+    Tables never analyzed, or whose estimated row count drifted past the
+    thresholds since the last ANALYZE. max(rowid) stands in for the row count:
+    it is compared with the figure it had at this process's last ANALYZE, or
+    with the sqlite_stat1 row count on the first pass.
+    """
+    tables = [name for name, in connection.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+    analyzed = {}
+    if connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").first():
+        for table, stat in connection.exec_driver_sql("SELECT tbl, stat FROM sqlite_stat1"):
+            analyzed[table] = max(analyzed.get(table, 0), int(stat.split()[0]))
+    stale = []
+    for table in tables:
+        rows = _max_rowid(connection, table)
+        if table not in analyzed:
+            if rows:
+                stale.append(table)
+            continue
+        baseline = _analyzed_rowids.get(table, analyzed[table])
+        changed = abs(rows - baseline)
+        if changed >= min_rows and changed >= change_ratio * max(analyzed[table], 1):
+            stale.append(table)
+    return stale
+
+
+def analyze(force=False):
+    """
+    ANALYZE the tables whose statistics are stale (all of them with `force`),
+    then PRAGMA optimize. Logs the query plans that changed as a result.
+    Returns the analyzed tables.
+    """
+    config = current_app.config
+    with _connect() as connection:
+        tables = None if force else stale_tables(
+            connection, config.get("DB_ANALYZE_CHANGE_RATIO", DEFAULT_CHANGE_RATIO),
+            config.get("DB_ANALYZE_MIN_ROWS", DEFAULT_MIN_ROWS))
+        if tables == []:
+            return []
+        before = query_plans(connection)
+        start = time.perf_counter()
+        connection.exec_driver_sql(f"PRAGMA analysis_limit = {int(config.get('DB_ANALYSIS_LIMIT', DEFAULT_ANALYSIS_LIMIT))}")
+        if tables is None:
+            connection.exec_driver_sql("ANALYZE")
+        else:
+            for table in tables:
+                connection.exec_driver_sql(f'ANALYZE "{table}"')
+        connection.exec_driver_sql("PRAGMA optimize")
+        for table in tables or [name for name, in connection.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]:
+            _analyzed_rowids[table] = _max_rowid(connection, table)
+        after = query_plans(connection)
+
+    analyzed = tables or ["all tables"]
+    current_app.logger.info(f"ANALYZE {', '.join(analyzed)} took {time.perf_counter() - start:.2f}s")
+    for name in before:
+        if before[name] != after[name]:
+            current_app.logger.info(f"Query plan for {name} changed: {before[name]} -> {after[name]}")
+    return analyzed
+
+
+def in_quiet_hours(now=None):
+    start, end = current_app.config.get("DB_MAINTENANCE_QUIET_HOURS", DEFAULT_QUIET_HOURS)
+    hour = (now or datetime.now()).hour
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+
+def incremental_vacuum(force=False, should_stop=None):
+    """
+    Return free pages to the filesystem in small batches, each its own short
+    write transaction, until none are left or quiet hours end. Needs
+    auto_vacuum = INCREMENTAL (see `flask db-maintenance --convert-incremental`).
+    Returns the number of pages released.
+    """
+    config = current_app.config
+    batch = config.get("DB_VACUUM_PAGES", DEFAULT_VACUUM_PAGES)
+    pause = config.get("DB_VACUUM_PAUSE", DEFAULT_VACUUM_PAUSE)
+    with _connect() as connection:
+        if _pragma(connection, "auto_vacuum") != AUTO_VACUUM_INCREMENTAL:
+            return 0
+        free = _pragma(connection, "freelist_count")
+        if not force and free < config.get("DB_VACUUM_MIN_FREE_PAGES", DEFAULT_VACUUM_MIN_FREE_PAGES):
+            return 0
+        before = file_sizes()
+        released = 0
+        while free > 0 and (force or in_quiet_hours()) and not (should_stop and should_stop()):
+            connection.exec_driver_sql(f"PRAGMA incremental_vacuum({batch})")
+            remaining = _pragma(connection, "freelist_count")
+            released += free - remaining
+            if remaining >= free:
+                break
+            free = remaining
+            time.sleep(pause)
+    if released:
+        current_app.logger.info(f"incremental_vacuum released {released} pages "
+                                f"({_format_sizes(before)} -> {_format_sizes(file_sizes())})")
+    return released
+
+
+def checkpoint(force=False):
+    """
+    Checkpoint the WAL back into the database once it exceeds DB_WAL_CHECKPOINT_BYTES.
+    Outside the quiet hours this is a PASSIVE checkpoint, which never makes
+    writers wait; the journal_size_limit PRAGMA then shrinks the WAL when it
+    is next reset. In the quiet hours, or with `force`, a TRUNCATE checkpoint
+    waits for readers and empties the WAL right away. Returns whether every
+    frame was checkpointed (False while a reader still needs old frames; the
+    next pass retries), or None when nothing was done.
+    """
+    before = file_sizes()
+    if not force and before["wal"] <= current_app.config.get("DB_WAL_CHECKPOINT_BYTES", DEFAULT_WAL_LIMIT):
+        return None
+    mode = "TRUNCATE" if force or in_quiet_hours() else "PASSIVE"
+    with _connect() as connection:
+        busy, frames, checkpointed = connection.exec_driver_sql(f"PRAGMA wal_checkpoint({mode})").one()
+    done = not busy and checkpointed >= frames
+    current_app.logger.info(f"WAL checkpoint ({mode}) {'done' if done else 'blocked by readers'} "
+                            f"({_format_sizes(before)} -> {_format_sizes(file_sizes())})")
+    return done
+
+
+def convert_to_incremental():
+    """Switch an existing database to auto_vacuum = INCREMENTAL. Rewrites the whole file; run it offline."""
+    before = file_sizes()
+    with _connect() as connection:
+        connection.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        connection.exec_driver_sql("VACUUM")
+        mode = _pragma(connection, "auto_vacuum")
+    current_app.logger.info(f"VACUUM to auto_vacuum = INCREMENTAL ({_format_sizes(before)} -> {_format_sizes(file_sizes())})")
+    return mode == AUTO_VACUUM_INCREMENTAL
+
+
+def run_due_tasks(should_stop=None):
+    """One scheduler pass: each task decides for itself whether it is due"""
+    return {
+        "analyzed": analyze(),
+        "vacuumed_pages": incremental_vacuum(should_stop=should_stop),
+        "checkpoint": checkpoint(),
+    }
+
+
+class MaintenanceScheduler:
+    """Background thread running run_due_tasks every DB_MAINTENANCE_INTERVAL seconds"""
+
+    def __init__(self):
+        self.app = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions["db_maintenance"] = self
+        # Started by the first request, so CLI commands and imports stay thread-free
+        app.before_request(self.start)
+
+    def start(self):
+        if self._thread is not None or self.app is None or not self.app.config.get("DB_MAINTENANCE", True):
+            return
+        with self.app.app_context():
+            if db.engines[None].dialect.name != "sqlite" or not db.engines[None].url.database:
+                return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="db-maintenance", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        interval = self.app.config.get("DB_MAINTENANCE_INTERVAL", DEFAULT_INTERVAL)
+        while not self._stopping.is_set():
+            with self.app.app_context():
+                try:
+                    run_due_tasks(should_stop=self._stopping.is_set)
+                except Exception as e:
+                    current_app.logger.error(f"Error during database maintenance: {str(e)}")
+            self._stopping.wait(interval)
+
+
+maintenance_scheduler = MaintenanceScheduler()
+
+
+@click.command("db-maintenance")
+@click.option("--analyze", "do_analyze", is_flag=True, help="ANALYZE every table now.")
+@click.option("--vacuum", is_flag=True, help="Release all free pages now, regardless of quiet hours.")
+@click.option("--checkpoint", "do_checkpoint", is_flag=True, help="Checkpoint and truncate the WAL now.")
+@click.option("--convert-incremental", is_flag=True,
+              help="One-off: switch the database to auto_vacuum = INCREMENTAL (full VACUUM, run offline).")
+@with_appcontext
+def db_maintenance_command(do_analyze, vacuum, do_checkpoint, convert_incremental):
+    """Run database maintenance now; without options, run whatever is due."""
+    click.echo(f"Before: {_format_sizes(file_sizes())}")
+    if convert_incremental:
+        click.echo("auto_vacuum is INCREMENTAL." if convert_to_incremental() else "Could not change auto_vacuum.")
+    if not (do_analyze or vacuum or do_checkpoint or convert_incremental):
+        report = run_due_tasks()
+        click.echo(f"Analyzed: {', '.join(report['analyzed']) or 'nothing stale'}; "
+                   f"released {report['vacuumed_pages']} pages; "
+                   f"checkpoint: {'not needed' if report['checkpoint'] is None else 'done' if report['checkpoint'] else 'blocked by readers'}")
+    if do_analyze:
+        with _connect() as connection:
+            before = query_plans(connection)
+        analyze(force=True)
+        with _connect() as connection:
+            after = query_plans(connection)
+        for name in before:
+            click.echo(f"{name}: {after[name]}" + ("" if before[name] == after[name] else f" (was: {before[name]})"))
+    if vacuum:
+        click.echo(f"Released {incremental_vacuum(force=True)} pages.")
+    if do_checkpoint:
+        click.echo("WAL checkpointed." if checkpoint(force=True) else "WAL checkpoint blocked by readers.")
+    click.echo(f"After: {_format_sizes(file_sizes())}")
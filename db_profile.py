@@ -0,0 +1,142 @@
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.dml import UpdateBase
+
+# Flask-SQLAlchemy bind that analytics and report reads are routed to
+ANALYTICS_BIND = "analytics"
+
+# Session.info key naming the bind reads currently go to
+_READ_BIND = "read_bind"
+
+# PRAGMAs run on every new SQLite connection, by DATABASE_PROFILE
+PROFILES = {
+    "default": {},
+    "production": {
+        # Let db_maintenance return free pages in batches; takes effect on new databases
+        # (existing ones: flask db-maintenance --convert-incremental)
+        "auto_vacuum": "INCREMENTAL",
+        # Readers and the writer stop blocking each other; persists in the database file
+        "journal_mode": "WAL",
+        # Shrink the WAL back to 64 MiB whenever it is reset after the passive checkpoints
+        # of db_maintenance, instead of keeping its high-water size
+        "journal_size_limit": 64 * 1024 * 1024,
+        # Wait this many ms for the write lock instead of failing with "database is locked"
+        "busy_timeout": 5000,
+        # fsync at checkpoints instead of every commit; durable across app crashes under WAL
+        "synchronous": "NORMAL",
+        # Read pages through a 256 MiB memory map instead of read() calls
+        "mmap_size": 256 * 1024 * 1024,
+        # 64 MiB page cache per connection (negative values are KiB)
+        "cache_size": -64 * 1024,
+    },
+}
+
+
+class RoutingSession(Session):
+    """
+    Flask-SQLAlchemy session that sends reads to the bind named in
+    info["read_bind"] (see analytics_reads) when that bind is configured.
+    Flushes and INSERT/UPDATE/DELETE statements always use the primary engine.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        read_bind = self.info.get(_READ_BIND)
+        if bind is None and read_bind is not None and not self._flushing and not isinstance(clause, UpdateBase):
+            engine = self._db.engines.get(read_bind)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextmanager
+def reading_from(bind_key=ANALYTICS_BIND):
+    """
+    Route this app context's session reads to `bind_key` inside the block.
+    Yields the bind actually read from: None (the primary engine) when
+    `bind_key` is not enabled for this app.
+    """
+    session = current_app.extensions["sqlalchemy"].session()
+    previous = session.info.get(_READ_BIND)
+    routed = bind_key if bind_key in current_app.extensions.get("read_binds", ()) else None
+    if routed is not None:
+        session.info[_READ_BIND] = routed
+    try:
+        yield routed
+    finally:
+        session.info[_READ_BIND] = previous
+
+
+@contextmanager
+def primary_reads():
+    """Route this app context's session reads back to the primary engine inside the block, e.g. for a
+    rebuild that reads what it is about to write from a view that otherwise reads elsewhere"""
+    session = current_app.extensions["sqlalchemy"].session()
+    previous = session.info.get(_READ_BIND)
+    session.info[_READ_BIND] = None
+    try:
+        yield
+    finally:
+        session.info[_READ_BIND] = previous
+
+
+def analytics_reads(view):
+    """View decorator: the view's queries run on the read-only analytics engine"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        with reading_from(ANALYTICS_BIND):
+            return view(*args, **kwargs)
+    return wrapped
+
+
+def is_file_database(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def pragma_listener(pragmas, read_only):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        if read_only:
+            # Any write on this connection fails with "attempt to write a readonly database"
+            cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+    return on_connect
+
+
+def profile_pragmas(app):
+    return dict(PROFILES[app.config.get("DATABASE_PROFILE", "production")], **(app.config.get("SQLITE_PRAGMAS") or {}))
+
+
+def configure(app):
+    """
+    Add the analytics bind to the app config. Runs before db.init_app, which
+    creates one engine per bind. The bind is always declared, since the bind
+    keys are shared by every app using `db`, but reads are only routed to it
+    when ANALYTICS_READ_ENGINE is on and the database is a file: an in-memory
+    database cannot be shared between engines.
+    """
+    if app.config.get("DATABASE_PROFILE", "production") not in PROFILES:
+        raise ValueError(f"Unknown DATABASE_PROFILE: {app.config['DATABASE_PROFILE']}")
+    uri = app.config.get("ANALYTICS_DATABASE_URI") or app.config["SQLALCHEMY_DATABASE_URI"]
+    app.config["SQLALCHEMY_BINDS"] = dict(app.config.get("SQLALCHEMY_BINDS") or {}, **{ANALYTICS_BIND: uri})
+    routed = app.config.get("ANALYTICS_READ_ENGINE", True) and is_file_database(uri)
+    app.extensions.setdefault("read_binds", set())
+    if routed:
+        app.extensions["read_binds"].add(ANALYTICS_BIND)
+
+
+def init_app(app, db):
+    """Apply the profile's PRAGMAs to the primary and analytics engines, read-only on the analytics one"""
+    with app.app_context():
+        engines = {key: db.engines[key] for key in (None, ANALYTICS_BIND)}
+    # The bind has no tables of its own; keep create_all/drop_all off the read-only engine
+    db.metadatas.pop(ANALYTICS_BIND, None)
+    for key, engine in engines.items():
+        if engine.dialect.name == "sqlite":
+            event.listen(engine, "connect", pragma_listener(profile_pragmas(app), read_only=key == ANALYTICS_BIND))
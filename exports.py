@@ -0,0 +1,110 @@
+import csv
+import io
+import json
+from datetime import datetime
+from models import Score, QuestionAttempt, Question, User, Quiz, Subject
+from reports import attempts_query, apply_attempt_filters
+
+EXPORT_FORMATS = ("csv", "ndjson")
+
+# Rows fetched from the database cursor at a time
+YIELD_PER = 1000
+
+# Flush the output buffer to the client once it holds this many characters
+CHUNK_CHARS = 64 * 1024
+
+ATTEMPT_COLUMNS = [
+    ("score_id", Score.id),
+    ("user_id", User.id),
+    ("username", User.username),
+    ("quiz_id", Quiz.id),
+    ("quiz_name", Quiz.name),
+    ("subject_name", Subject.name),
+    ("total_scored", Score.total_scored),
+    ("total_marks", Quiz.total_marks),
+    ("time_spent", Score.time_spent),
+    ("time_stamp_of_attempt", Score.time_stamp_of_attempt),
+    ("completion_status", Score.completion_status),
+    ("total_questions", Score.total_questions),
+    ("questions_answered", Score.questions_answered),
+    ("questions_correct", Score.questions_correct),
+    ("percentile", Score.percentile),
+]
+
+QUESTION_COLUMNS = [
+    ("question_id", QuestionAttempt.question_id),
+    ("difficulty", Question.difficulty),
+    ("user_answer", QuestionAttempt.user_answer),
+    ("is_correct", QuestionAttempt.is_correct),
+    ("marks_awarded", QuestionAttempt.marks_awarded),
+    ("question_time_spent", QuestionAttempt.time_spent),
+]
+
+
+def export_columns(include_questions=False):
+    return ATTEMPT_COLUMNS + (QUESTION_COLUMNS if include_questions else [])
+
+
+def export_query(filters, include_questions=False):
+    """
+    Attempts matching the admin summary filters, in Score.id order.
+    With `include_questions` there is one row per QuestionAttempt instead.
+    """
+    columns = export_columns(include_questions)
+    query = apply_attempt_filters(attempts_query(*[column.label(name) for name, column in columns]), **filters)
+    if include_questions:
+        query = query.join(QuestionAttempt, QuestionAttempt.score_id == Score.id
+        ).outerjoin(Question, Question.id == QuestionAttempt.question_id
+        ).order_by(Score.id, QuestionAttempt.id)
+    else:
+        query = query.order_by(Score.id)
+    # Stream from the cursor instead of buffering the whole result
+    return query.execution_options(yield_per=YIELD_PER)
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return value
+
+
+def stream_csv(rows, columns):
+    """Yield CSV text in chunks of roughly CHUNK_CHARS"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    for row in rows:
+        writer.writerow([_plain(value) for value in row])
+        if buffer.tell() >= CHUNK_CHARS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_ndjson(rows, columns):
+    """Yield one JSON object per line, in chunks of roughly CHUNK_CHARS"""
+    names = [name for name, _ in columns]
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps(dict(zip(names, (_plain(value) for value in row))))
+        lines.append(line)
+        size += len(line) + 1
+        if size >= CHUNK_CHARS:
+            yield "\n".join(lines) + "\n"
+            lines = []
+            size = 0
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def export_attempts(filters, fmt="csv", include_questions=False):
+    """Generator over the export document for the given filters and format"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    columns = export_columns(include_questions)
+    rows = export_query(filters, include_questions)
+    if fmt == "csv":
+        return stream_csv(rows, columns)
+    return stream_ndjson(rows, columns)
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+from threading import Lock
+from flask import current_app
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+# Number of rendered fragments kept in memory when the app config does not
+# set FRAGMENT_CACHE_SIZE
+DEFAULT_CACHE_SIZE = 256
+
+
+class FragmentCache:
+    """
+    Thread-safe LRU of rendered template fragments.
+    Keys are tuples whose last element is a version stamp: storing a new version
+    drops the older ones of the same fragment, since they can never be hit again.
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+            return html
+
+    def put(self, key, html):
+        with self._lock:
+            for cached in [k for k in self._entries if k[:-1] == key[:-1]]:
+                del self._entries[cached]
+            self._entries[key] = html
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_many(self, keys):
+        """
+        key -> HTML of the cached keys, read in one go so callers can load data
+        only for the rest and render these as they are, even if evicted meanwhile
+        """
+        with self._lock:
+            found = {}
+            for key in keys:
+                html = self._entries.get(key)
+                if html is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = html
+            return found
+
+    def invalidate(self, prefix=()):
+        with self._lock:
+            for cached in [k for k in self._entries if k[:len(prefix)] == tuple(prefix)]:
+                del self._entries[cached]
+
+
+fragments = FragmentCache()
+
+
+class FragmentCacheExtension(Extension):
+    """
+    {% cache "name", entity.id, version %}...{% endcache %}
+
+    Renders the body once per key and reuses the HTML afterwards. The last key
+    part must change whenever anything the body shows changes.
+    """
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(self.call_method("_render", [nodes.Tuple(parts, "load")]),
+                               [], [], body).set_lineno(lineno)
+
+    def _render(self, key, caller):
+        fragments.maxsize = current_app.config.get("FRAGMENT_CACHE_SIZE", DEFAULT_CACHE_SIZE)
+        html = fragments.get(key)
+        if html is None:
+            html = Markup(caller())
+            fragments.put(key, html)
+        return html
@@ -0,0 +1,329 @@
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+from flask import current_app
+from sqlalchemy import func, insert
+from models import db, Question, Score, QuestionAttempt
+from percentiles import get_distribution
+from leaderboard import leaderboards
+
+# Number of compiled answer keys kept in memory when the app config does not
+# set ANSWER_KEY_CACHE_SIZE
+DEFAULT_CACHE_SIZE = 128
+
+OPTION_FIELDS = ["option1", "option2", "option3", "option4", "option5", "option6"]
+
+# "standard" awards marks (or partial marks) and never deducts;
+# "negative" deducts Question.negative_marks for an answered question that earned nothing
+MARKING_POLICIES = ("standard", "negative")
+
+
+def _option_index(token):
+    """Return the 1-based option index for "option4" / "4" style tokens, else None"""
+    token = token.strip().lower()
+    if token.startswith("option"):
+        token = token[6:]
+    if token.isdigit() and 1 <= int(token) <= len(OPTION_FIELDS):
+        return int(token)
+    return None
+
+
+class CompiledQuestion:
+    """Pre-parsed answer key for a single question"""
+    __slots__ = ("id", "question_type", "marks", "negative_marks", "difficulty",
+                 "correct_text", "correct_set", "integer_key", "answer_text")
+
+    def __init__(self, question):
+        self.id = question.id
+        self.question_type = question.question_type.lower() if question.question_type else ""
+        self.marks = question.marks or 0
+        self.negative_marks = question.negative_marks or 0
+        self.difficulty = question.difficulty
+        correct_option = (question.correct_option or "").strip()
+        options = [(getattr(question, field) or "").strip() for field in OPTION_FIELDS]
+
+        # Single choice: the form posts option text, the key may be an index or text
+        index = _option_index(correct_option) if self.question_type == "single" else None
+        if index:
+            self.correct_text = options[index - 1].lower()
+        else:
+            self.correct_text = correct_option.lower()
+
+        # Multiple choice: the form posts "optionN" values
+        self.correct_set = frozenset(
+            token.strip().lower() for token in correct_option.split(",") if token.strip()
+        )
+
+        try:
+            self.integer_key = int(correct_option)
+        except ValueError:
+            self.integer_key = None
+
+        self.answer_text = self._display_text(correct_option, options[:5])
+
+    def _display_text(self, correct_option, options):
+        """Human readable correct answer shown on the results page"""
+        if not correct_option:
+            return ""
+        if self.question_type == "multiple":
+            result = []
+            for token in [t.strip() for t in correct_option.split(",") if t.strip()]:
+                index = _option_index(token)
+                if index is None:
+                    result.append(token)
+                elif index <= len(options):
+                    result.append(options[index - 1])
+            return ", ".join(result)
+        index = _option_index(correct_option)
+        if index and index <= len(options):
+            return options[index - 1]
+        return correct_option
+
+    def grade(self, answer):
+        """
+        Grade a raw answer as posted by the client.
+        `answer` is a list of selected values for multiple choice questions
+        (a comma-separated string is accepted too) and a string otherwise.
+        Returns (answered, is_correct, marks_awarded, stored_answer).
+        """
+        if self.question_type == "multiple":
+            if isinstance(answer, str):
+                answer = [a for a in answer.split(",") if a.strip()]
+            if not answer:
+                return False, False, 0, ""
+            selected_set = set(opt.strip().lower() for opt in answer)
+            is_correct = self.correct_set == selected_set
+            if is_correct:
+                marks_awarded = self.marks
+            elif self.correct_set:
+                marks_awarded = self.marks * (len(self.correct_set & selected_set) / len(self.correct_set))
+            else:
+                marks_awarded = 0
+            return True, is_correct, marks_awarded, ", ".join(answer)
+
+        if answer is None or self.question_type not in ("single", "true_false", "integer"):
+            return False, False, 0, ""
+        answer = str(answer)
+
+        if self.question_type == "single":
+            stored_answer = answer.strip().lower()
+            is_correct = stored_answer == self.correct_text and self.correct_text != ""
+        elif self.question_type == "true_false":
+            stored_answer = answer
+            is_correct = answer.lower() == self.correct_text
+        else:
+            stored_answer = answer
+            try:
+                is_correct = self.integer_key is not None and int(answer) == self.integer_key
+            except ValueError:
+                is_correct = False
+        return True, is_correct, (self.marks if is_correct else 0), stored_answer
+
+
+def apply_marking_policy(policy, question, answered, is_correct, marks_awarded):
+    """Adjust the marks of one graded answer according to a marking policy"""
+    if policy not in MARKING_POLICIES:
+        raise ValueError(f"Unknown marking policy: {policy}")
+    if policy == "negative" and answered and not is_correct and marks_awarded == 0:
+        return -question.negative_marks
+    return marks_awarded
+
+
+class AnswerKey:
+    """Compiled answer key for every question of a quiz"""
+
+    def __init__(self, quiz_id, version, questions):
+        self.quiz_id = quiz_id
+        self.version = version
+        self.questions = [CompiledQuestion(q) for q in questions]
+        self.by_id = {q.id: q for q in self.questions}
+        self.total_marks = sum(q.marks for q in self.questions)
+
+    def __len__(self):
+        return len(self.questions)
+
+    def get(self, question_id):
+        return self.by_id.get(question_id)
+
+    def correct_answer_text(self, question_id):
+        compiled = self.by_id.get(question_id)
+        return compiled.answer_text if compiled else ""
+
+
+class AnswerKeyCache:
+    """Thread-safe LRU of compiled answer keys keyed by (quiz_id, version)"""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, quiz_id, version):
+        with self._lock:
+            key = self._entries.get((quiz_id, version))
+            if key is not None:
+                self._entries.move_to_end((quiz_id, version))
+            return key
+
+    def put(self, key):
+        with self._lock:
+            # An older version of the same quiz can never be hit again
+            for cached in [k for k in self._entries if k[0] == key.quiz_id]:
+                del self._entries[cached]
+            self._entries[(key.quiz_id, key.version)] = key
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, quiz_id=None):
+        with self._lock:
+            if quiz_id is None:
+                self._entries.clear()
+                return
+            for cached in [k for k in self._entries if k[0] == quiz_id]:
+                del self._entries[cached]
+
+
+_cache = AnswerKeyCache()
+
+
+def question_version(quiz_id):
+    """
+    Cheap change token for the questions of a quiz.
+    Adding, deleting or editing a question changes at least one component.
+    """
+    row = db.session.query(
+        func.count(Question.id),
+        func.max(Question.id),
+        func.max(Question.updated_at),
+        func.sum(Question.marks)
+    ).filter(Question.quiz_id == quiz_id).one()
+    return tuple(str(v) for v in row)
+
+
+def get_answer_key(quiz_id):
+    """Return the compiled answer key for a quiz, compiling it on a cache miss"""
+    _cache.maxsize = current_app.config.get("ANSWER_KEY_CACHE_SIZE", DEFAULT_CACHE_SIZE)
+    version = question_version(quiz_id)
+    key = _cache.get(quiz_id, version)
+    if key is None:
+        questions = Question.query.filter_by(quiz_id=quiz_id).all()
+        key = AnswerKey(quiz_id, version, questions)
+        _cache.put(key)
+    return key
+
+
+def invalidate_answer_key(quiz_id=None):
+    _cache.invalidate(quiz_id)
+
+
+class GradedSubmission:
+    """Result of grading one submission in a single pass over the answer key"""
+
+    def __init__(self):
+        self.total_score = 0
+        self.questions_correct = 0
+        self.questions_answered = 0
+        self.answered_time = 0
+        self.total_questions = 0
+        self.attempts = []  # one dict per QuestionAttempt row, without score/user ids
+
+
+def answers_from_form(answer_key, form):
+    """Collect raw answers and per-question times from a submit_quiz form"""
+    answers = {}
+    for question in answer_key.questions:
+        if question.question_type == "multiple":
+            answers[question.id] = form.getlist(f"answers[{question.id}][]")
+        else:
+            answers[question.id] = form.get(f"answers[{question.id}]")
+
+    times = {}
+    for key, value in form.items():
+        if key.startswith("times["):
+            try:
+                times[key[6:-1]] = int(value.strip())
+            except (ValueError, AttributeError):
+                times[key[6:-1]] = 0
+    return answers, times
+
+
+def grade_submission(answer_key, answers, times=None, record_unanswered=True):
+    """
+    Grade every question of `answer_key` against `answers` (question id -> raw answer).
+    Unanswered questions still get an attempt row unless `record_unanswered` is False.
+    """
+    times = times or {}
+    debug = current_app.config.get("GRADING_DEBUG_LOG", False)
+    policy = current_app.config.get("MARKING_POLICY", "standard")
+    result = GradedSubmission()
+    result.total_questions = len(answer_key)
+
+    for question in answer_key.questions:
+        time_spent = times.get(str(question.id), 0)
+        answered, is_correct, marks_awarded, stored_answer = question.grade(answers.get(question.id))
+        marks_awarded = apply_marking_policy(policy, question, answered, is_correct, marks_awarded)
+        if answered:
+            result.questions_answered += 1
+            result.answered_time += time_spent
+        elif not record_unanswered:
+            continue
+
+        result.total_score += marks_awarded
+        if is_correct:
+            result.questions_correct += 1
+        if debug:
+            current_app.logger.info(
+                "Question %s: type=%s, answer=%s, is_correct=%s, marks=%s",
+                question.id, question.question_type, stored_answer, is_correct, marks_awarded
+            )
+
+        result.attempts.append({
+            "question_id": question.id,
+            "user_answer": stored_answer,
+            "is_correct": is_correct,
+            "marks_awarded": marks_awarded,
+            "time_spent": time_spent
+        })
+    return result
+
+
+def record_submission(quiz_id, user_id, graded, time_spent, completion_status="Completed", timestamp=None,
+                      pending=None):
+    """
+    Persist a graded submission in one transaction: a single INSERT for the
+    Score followed by one executemany INSERT for all of its QuestionAttempts.
+    A PendingSubmission passed as `pending` is marked done in the same transaction.
+    Returns the new Score.
+    """
+    # Percentile against every earlier attempt, stored with the score at submit time
+    distribution = get_distribution(quiz_id)
+    score = Score(
+        quiz_id=quiz_id,
+        user_id=user_id,
+        total_scored=graded.total_score,
+        time_spent=time_spent,
+        time_stamp_of_attempt=timestamp or datetime.now(),
+        completion_status=completion_status,
+        total_questions=graded.total_questions,
+        questions_answered=graded.questions_answered,
+        questions_correct=graded.questions_correct,
+        percentile=distribution.percentile_if_added(graded.total_score)
+    )
+    try:
+        db.session.add(score)
+        db.session.flush()
+        if graded.attempts:
+            db.session.execute(
+                insert(QuestionAttempt),
+                [dict(row, score_id=score.id, user_id=user_id) for row in graded.attempts]
+            )
+        if pending is not None:
+            pending.status = "done"
+            pending.score_id = score.id
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    distribution.add(graded.total_score)
+    leaderboards.apply(quiz_id, user_id, score.time_stamp_of_attempt, graded.total_score)
+    return score
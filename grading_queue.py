@@ -0,0 +1,139 @@
+import json
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from werkzeug.datastructures import MultiDict
+from models import db, PendingSubmission
+from grading import get_answer_key, answers_from_form, grade_submission, record_submission
+
+
+def enqueue_submission(quiz_id, user_id, form, total_time, completion_status="Completed"):
+    """Durably store a raw submission and wake the grading pool. Returns the pending row."""
+    pending = PendingSubmission(
+        quiz_id=quiz_id,
+        user_id=user_id,
+        form_data=json.dumps(form.to_dict(flat=False)),
+        total_time=total_time,
+        completion_status=completion_status,
+        submitted_at=datetime.now()
+    )
+    db.session.add(pending)
+    db.session.commit()
+    grading_pool.notify()
+    return pending
+
+
+def claim_next_submission(stale_after):
+    """
+    Atomically move the oldest pending submission to 'grading'.
+    Rows left in 'grading' longer than `stale_after` seconds (a crashed worker) are retried.
+    """
+    while True:
+        now = datetime.now()
+        stale = now - timedelta(seconds=stale_after)
+        candidate = db.session.query(PendingSubmission.id).filter(
+            (PendingSubmission.status == "pending") |
+            ((PendingSubmission.status == "grading") & (PendingSubmission.claimed_at < stale))
+        ).order_by(PendingSubmission.id).first()
+        if candidate is None:
+            return None
+
+        claimed = PendingSubmission.query.filter(
+            PendingSubmission.id == candidate.id,
+            (PendingSubmission.status == "pending") |
+            ((PendingSubmission.status == "grading") & (PendingSubmission.claimed_at < stale))
+        ).update({"status": "grading", "claimed_at": now}, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return db.session.get(PendingSubmission, candidate.id)
+        # Another worker won the race; look for the next candidate
+
+
+def grade_pending_submission(pending):
+    """Grade a claimed submission and write its Score and QuestionAttempts"""
+    form = MultiDict([(key, value) for key, values in json.loads(pending.form_data).items() for value in values])
+    answer_key = get_answer_key(pending.quiz_id)
+    answers, times = answers_from_form(answer_key, form)
+    graded = grade_submission(answer_key, answers, times)
+    time_spent = pending.total_time if pending.total_time and pending.total_time > 0 else graded.answered_time
+    return record_submission(pending.quiz_id, pending.user_id, graded, time_spent,
+                             pending.completion_status, pending.submitted_at, pending=pending)
+
+
+class GradingPool:
+    """Local pool of worker threads draining the pending_submissions table"""
+
+    def __init__(self):
+        self.app = None
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions["grading_pool"] = self
+        # Started by the first request when ASYNC_GRADING is on, so submissions left pending or
+        # claimed by a crash or restart are graded without waiting for the next submission
+        app.before_request(self.resume)
+
+    def resume(self):
+        if not self._threads and self.app is not None and self.app.config.get("ASYNC_GRADING"):
+            self.start()
+
+    def start(self):
+        with self._lock:
+            if self._threads or self.app is None:
+                return
+            self._stopping.clear()
+            for i in range(self.app.config.get("GRADING_WORKERS", 2)):
+                thread = threading.Thread(target=self._run, name=f"grading-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        """Wake a worker, starting the pool on first use"""
+        self.start()
+        self._wakeup.set()
+
+    def _run(self):
+        poll_interval = self.app.config.get("GRADING_POLL_INTERVAL", 2)
+        stale_after = self.app.config.get("GRADING_CLAIM_TIMEOUT", 300)
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            with self.app.app_context():
+                try:
+                    pending = claim_next_submission(stale_after)
+                except Exception as e:
+                    db.session.rollback()
+                    current_app.logger.error(f"Error claiming submission: {str(e)}")
+                    pending = None
+
+                if pending is None:
+                    self._wakeup.wait(poll_interval)
+                    continue
+
+                pending_id = pending.id
+                try:
+                    grade_pending_submission(pending)
+                except Exception as e:
+                    db.session.rollback()
+                    current_app.logger.error(f"Error grading submission {pending_id}: {str(e)}")
+                    try:
+                        PendingSubmission.query.filter_by(id=pending_id).update(
+                            {"status": "failed", "error": str(e)}, synchronize_session=False)
+                        db.session.commit()
+                    except Exception as e:
+                        # Keep the worker alive; the claim times out and the submission is retried
+                        db.session.rollback()
+                        current_app.logger.error(f"Error marking submission {pending_id} failed: {str(e)}")
+
+
+grading_pool = GradingPool()
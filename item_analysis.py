@@ -0,0 +1,169 @@
+import json
+from collections import Counter
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func
+from models import db, Question, Score, QuestionAttempt, QuizAnalysis, ItemAnalysis
+from grading import OPTION_FIELDS
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the job reports that it is unavailable
+    np = None
+
+# Integer questions have open answers; keep only the most common ones
+MAX_OPEN_ANSWERS = 5
+
+
+class ItemAnalysisUnavailable(RuntimeError):
+    pass
+
+
+def _answer_tokens(question, options, answer):
+    """Normalize one stored answer into the option keys it picked"""
+    if answer is None or not str(answer).strip():
+        return ["blank"]
+    answer = str(answer).strip().lower()
+    question_type = (question.question_type or "").lower()
+    if question_type == "multiple":
+        return [token.strip() for token in answer.split(",") if token.strip()]
+    if question_type == "single":
+        for index, text in enumerate(options, start=1):
+            if text and answer == text:
+                return [f"option{index}"]
+        return ["other"]
+    return [answer]
+
+
+def _distractor_rates(question, answers, respondents):
+    """Pick rate of every option (or common open answer) among all respondents"""
+    options = [(getattr(question, field) or "").strip().lower() for field in OPTION_FIELDS]
+    picks = Counter()
+    for answer in answers:
+        picks.update(_answer_tokens(question, options, answer))
+    picks["blank"] += respondents - len(answers)  # no attempt row at all
+    if (question.question_type or "").lower() == "integer":
+        common = dict(picks.most_common(MAX_OPEN_ANSWERS))
+        picks = Counter({key: count for key, count in picks.items() if key in common or key == "blank"})
+    return {key: count / respondents for key, count in sorted(picks.items()) if count}
+
+
+def _column_correlation(x, y):
+    """Pearson correlation of each column of x with the same column of y (None for constant columns)"""
+    x_centered = x - x.mean(axis=0)
+    y_centered = y - y.mean(axis=0)
+    denominator = np.sqrt((x_centered ** 2).sum(axis=0) * (y_centered ** 2).sum(axis=0))
+    numerator = (x_centered * y_centered).sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        correlation = numerator / denominator
+    return [float(value) if np.isfinite(value) else None for value in correlation]
+
+
+def _reliability(matrix, ddof):
+    """k/(k-1) * (1 - sum of item variances / variance of totals); KR-20 when matrix is 0/1"""
+    respondents, items = matrix.shape
+    if items < 2 or respondents < 2:
+        return None
+    total_variance = matrix.sum(axis=1).var(ddof=ddof)
+    if total_variance == 0:
+        return None
+    return float(items / (items - 1) * (1 - matrix.var(axis=0, ddof=ddof).sum() / total_variance))
+
+
+def analyze_quiz(quiz_id):
+    """
+    Recompute and store item statistics for one quiz.
+    Each user counts once, with their first attempt.
+    Returns the QuizAnalysis row.
+    """
+    if np is None:
+        raise ItemAnalysisUnavailable("Item analysis requires NumPy (pip install numpy)")
+
+    questions = Question.query.filter_by(quiz_id=quiz_id).order_by(Question.id).all()
+    first_attempts = db.session.query(func.min(Score.id).label("score_id")).filter(
+        Score.quiz_id == quiz_id).group_by(Score.user_id).subquery()
+    score_ids = [score_id for score_id, in db.session.query(first_attempts.c.score_id).all()]
+
+    column_of = {question.id: index for index, question in enumerate(questions)}
+    row_of = {score_id: index for index, score_id in enumerate(score_ids)}
+    correct = np.zeros((len(score_ids), len(questions)), dtype="float64")
+    marks = np.zeros((len(score_ids), len(questions)), dtype="float64")
+    answers = {question.id: [] for question in questions}
+
+    if score_ids and questions:
+        attempts = db.session.query(
+            QuestionAttempt.score_id, QuestionAttempt.question_id, QuestionAttempt.is_correct,
+            QuestionAttempt.marks_awarded, QuestionAttempt.user_answer
+        ).join(first_attempts, first_attempts.c.score_id == QuestionAttempt.score_id
+        ).filter(QuestionAttempt.question_id.in_(list(column_of))).all()
+        if attempts:
+            rows = np.array([row_of[a.score_id] for a in attempts])
+            cols = np.array([column_of[a.question_id] for a in attempts])
+            correct[rows, cols] = [1.0 if a.is_correct else 0.0 for a in attempts]
+            marks[rows, cols] = [a.marks_awarded or 0.0 for a in attempts]
+        for attempt in attempts:
+            answers[attempt.question_id].append(attempt.user_answer)
+
+    respondents = len(score_ids)
+    totals = marks.sum(axis=1)
+    # Point-biserial against the rest score, so an item is not correlated with itself
+    discrimination = _column_correlation(correct, totals[:, None] - marks) if respondents else []
+    difficulty = correct.mean(axis=0) if respondents else np.zeros(len(questions))
+
+    now = datetime.now()
+    try:
+        ItemAnalysis.query.filter_by(quiz_id=quiz_id).delete(synchronize_session=False)
+        QuizAnalysis.query.filter_by(quiz_id=quiz_id).delete(synchronize_session=False)
+        for index, question in enumerate(questions):
+            db.session.add(ItemAnalysis(
+                question_id=question.id,
+                quiz_id=quiz_id,
+                respondents=respondents,
+                difficulty_index=float(difficulty[index]) if respondents else None,
+                discrimination=discrimination[index] if respondents else None,
+                distractors=json.dumps(_distractor_rates(question, answers[question.id], respondents)
+                                       if respondents else {}),
+                computed_at=now
+            ))
+        analysis = QuizAnalysis(
+            quiz_id=quiz_id,
+            respondents=respondents,
+            items=len(questions),
+            mean_score=float(totals.mean()) if respondents else None,
+            kr20=_reliability(correct, ddof=0),
+            cronbach_alpha=_reliability(marks, ddof=1),
+            computed_at=now
+        )
+        db.session.add(analysis)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return analysis
+
+
+def analyze_all_quizzes():
+    """Run analyze_quiz for every quiz that has at least one attempt"""
+    quiz_ids = [row[0] for row in db.session.query(Score.quiz_id).distinct().all()]
+    for quiz_id in quiz_ids:
+        analyze_quiz(quiz_id)
+    current_app.logger.info(f"Item analysis refreshed for {len(quiz_ids)} quizzes")
+    return len(quiz_ids)
+
+
+@click.command("item-analysis")
+@click.option("--quiz", "quiz_id", type=int, help="Only analyze this quiz.")
+@with_appcontext
+def item_analysis_command(quiz_id):
+    """Recompute stored item statistics (difficulty, discrimination, reliability)."""
+    try:
+        if quiz_id:
+            analysis = analyze_quiz(quiz_id)
+            click.echo(f"Quiz {quiz_id}: {analysis.items} items, {analysis.respondents} respondents, "
+                       f"KR-20 {analysis.kr20}, alpha {analysis.cronbach_alpha}")
+        else:
+            click.echo(f"Analyzed {analyze_all_quizzes()} quizzes.")
+    except ItemAnalysisUnavailable as e:
+        raise click.ClickException(str(e))
@@ -0,0 +1,135 @@
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from threading import Lock
+from flask import current_app
+from sqlalchemy import func
+from models import db, Score, Quiz, Chapter
+
+# Seconds after which a leaderboard is reloaded from the database, so scores
+# written by other processes are eventually included
+DEFAULT_REFRESH_SECONDS = 300
+
+# Rolling windows in days
+WINDOWS = {"week": 7, "month": 30}
+
+SCOPES = ("quiz", "subject") + tuple(WINDOWS)
+
+
+class Leaderboard:
+    """
+    Points per user kept alongside a sorted list of (-points, user_id).
+    Updating a user and looking up a rank are binary searches; a page is a slice.
+    """
+
+    def __init__(self, points):
+        self.points = dict(points)
+        self.order = sorted((-p, user_id) for user_id, p in self.points.items())
+        self.loaded_at = time.monotonic()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self.order)
+
+    def add(self, user_id, delta):
+        with self._lock:
+            old = self.points.get(user_id)
+            if old is not None:
+                del self.order[bisect_left(self.order, (-old, user_id))]
+            new = (old or 0.0) + float(delta)
+            self.points[user_id] = new
+            insort(self.order, (-new, user_id))
+
+    def rank(self, user_id):
+        """1-based competition rank (ties share the best rank), None if the user has no points"""
+        points = self.points.get(user_id)
+        if points is None:
+            return None
+        return bisect_left(self.order, (-points,)) + 1
+
+    def page(self, page, per_page):
+        """Entries of one page as (rank, user_id, points)"""
+        start = (page - 1) * per_page
+        return [(bisect_left(self.order, (neg_points,)) + 1, user_id, -neg_points)
+                for neg_points, user_id in self.order[start:start + per_page]]
+
+
+def _window_start(scope):
+    today = datetime.now().date()
+    return datetime.combine(today - timedelta(days=WINDOWS[scope] - 1), datetime.min.time())
+
+
+def _load_points(scope, scope_id):
+    """Sum of total_scored per user for one scope, in a single GROUP BY"""
+    query = db.session.query(Score.user_id, func.sum(Score.total_scored))
+    if scope == "quiz":
+        query = query.filter(Score.quiz_id == scope_id)
+    elif scope == "subject":
+        query = query.join(Quiz, Quiz.id == Score.quiz_id) \
+            .join(Chapter, Chapter.id == Quiz.chapter_id) \
+            .filter(Chapter.subject_id == scope_id)
+    else:
+        query = query.filter(Score.time_stamp_of_attempt >= scope_id)
+    return dict(query.group_by(Score.user_id).all())
+
+
+class LeaderboardRegistry:
+    """
+    Leaderboards per quiz, per subject and per rolling week/month, loaded lazily
+    and kept current by applying each new or regraded score as a delta.
+    Points are the sum of total_scored over the user's attempts in the scope.
+    """
+
+    def __init__(self):
+        self._boards = {}
+        self._quiz_subjects = {}
+        self._lock = Lock()
+
+    def _key(self, scope, scope_id):
+        if scope in WINDOWS:
+            # Window boards are keyed by their start date so they roll over daily
+            return scope, _window_start(scope)
+        return scope, scope_id
+
+    def get(self, scope, scope_id=None):
+        if scope not in SCOPES:
+            raise ValueError(f"Unknown leaderboard scope: {scope}")
+        refresh = current_app.config.get("LEADERBOARD_REFRESH_SECONDS", DEFAULT_REFRESH_SECONDS)
+        key = self._key(scope, scope_id)
+        board = self._boards.get(key)
+        if board is None or time.monotonic() - board.loaded_at > refresh:
+            board = Leaderboard(_load_points(*key))
+            with self._lock:
+                if scope in WINDOWS:
+                    for stale in [k for k in self._boards if k[0] == scope]:
+                        del self._boards[stale]
+                self._boards[key] = board
+        return board
+
+    def subject_for_quiz(self, quiz_id):
+        if quiz_id not in self._quiz_subjects:
+            self._quiz_subjects[quiz_id] = db.session.query(Chapter.subject_id) \
+                .join(Quiz, Quiz.chapter_id == Chapter.id) \
+                .filter(Quiz.id == quiz_id).scalar()
+        return self._quiz_subjects[quiz_id]
+
+    def apply(self, quiz_id, user_id, timestamp, delta):
+        """Add `delta` points for one attempt to every loaded board it belongs to"""
+        keys = [("quiz", quiz_id), ("subject", self.subject_for_quiz(quiz_id))]
+        for scope in WINDOWS:
+            start = _window_start(scope)
+            if timestamp is None or timestamp >= start:
+                keys.append((scope, start))
+        for key in keys:
+            board = self._boards.get(key)
+            if board is not None:
+                board.add(user_id, delta)
+
+    def invalidate(self):
+        """Drop every board, e.g. after quizzes move between subjects or are deleted"""
+        with self._lock:
+            self._boards.clear()
+            self._quiz_subjects.clear()
+
+
+leaderboards = LeaderboardRegistry()
@@ -0,0 +1,286 @@
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+import time
+from datetime import datetime, timedelta
+import click
+from flask import current_app, request, url_for, abort
+from flask.cli import with_appcontext
+from sqlalchemy import event, func, inspect, update, union_all, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from werkzeug.utils import send_file
+from models import db, Question, MediaBlob
+
+# Question columns holding a media path; "media/<sha256><ext>" values are counted references
+MEDIA_COLUMNS = ("image_path", "audio_path", "video_path")
+MEDIA_PREFIX = "media/"
+
+# Accepted upload extensions per kind of question media
+MEDIA_EXTENSIONS = {
+    "image": {".png", ".jpg", ".jpeg", ".gif", ".webp"},
+    "audio": {".mp3", ".wav", ".ogg", ".m4a"},
+    "video": {".mp4", ".webm", ".ogv"},
+}
+
+# Bytes read from an upload stream at a time while hashing it to disk
+CHUNK_SIZE = 1024 * 1024
+
+# Unreferenced blobs younger than this are kept: their question may not be committed yet
+DEFAULT_GC_GRACE_SECONDS = 3600
+
+# Content-addressed files never change, so clients may cache them for a year
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+_MEDIA_NAME = re.compile(r"^([0-9a-f]{64})(\.[a-z0-9]{1,9})$")
+
+
+def media_kind_allowed(filename, kind):
+    return os.path.splitext(filename or "")[1].lower() in MEDIA_EXTENSIONS[kind]
+
+
+def store_root():
+    return current_app.config.get("MEDIA_STORE_PATH") or os.path.join(current_app.instance_path, "media")
+
+
+def blob_path(digest, extension):
+    """Files fan out over two directory levels so no directory grows too large"""
+    return os.path.join(store_root(), digest[:2], digest[2:4], digest + extension)
+
+
+def temp_dir():
+    """Scratch space on the same filesystem as the store, so finished files are moved, not copied"""
+    path = os.path.join(store_root(), "tmp")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def add_file(temp_path, digest, size, extension):
+    """
+    Move a fully written temp file into the store under its digest, or drop it
+    when that content is already stored. Returns the MediaBlob (not yet referenced).
+    """
+    target = blob_path(digest, extension)
+    if os.path.exists(target):
+        os.remove(temp_path)
+        # Reused now: keep collect_garbage's orphan sweep off it for another grace period
+        os.utime(target)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(temp_path, target)
+    # Two concurrent uploads of the same content both end up here; the first row wins.
+    # A reused row gets a fresh created_at so collect_garbage leaves an unreferenced
+    # blob alone until the question that is about to reference it commits.
+    now = datetime.utcnow()
+    db.session.execute(sqlite_insert(MediaBlob).values(
+        digest=digest, extension=extension, size=size, ref_count=0, created_at=now,
+        content_type=mimetypes.guess_type("file" + extension)[0]
+    ).on_conflict_do_update(index_elements=["digest"], set_={"created_at": now}))
+    return db.session.get(MediaBlob, digest, populate_existing=True)
+
+
+def store_upload(file, kind):
+    """
+    Hash an uploaded FileStorage into the store while copying it to disk in
+    CHUNK_SIZE pieces. Returns the MediaBlob; its media_path goes on the question.
+    """
+    extension = os.path.splitext(file.filename)[1].lower()
+    if extension not in MEDIA_EXTENSIONS[kind]:
+        raise ValueError(f"Unsupported {kind} file type: {extension or file.filename}")
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=temp_dir())
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: file.stream.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(temp_path)
+        raise
+    return add_file(temp_path, digest.hexdigest(), size, extension)
+
+
+def parse_media_path(path):
+    """(digest, extension) of a "media/<sha256><ext>" column value, else None"""
+    if not path or not path.startswith(MEDIA_PREFIX):
+        return None
+    match = _MEDIA_NAME.match(path[len(MEDIA_PREFIX):])
+    return match.groups() if match else None
+
+
+def media_url(path):
+    """URL for a question media column: the content-addressed route, or the legacy static file"""
+    if not path:
+        return None
+    if parse_media_path(path):
+        return url_for("media", name=path[len(MEDIA_PREFIX):])
+    return url_for("static", filename=path)
+
+
+def serve_media(name):
+    """
+    Serve a stored file with a strong ETag (its hash), immutable caching and
+    Range support. With MEDIA_ACCEL_REDIRECT set (e.g. "/_media/"), nginx is
+    handed the file via X-Accel-Redirect; with MEDIA_X_SENDFILE, the server gets
+    an X-Sendfile header. Either way no app worker streams the bytes.
+    """
+    match = _MEDIA_NAME.match(name)
+    if not match:
+        abort(404)
+    digest, extension = match.groups()
+    path = blob_path(digest, extension)
+    if not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+    accel_prefix = current_app.config.get("MEDIA_ACCEL_REDIRECT")
+    if accel_prefix:
+        response = current_app.response_class(mimetype=mimetype)
+        response.set_etag(digest)
+        if request.if_none_match.contains(digest):
+            response.status_code = 304
+        else:
+            relative = os.path.relpath(path, store_root()).replace(os.sep, "/")
+            response.headers["X-Accel-Redirect"] = accel_prefix.rstrip("/") + "/" + relative
+    else:
+        response = send_file(
+            path, request.environ, mimetype=mimetype, etag=digest, conditional=True,
+            max_age=31536000, use_x_sendfile=current_app.config.get("MEDIA_X_SENDFILE", False),
+            response_class=current_app.response_class, _root_path=current_app.root_path)
+        # Advertise seeking up front; werkzeug answers Range requests with 206
+        response.headers.setdefault("Accept-Ranges", "bytes")
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE
+    return response
+
+
+# -- reference counting --------------------------------------------------
+
+def _adjust_refs(connection, paths, amount):
+    for path in paths:
+        parsed = parse_media_path(path)
+        if parsed:
+            connection.execute(update(MediaBlob).where(MediaBlob.digest == parsed[0]).values(
+                ref_count=MediaBlob.ref_count + amount))
+
+
+def _question_inserted(mapper, connection, question):
+    _adjust_refs(connection, [getattr(question, column) for column in MEDIA_COLUMNS], 1)
+
+
+def _question_deleted(mapper, connection, question):
+    _adjust_refs(connection, [getattr(question, column) for column in MEDIA_COLUMNS], -1)
+
+
+def _question_updated(mapper, connection, question):
+    state = inspect(question)
+    for column in MEDIA_COLUMNS:
+        history = state.attrs[column].history
+        if history.has_changes():
+            _adjust_refs(connection, [path for path in history.deleted if path], -1)
+            _adjust_refs(connection, [path for path in history.added if path], 1)
+
+
+def _media_replaced(target, value, oldvalue, initiator):
+    # active_history loads the previous path so after_update can release it
+    pass
+
+
+event.listen(Question, "after_insert", _question_inserted)
+event.listen(Question, "after_update", _question_updated)
+event.listen(Question, "after_delete", _question_deleted)
+for column in MEDIA_COLUMNS:
+    event.listen(getattr(Question, column), "set", _media_replaced, active_history=True)
+
+
+def recount_references():
+    """Recompute every ref_count from the question columns. Returns {digest: (stored, actual)} for drifted rows."""
+    referenced = union_all(*[select(getattr(Question, column).label("path")) for column in MEDIA_COLUMNS]).subquery()
+    actual = {}
+    for path, count in db.session.query(referenced.c.path, func.count()).filter(
+            referenced.c.path.like(MEDIA_PREFIX + "%")).group_by(referenced.c.path).all():
+        parsed = parse_media_path(path)
+        if parsed:
+            actual[parsed[0]] = actual.get(parsed[0], 0) + count
+    drifted = {}
+    for blob in MediaBlob.query.all():
+        if blob.ref_count != actual.get(blob.digest, 0):
+            drifted[blob.digest] = (blob.ref_count, actual.get(blob.digest, 0))
+            blob.ref_count = actual.get(blob.digest, 0)
+    db.session.commit()
+    return drifted
+
+
+def _stored_files():
+    """(digest, path) of every blob file in the store's two-level fan-out"""
+    root = store_root()
+    if not os.path.isdir(root):
+        return
+    for level1 in os.listdir(root):
+        if len(level1) != 2 or not os.path.isdir(os.path.join(root, level1)):
+            continue  # tmp/, uploads/
+        for level2 in os.listdir(os.path.join(root, level1)):
+            directory = os.path.join(root, level1, level2)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                match = _MEDIA_NAME.match(name)
+                if match:
+                    yield match.group(1), os.path.join(directory, name)
+
+
+def collect_garbage(grace_seconds=DEFAULT_GC_GRACE_SECONDS):
+    """
+    Delete unreferenced blobs, store files without a MediaBlob row (their
+    question transaction rolled back after add_file) and abandoned temp files,
+    all older than the grace period
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    removed = 0
+    for blob in MediaBlob.query.filter(MediaBlob.ref_count <= 0, MediaBlob.created_at < cutoff).all():
+        try:
+            os.remove(blob_path(blob.digest, blob.extension))
+        except FileNotFoundError:
+            pass
+        db.session.delete(blob)
+        removed += 1
+    db.session.commit()
+
+    known = set(db.session.scalars(select(MediaBlob.digest)))
+    for digest, path in _stored_files():
+        if digest not in known and os.path.getmtime(path) < time.time() - grace_seconds:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+
+    temp_root = os.path.join(store_root(), "tmp")
+    if os.path.isdir(temp_root):
+        for name in os.listdir(temp_root):
+            path = os.path.join(temp_root, name)
+            if os.path.isfile(path) and os.path.getmtime(path) < time.time() - grace_seconds:
+                os.remove(path)
+    return removed
+
+
+def init_app(app):
+    app.add_url_rule("/media/<name>", "media", serve_media)
+    app.jinja_env.globals["media_url"] = media_url
+    app.cli.add_command(media_gc_command)
+
+
+@click.command("media-gc")
+@click.option("--grace-seconds", type=int, default=DEFAULT_GC_GRACE_SECONDS, show_default=True,
+              help="Keep unreferenced files younger than this.")
+@with_appcontext
+def media_gc_command(grace_seconds):
+    """Repair media reference counts and delete files no question uses."""
+    from chunked_uploads import expire_uploads  # imports this module
+    click.echo(f"Expired {expire_uploads(grace_seconds)} idle chunked uploads.")
+    drifted = recount_references()
+    for digest, (stored, actual) in drifted.items():
+        click.echo(f"{digest}: ref_count {stored} -> {actual}")
+    click.echo(f"Removed {collect_garbage(grace_seconds)} unreferenced media files.")
@@ -4,8 +4,10 @@ from sqlalchemy.ext.hybrid import hybrid_property
 from datetime import datetime, timedelta
 import enum
 import json
+from db_profile import RoutingSession
 
-db = SQLAlchemy()
+# Reads inside analytics_reads views go to the read-only analytics engine
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 class Role(enum.Enum):
     ADMIN = "admin"
@@ -37,33 +39,28 @@ class User(db.Model):
                                         secondary="scores",
                                         viewonly=True)
     
+    @property
+    def stats(self):
+        """All per-user analytics, computed once per instance with a few grouped queries"""
+        if '_stats' not in self.__dict__:
+            from user_stats import load_user_stats
+            self.__dict__['_stats'] = load_user_stats([self.id])[self.id]
+        return self.__dict__['_stats']
+
     @property
     def average_score(self):
         """Calculate user's average score percentage across all quizzes"""
-        result = db.session.query(
-            func.sum(Score.total_scored).label('total_points'),
-            func.sum(Score.total_questions * Question.marks).label('total_possible')
-        ).join(Quiz, Score.quiz_id == Quiz.id
-        ).join(Question, Question.quiz_id == Quiz.id
-        ).filter(Score.user_id == self.id
-        ).first()
-        
-        if result and result.total_possible:
-            return (result.total_points / result.total_possible) * 100
-        return 0
+        return self.stats.average_score
 
     @property
     def quizzes_completed(self):
         """Count number of quizzes completed by user"""
-        return Score.query.filter_by(user_id=self.id).count()
+        return self.stats.quizzes_completed
     
     @property
     def strongest_subject(self):
         """Return the subject where user has the highest performance"""
-        strength = UserStrength.query.filter_by(user_id=self.id).order_by(UserStrength.performance_score.desc()).first()
-        if strength and strength.subject:
-            return strength.subject.name
-        return None
+        return self.stats.strongest_subject
 
     @property
     def consistency_score(self):
@@ -71,31 +68,21 @@ class User(db.Model):
         Calculate the standard deviation of the user's quiz accuracies.
         Lower values indicate more consistent performance.
         """
-        from statistics import stdev
-        scores = [score.accuracy for score in self.scores if score.total_questions > 0]
-        if len(scores) < 2:
-            return 0.0
-        return stdev(scores)
+        return self.stats.consistency_score
 
     @property
     def fastest_quiz(self):
         """
         Identify the quiz attempt with the minimum time spent among completed quizzes.
         """
-        completed_scores = [s for s in self.scores if s.time_spent > 0]
-        if not completed_scores:
-            return None
-        return min(completed_scores, key=lambda s: s.time_spent)
+        return self.stats.fastest_quiz
 
     @property
     def slowest_quiz(self):
         """
         Identify the quiz attempt with the maximum time spent among completed quizzes.
         """
-        completed_scores = [s for s in self.scores if s.time_spent > 0]
-        if not completed_scores:
-            return None
-        return max(completed_scores, key=lambda s: s.time_spent)
+        return self.stats.slowest_quiz
 
     @property
     def subject_performance(self):
@@ -104,19 +91,7 @@ class User(db.Model):
         Returns a dictionary mapping subject names to the average accuracy
         of quizzes taken in that subject.
         """
-        performance = {}
-        for score in self.scores:
-            quiz = score.quiz
-            if quiz and quiz.chapter and quiz.chapter.subject:
-                subject_name = quiz.chapter.subject.name
-                if subject_name not in performance:
-                    performance[subject_name] = []
-                performance[subject_name].append(score.accuracy)
-        # Compute average accuracy for each subject
-        for subject in performance:
-            accuracies = performance[subject]
-            performance[subject] = sum(accuracies) / len(accuracies)
-        return performance
+        return self.stats.subject_performance
 
 class Subject(db.Model):
     """Subject model for organizing chapters"""
@@ -136,18 +111,16 @@ class Subject(db.Model):
     @property
     def quiz_count(self):
         """Count total quizzes in this subject"""
-        return db.session.query(func.count(Quiz.id)).join(
-            Chapter, Quiz.chapter_id == Chapter.id
-        ).filter(Chapter.subject_id == self.id).scalar() or 0
+        from catalog_stats import load_catalog_counts
+        subjects, _ = load_catalog_counts([self.id])
+        return subjects[self.id].quiz_count if self.id in subjects else 0
     
     @property
     def question_count(self):
         """Count total questions in this subject"""
-        return db.session.query(func.count(Question.id)).join(
-            Quiz, Question.quiz_id == Quiz.id
-        ).join(
-            Chapter, Quiz.chapter_id == Chapter.id
-        ).filter(Chapter.subject_id == self.id).scalar() or 0
+        from catalog_stats import load_catalog_counts
+        subjects, _ = load_catalog_counts([self.id])
+        return subjects[self.id].question_count if self.id in subjects else 0
 
 class Chapter(db.Model):
     """Chapter model for organizing quizzes within subjects"""
@@ -164,36 +137,22 @@ class Chapter(db.Model):
     quizzes = db.relationship('Quiz', backref='chapter', cascade="all, delete-orphan", lazy=True)
     user_performances = db.relationship('UserStrength', backref='chapter', lazy='dynamic')
     
+    @property
+    def counts(self):
+        """Counters of this chapter, computed with one grouped query"""
+        from catalog_stats import load_catalog_counts, ChapterCounts
+        _, chapters = load_catalog_counts([self.subject_id])
+        return chapters.get(self.id) or ChapterCounts(self.id, self.subject_id)
+
     @property
     def questions_count(self):
         """Count total questions in this chapter"""
-        count = 0
-        for quiz in self.quizzes:
-            count += len(quiz.questions)
-        return count
+        return self.counts.question_count
     
     @property
     def avg_difficulty(self):
         """Calculate average difficulty of questions in this chapter"""
-        difficulty_map = {"Easy": 1, "Medium": 2, "Hard": 3}
-        questions = Question.query.join(
-            Quiz, Question.quiz_id == Quiz.id
-        ).filter(Quiz.chapter_id == self.id).all()
-        
-        if not questions:
-            return "Medium"
-            
-        total = 0
-        for q in questions:
-            total += difficulty_map.get(q.difficulty, 2)
-        
-        avg = total / len(questions)
-        if avg <= 1.5:
-            return "Easy"
-        elif avg <= 2.5:
-            return "Medium"
-        else:
-            return "Hard"
+        return self.counts.avg_difficulty
 
 class QuizType(enum.Enum):
     PRACTICE = "practice"
@@ -224,6 +183,10 @@ class Quiz(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+
+    # Denormalized from the questions table, kept current by quiz_totals.py
+    total_marks = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    question_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
     questions = db.relationship('Question', backref='quiz', cascade="all, delete-orphan", lazy=True)
@@ -247,47 +210,32 @@ class Quiz(db.Model):
                 (not self.end_time or now <= self.end_time))
     
     @property
-    def total_marks(self):
-        """Calculate total possible marks for this quiz"""
-        return sum(q.marks for q in self.questions)
-    
+    def stats(self):
+        """Attempt metrics for this quiz, loaded (or read from cache) once per instance"""
+        if '_stats' not in self.__dict__:
+            from quiz_stats import load_quiz_stats
+            self.__dict__['_stats'] = load_quiz_stats([self.id])[self.id]
+        return self.__dict__['_stats']
+
     @property
     def avg_score(self):
         """Calculate average score percentage for this quiz"""
-        total_marks = self.total_marks
-        if total_marks == 0:
-            return 0
-        
-        avg_raw = db.session.query(func.avg(Score.total_scored)).filter(
-            Score.quiz_id == self.id).scalar() or 0
-        return (avg_raw / total_marks) * 100
+        return self.stats.avg_score
     
     @property
     def avg_time(self):
         """Calculate average time spent on this quiz in seconds"""
-        return db.session.query(func.avg(Score.time_spent)).filter(
-            Score.quiz_id == self.id).scalar() or 0
+        return self.stats.avg_time
     
     @property
     def completion_rate(self):
         """Calculate quiz completion rate as percentage"""
-        total_attempts = Score.query.filter_by(quiz_id=self.id).count()
-        total_users = User.query.filter_by(role="user").count()
-        return (total_attempts / total_users * 100) if total_users > 0 else 0
+        return self.stats.completion_rate
     
     @property
     def passing_rate(self):
         """Calculate percentage of users who passed the quiz"""
-        total_attempts = Score.query.filter_by(quiz_id=self.id).count()
-        if total_attempts == 0:
-            return 0
-            
-        passed_attempts = Score.query.filter(
-            Score.quiz_id == self.id,
-            Score.total_scored >= self.passing_score
-        ).count()
-        
-        return (passed_attempts / total_attempts) * 100
+        return self.stats.passing_rate
 
 class QuizTag(db.Model):
     """Tags for categorizing quizzes"""
@@ -373,21 +321,11 @@ class Question(db.Model):
 
     def check_answer(self, user_answer):
         """Check if user's answer is correct"""
-        if self.question_type == "multiple":
-            correct_options = set(self.correct_option.split(","))
-            user_options = set(user_answer if isinstance(user_answer, list) else [user_answer])
-            return correct_options == user_options
-        elif self.question_type =='single':
-            return str(user_answer).strip().lower()==self.correct_option.strip().lower()
-        elif self.question_type == "integer":
-            try:
-                return int(user_answer) == int(self.correct_option)
-            except (ValueError, TypeError):
-                return False
-        elif self.question_type == "true_false":
-            return str(user_answer).lower() == self.correct_option.lower()
-        else:
-            return False
+        from grading import get_answer_key, CompiledQuestion
+        compiled = get_answer_key(self.quiz_id).get(self.id) if self.id else None
+        if compiled is None:
+            compiled = CompiledQuestion(self)
+        return compiled.grade(user_answer)[1]
 
 class Score(db.Model):
     """Score model for tracking quiz attempts and performance"""
@@ -434,7 +372,7 @@ class Score(db.Model):
     
     @property
     def relative_performance(self):
-        quiz = Quiz.query.get(self.quiz_id)
+        quiz = self.quiz
         if not quiz:
             return 0
         return (self.total_scored / quiz.total_marks * 100) if quiz.total_marks > 0 else 0
@@ -454,6 +392,126 @@ class QuestionAttempt(db.Model):
     marks_awarded = db.Column(db.Float, default=0.0)
 
 
+class PendingSubmission(db.Model):
+    """Raw quiz submission waiting to be graded by the background grading pool"""
+    __tablename__ = 'pending_submissions'
+    id = db.Column(db.Integer, primary_key=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    form_data = db.Column(db.Text, nullable=False)  # JSON of the posted form (key -> list of values)
+    total_time = db.Column(db.Integer, default=0)  # in seconds
+    completion_status = db.Column(db.String(20), default='Completed')
+    submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, grading, done, failed
+    claimed_at = db.Column(db.DateTime)
+    score_id = db.Column(db.Integer, db.ForeignKey('scores.id'))
+    error = db.Column(db.Text)
+
+    score = db.relationship('Score', foreign_keys=[score_id])
+
+
+class Rollup(db.Model):
+    """
+    Pre-aggregated dashboard counters maintained on every Score insert, regrade or delete.
+    scope is 'global', 'quiz', 'subject' or 'day' (keyed by id or YYYY-MM-DD) with one row
+    per completion status, or 'entity' for plain row counts (users, quizzes, questions).
+    """
+    __tablename__ = 'rollups'
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(20), nullable=False)
+    scope_key = db.Column(db.String(50), nullable=False, default='')
+    completion_status = db.Column(db.String(20), nullable=False, default='')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Float, nullable=False, default=0.0)
+    time_sum = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'scope_key', 'completion_status', name='_rollup_key_uc'),
+    )
+
+
+class QuizAnalysis(db.Model):
+    """Quiz-level reliability from the last item-analysis run (see item_analysis.py)"""
+    __tablename__ = 'quiz_analyses'
+    id = db.Column(db.Integer, primary_key=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=False, unique=True)
+    respondents = db.Column(db.Integer, default=0)  # users counted (first attempt each)
+    items = db.Column(db.Integer, default=0)
+    mean_score = db.Column(db.Float)
+    kr20 = db.Column(db.Float)  # None when it cannot be computed (fewer than 2 items/respondents, no variance)
+    cronbach_alpha = db.Column(db.Float)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    quiz = db.relationship('Quiz', backref=db.backref('analysis', uselist=False, cascade="all, delete-orphan"))
+
+
+class ItemAnalysis(db.Model):
+    """Per-question statistics from the last item-analysis run"""
+    __tablename__ = 'item_analyses'
+    id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('questions.id'), nullable=False, unique=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=False, index=True)
+    respondents = db.Column(db.Integer, default=0)
+    difficulty_index = db.Column(db.Float)  # proportion correct
+    discrimination = db.Column(db.Float)  # point-biserial against the rest score
+    distractors = db.Column(db.Text)  # JSON: answer key -> pick rate
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    question = db.relationship('Question', backref=db.backref('analysis', uselist=False, cascade="all, delete-orphan"))
+
+    @property
+    def distractor_rates(self):
+        return json.loads(self.distractors) if self.distractors else {}
+
+    @property
+    def needs_review(self):
+        """Flag items that almost everyone (or almost no one) gets right, or that do not discriminate"""
+        if self.difficulty_index is None:
+            return False
+        return (self.difficulty_index < 0.2 or self.difficulty_index > 0.9 or
+                (self.discrimination is not None and self.discrimination < 0.2))
+
+
+class MediaBlob(db.Model):
+    """One stored media file, named by the SHA-256 of its content (see media_store.py)"""
+    __tablename__ = 'media_blobs'
+    digest = db.Column(db.String(64), primary_key=True)  # hex SHA-256
+    extension = db.Column(db.String(10), nullable=False)  # e.g. ".png", part of the URL
+    content_type = db.Column(db.String(100))
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # question media columns pointing here
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def media_path(self):
+        """Value stored in Question.image_path/audio_path/video_path"""
+        return f"media/{self.digest}{self.extension}"
+
+
+class MediaUpload(db.Model):
+    """Resumable chunked upload of one media file (see chunked_uploads.py); chunks live on disk"""
+    __tablename__ = 'media_uploads'
+    id = db.Column(db.String(32), primary_key=True)  # random token used in the chunk URLs
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    kind = db.Column(db.String(10), nullable=False)  # image, audio or video
+    filename = db.Column(db.String(200), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    media_path = db.Column(db.String(200))  # set once assembled into the media store
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # last chunk received
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.total_size // self.chunk_size))
+
+    def expected_size(self, index):
+        """Length of chunk `index`; only the last one may be short"""
+        if index == self.chunk_count - 1:
+            return self.total_size - index * self.chunk_size
+        return self.chunk_size
+
+
 class ScoreComment(db.Model):
     """Model for storing comments on quiz scores."""
     __tablename__ = 'score_comments'
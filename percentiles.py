@@ -0,0 +1,140 @@
+import time
+from bisect import bisect_left, bisect_right, insort
+from threading import Lock
+from flask import current_app
+from sqlalchemy import select, update, bindparam
+from models import db, Score
+
+# Seconds after which a quiz's distribution is reloaded from the database, so
+# scores written by other processes are eventually included
+DEFAULT_REFRESH_SECONDS = 300
+
+
+class ScoreDistribution:
+    """
+    Sorted array of every total_scored for one quiz plus a running sum.
+    Rank and percentile lookups are binary searches; average and median are O(1).
+    """
+
+    def __init__(self, quiz_id, values):
+        self.quiz_id = quiz_id
+        self.values = sorted(values)
+        self.total = sum(self.values)
+        self.loaded_at = time.monotonic()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, value):
+        with self._lock:
+            insort(self.values, value)
+            self.total += value
+
+    def count_at_or_below(self, value):
+        return bisect_right(self.values, value)
+
+    def rank(self, value):
+        """1-based rank of `value` among all scores, ties sharing the best rank"""
+        return len(self.values) - bisect_right(self.values, value) + 1
+
+    def percentile(self, value):
+        """Percentage of attempts scoring at or below `value`"""
+        if not self.values:
+            return 100.0
+        return self.count_at_or_below(value) / len(self.values) * 100
+
+    def percentile_if_added(self, value):
+        """Percentile `value` would have once added, without adding it"""
+        return (self.count_at_or_below(value) + 1) / (len(self.values) + 1) * 100
+
+    def average(self, exclude=None):
+        """Mean score, optionally leaving out one attempt's value"""
+        count, total = len(self.values), self.total
+        if exclude is not None and bisect_left(self.values, exclude) < count and \
+                self.values[bisect_left(self.values, exclude)] == exclude:
+            count, total = count - 1, total - exclude
+        return total / count if count else 0
+
+    def median(self):
+        count = len(self.values)
+        if not count:
+            return 0
+        middle = count // 2
+        if count % 2:
+            return self.values[middle]
+        return (self.values[middle - 1] + self.values[middle]) / 2
+
+
+class DistributionRegistry:
+    """Per-quiz ScoreDistributions, loaded lazily with one column query"""
+
+    def __init__(self):
+        self._distributions = {}
+        self._lock = Lock()
+
+    def get(self, quiz_id):
+        refresh = current_app.config.get("PERCENTILE_REFRESH_SECONDS", DEFAULT_REFRESH_SECONDS)
+        distribution = self._distributions.get(quiz_id)
+        if distribution is None or time.monotonic() - distribution.loaded_at > refresh:
+            values = db.session.scalars(
+                db.select(Score.total_scored).where(Score.quiz_id == quiz_id)
+            ).all()
+            distribution = ScoreDistribution(quiz_id, values)
+            with self._lock:
+                self._distributions[quiz_id] = distribution
+        return distribution
+
+    def invalidate(self, quiz_id=None):
+        with self._lock:
+            if quiz_id is None:
+                self._distributions.clear()
+            else:
+                self._distributions.pop(quiz_id, None)
+
+
+distributions = DistributionRegistry()
+
+
+def recompute_percentiles(quiz_id, connection, batch_size=5000):
+    """
+    Recompute the stored Score.percentile of every attempt at a quiz, e.g. after
+    a regrade changed the scores. Each attempt keeps the meaning it got at
+    submit time (percentile_if_added against the attempts before it), counted
+    with a Fenwick tree over the score values in submission order.
+    Returns the number of rows changed.
+    """
+    rows = connection.execute(
+        select(Score.id, Score.total_scored, Score.percentile)
+        .where(Score.quiz_id == quiz_id).order_by(Score.id)
+    ).all()
+    values = sorted({total for _, total, _ in rows})
+    tree = [0] * (len(values) + 1)
+    changed = []
+    for seen, (score_id, total, stored) in enumerate(rows):
+        position = bisect_right(values, total)
+        at_or_below, i = 0, position
+        while i > 0:
+            at_or_below += tree[i]
+            i -= i & -i
+        percentile = (at_or_below + 1) / (seen + 1) * 100
+        if stored is None or abs(stored - percentile) > 1e-9:
+            changed.append({"p_id": score_id, "p_value": percentile})
+        i = position
+        while i <= len(values):
+            tree[i] += 1
+            i += i & -i
+
+    scores = Score.__table__
+    stmt = update(scores).where(scores.c.id == bindparam("p_id")).values(percentile=bindparam("p_value"))
+    for start in range(0, len(changed), batch_size):
+        connection.execute(stmt, changed[start:start + batch_size])
+    return len(changed)
+
+
+def get_distribution(quiz_id):
+    return distributions.get(quiz_id)
+
+
+def invalidate_distribution(quiz_id=None):
+    distributions.invalidate(quiz_id)
@@ -0,0 +1,168 @@
+import gzip
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+from flask import current_app, render_template
+from models import db, Quiz, Question
+from grading import question_version
+
+# Number of quizzes whose content is kept in memory when the app config does
+# not set QUIZ_CONTENT_CACHE_SIZE
+DEFAULT_CACHE_SIZE = 64
+
+# What attempt_quiz shows of a question; answers and marks never leave the server
+PAYLOAD_FIELDS = ["id", "question_type", "question_statement", "image_path", "audio_path", "video_path",
+                  "option1", "option2", "option3", "option4", "option5"]
+
+
+def serialize_questions(questions):
+    """Question rows as plain dicts with the attribute names the template uses"""
+    payload = []
+    for question in questions:
+        item = {field: getattr(question, field) for field in PAYLOAD_FIELDS}
+        item["options_list"] = question.options_list
+        payload.append(item)
+    return payload
+
+
+class QuizContent:
+    """Serialized questions and the rendered question block of one quiz version, gzip-compressed"""
+
+    def __init__(self, quiz_id, version, payload, block):
+        self.quiz_id = quiz_id
+        self.version = version
+        self.question_count = len(payload)
+        self.payload_gz = gzip.compress(json.dumps(payload).encode("utf-8"))
+        self.block_gz = gzip.compress(block.encode("utf-8"))
+
+    @property
+    def etag(self):
+        return f"quiz-{self.quiz_id}-" + "-".join(self.version)
+
+    def payload(self):
+        return json.loads(gzip.decompress(self.payload_gz))
+
+    def block(self):
+        return gzip.decompress(self.block_gz).decode("utf-8")
+
+
+class QuizContentCache:
+    """Thread-safe LRU of QuizContent keyed by (quiz_id, version)"""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, quiz_id, version):
+        with self._lock:
+            content = self._entries.get((quiz_id, version))
+            if content is not None:
+                self._entries.move_to_end((quiz_id, version))
+            return content
+
+    def put(self, content):
+        with self._lock:
+            # An older version of the same quiz can never be hit again
+            for cached in [k for k in self._entries if k[0] == content.quiz_id]:
+                del self._entries[cached]
+            self._entries[(content.quiz_id, content.version)] = content
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, quiz_id=None):
+        with self._lock:
+            if quiz_id is None:
+                self._entries.clear()
+                return
+            for cached in [k for k in self._entries if k[0] == quiz_id]:
+                del self._entries[cached]
+
+
+_cache = QuizContentCache()
+
+
+def get_quiz_content(quiz_id):
+    """
+    Cached content of a quiz, built on a miss. The version check is one aggregate
+    query; the questions are only loaded and rendered when they changed.
+    Needs a request context (the block is rendered with url_for).
+    """
+    _cache.maxsize = current_app.config.get("QUIZ_CONTENT_CACHE_SIZE", DEFAULT_CACHE_SIZE)
+    version = question_version(quiz_id)
+    content = _cache.get(quiz_id, version)
+    if content is None:
+        questions = Question.query.filter_by(quiz_id=quiz_id).order_by(Question.id).all()
+        payload = serialize_questions(questions)
+        block = render_template("attempt_quiz_questions.html", questions=payload)
+        content = QuizContent(quiz_id, version, payload, block)
+        _cache.put(content)
+    return content
+
+
+def invalidate_quiz_content(quiz_id=None):
+    _cache.invalidate(quiz_id)
+
+
+def warm_upcoming_quizzes(ahead_seconds):
+    """Build the cached content of quizzes starting within the next `ahead_seconds`"""
+    now = datetime.now()
+    quiz_ids = [quiz_id for quiz_id, in db.session.query(Quiz.id).filter(
+        Quiz.start_time > now,
+        Quiz.start_time <= now + timedelta(seconds=ahead_seconds)
+    ).all()]
+    for quiz_id in quiz_ids:
+        get_quiz_content(quiz_id)
+    return quiz_ids
+
+
+class QuizContentWarmer:
+    """Background thread that warms the content cache shortly before each Quiz.start_time"""
+
+    def __init__(self):
+        self.app = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions["quiz_content_warmer"] = self
+        # Started by the first request, so CLI commands and imports stay thread-free
+        app.before_request(self.start)
+
+    def start(self):
+        if self._thread is not None or self.app is None or not self.app.config.get("QUIZ_CONTENT_WARMER", True):
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="quiz-content-warmer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        interval = self.app.config.get("QUIZ_CONTENT_WARM_INTERVAL", 30)
+        # Look one interval further ahead so no start time falls between two passes
+        ahead = self.app.config.get("QUIZ_CONTENT_WARM_AHEAD_SECONDS", 300) + interval
+        while not self._stopping.is_set():
+            # A request context lets the question block build its static URLs
+            with self.app.test_request_context():
+                try:
+                    warmed = warm_upcoming_quizzes(ahead)
+                    if warmed:
+                        current_app.logger.info(f"Warmed quiz content for quizzes {warmed}")
+                except Exception as e:
+                    current_app.logger.error(f"Error warming quiz content: {str(e)}")
+            self._stopping.wait(interval)
+
+
+quiz_content_warmer = QuizContentWarmer()
@@ -0,0 +1,150 @@
+import copy
+import time
+from threading import Lock
+from flask import current_app
+from sqlalchemy import event, func, case
+from sqlalchemy.orm import Session, object_session
+from models import db, User, Quiz, Question, Score
+
+# Reload cached aggregates after this many seconds when the app config does not
+# set QUIZ_STATS_REFRESH_SECONDS (picks up other processes' writes)
+DEFAULT_REFRESH_SECONDS = 300
+
+# Keep IN lists well below SQLite's bound parameter limit
+CHUNK_SIZE = 500
+
+
+class QuizStats:
+    """Attempt metrics of one quiz that used to be separate Quiz properties"""
+
+    def __init__(self, quiz_id, attempts=0, score_sum=0.0, time_sum=0, passed=0, total_marks=0):
+        self.quiz_id = quiz_id
+        self.attempts = attempts
+        self.score_sum = score_sum
+        self.time_sum = time_sum
+        self.passed = passed
+        self.total_marks = total_marks
+        self.completion_rate = 0
+        self.loaded_at = time.monotonic()
+
+    @property
+    def avg_score(self):
+        """Average score as a percentage of the quiz's total marks"""
+        if not self.attempts or not self.total_marks:
+            return 0
+        return (self.score_sum / self.attempts / self.total_marks) * 100
+
+    @property
+    def avg_time(self):
+        """Average time spent in seconds"""
+        return self.time_sum / self.attempts if self.attempts else 0
+
+    @property
+    def passing_rate(self):
+        return (self.passed / self.attempts * 100) if self.attempts else 0
+
+
+class QuizStatsCache:
+    """Per-quiz attempt aggregates, loaded for all cache misses with one grouped query"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = Lock()
+
+    def _load(self, quiz_ids):
+        rows = db.session.query(
+            Quiz.id,
+            func.count(Score.id),
+            func.coalesce(func.sum(Score.total_scored), 0),
+            func.coalesce(func.sum(Score.time_spent), 0),
+            func.coalesce(func.sum(case((Score.total_scored >= Quiz.passing_score, 1), else_=0)), 0),
+            Quiz.total_marks
+        ).outerjoin(Score, Score.quiz_id == Quiz.id
+        ).filter(Quiz.id.in_(quiz_ids)
+        ).group_by(Quiz.id).all()
+        return {row[0]: QuizStats(*row) for row in rows}
+
+    def get_many(self, quiz_ids):
+        refresh = current_app.config.get("QUIZ_STATS_REFRESH_SECONDS", DEFAULT_REFRESH_SECONDS)
+        now = time.monotonic()
+        found = {}
+        missing = []
+        for quiz_id in quiz_ids:
+            stats = self._entries.get(quiz_id)
+            if stats is None or now - stats.loaded_at > refresh:
+                missing.append(quiz_id)
+            else:
+                found[quiz_id] = stats
+        for start in range(0, len(missing), CHUNK_SIZE):
+            loaded = self._load(missing[start:start + CHUNK_SIZE])
+            with self._lock:
+                self._entries.update(loaded)
+            found.update(loaded)
+        return found
+
+    def invalidate(self, quiz_id=None):
+        with self._lock:
+            if quiz_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(quiz_id, None)
+
+
+quiz_stats_cache = QuizStatsCache()
+
+
+def load_quiz_stats(quiz_ids):
+    """
+    Return a dict of quiz_id -> QuizStats for many quizzes.
+    Cached quizzes cost nothing; the rest are loaded with one grouped query,
+    plus one count of users for the completion rate.
+    """
+    quiz_ids = list(dict.fromkeys(quiz_ids))
+    if not quiz_ids:
+        return {}
+    stats = quiz_stats_cache.get_many(quiz_ids)
+    total_users = db.session.query(func.count(User.id)).filter(User.role == "user").scalar()
+    result = {}
+    for quiz_id in quiz_ids:
+        # Copy so the shared cached entry is never mutated
+        entry = copy.copy(stats[quiz_id]) if quiz_id in stats else QuizStats(quiz_id)
+        entry.completion_rate = (entry.attempts / total_users * 100) if total_users else 0
+        result[quiz_id] = entry
+    return result
+
+
+def invalidate_quiz_stats(quiz_id=None):
+    quiz_stats_cache.invalidate(quiz_id)
+
+
+# Drop cached aggregates once a change to a quiz's scores (or its passing
+# score / total marks) is committed, so readers never re-cache uncommitted data
+
+def _mark_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        quiz_id = target.id if isinstance(target, Quiz) else target.quiz_id
+        session.info.setdefault("changed_quiz_stats", set()).add(quiz_id)
+
+
+for _event in ("after_insert", "after_update", "after_delete"):
+    event.listen(Score, _event, _mark_changed)
+    event.listen(Question, _event, _mark_changed)  # total marks
+event.listen(Quiz, "after_update", _mark_changed)
+
+
+@event.listens_for(Quiz, "expire")
+def _forget_instance_stats(quiz, attrs):
+    # Quiz.stats memoizes on the instance; drop it whenever the instance is expired
+    quiz.__dict__.pop("_stats", None)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    for quiz_id in session.info.pop("changed_quiz_stats", ()):
+        quiz_stats_cache.invalidate(quiz_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("changed_quiz_stats", None)
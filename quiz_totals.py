@@ -0,0 +1,131 @@
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event, func, inspect, select, update, text
+from sqlalchemy.orm import Session
+from models import db, Quiz, Question
+
+
+def _totals_statement(quiz_ids=None):
+    """UPDATE that recomputes Quiz.total_marks/question_count from the questions table"""
+    questions = Question.__table__
+    stmt = update(Quiz.__table__).values(
+        total_marks=select(func.coalesce(func.sum(questions.c.marks), 0))
+            .where(questions.c.quiz_id == Quiz.__table__.c.id).scalar_subquery(),
+        question_count=select(func.count(questions.c.id))
+            .where(questions.c.quiz_id == Quiz.__table__.c.id).scalar_subquery()
+    )
+    if quiz_ids is not None:
+        stmt = stmt.where(Quiz.__table__.c.id.in_(quiz_ids))
+    return stmt
+
+
+def refresh_quiz_totals(quiz_ids, connection=None):
+    """
+    Recompute the stored totals of the given quizzes.
+    ORM writes to Question are handled automatically; call this after bulk
+    INSERT/UPDATE/DELETE statements on the questions table.
+    """
+    quiz_ids = [quiz_id for quiz_id in set(quiz_ids) if quiz_id is not None]
+    if not quiz_ids:
+        return
+    connection = connection or db.session.connection()
+    connection.execute(_totals_statement(quiz_ids))
+
+
+def _touched_quizzes(session):
+    """Quiz ids whose questions are added, removed or re-marked by the pending flush"""
+    quiz_ids = set()
+    for obj in session.new:
+        if isinstance(obj, Question):
+            quiz_ids.add(obj.quiz_id)
+    for obj in session.deleted:
+        if isinstance(obj, Question):
+            quiz_ids.add(obj.quiz_id)
+    for obj in session.dirty:
+        if not isinstance(obj, Question):
+            continue
+        state = inspect(obj)
+        marks = state.attrs.marks.history
+        moved = state.attrs.quiz_id.history
+        if marks.has_changes() or moved.has_changes():
+            quiz_ids.add(obj.quiz_id)
+            quiz_ids.update(moved.deleted)
+    return quiz_ids
+
+
+@event.listens_for(Question.quiz_id, "set", active_history=True)
+def _question_moved(target, value, oldvalue, initiator):
+    # active_history loads the previous quiz_id so the old quiz gets recomputed too
+    pass
+
+
+@event.listens_for(Session, "after_flush")
+def _update_quiz_totals(session, flush_context):
+    quiz_ids = _touched_quizzes(session)
+    if quiz_ids:
+        refresh_quiz_totals(quiz_ids, session.connection())
+        session.info.setdefault("stale_quiz_totals", set()).update(quiz_ids)
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _expire_quiz_totals(session, flush_context):
+    # Loaded Quiz objects still hold the totals from before the UPDATE above
+    for quiz_id in session.info.pop("stale_quiz_totals", ()):
+        quiz = session.identity_map.get(inspect(Quiz).identity_key_from_primary_key((quiz_id,)))
+        if quiz is not None:
+            session.expire(quiz, ["total_marks", "question_count"])
+
+
+def ensure_quiz_total_columns():
+    """Add the total columns to a quizzes table created before they existed"""
+    inspector = inspect(db.engine)
+    if not inspector.has_table("quizzes"):
+        # A new database: create_all adds the table with the columns
+        return []
+    columns = {column["name"] for column in inspector.get_columns("quizzes")}
+    added = []
+    with db.engine.begin() as connection:
+        for name in ("total_marks", "question_count"):
+            if name not in columns:
+                connection.execute(text(f"ALTER TABLE quizzes ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0"))
+                added.append(name)
+        if added:
+            connection.execute(_totals_statement())
+    return added
+
+
+def stale_quiz_totals():
+    """Quizzes whose stored totals disagree with their questions: (quiz_id, stored, actual)"""
+    actual = db.session.query(
+        Question.quiz_id.label("quiz_id"),
+        func.sum(Question.marks).label("total_marks"),
+        func.count(Question.id).label("question_count")
+    ).group_by(Question.quiz_id).subquery()
+    rows = db.session.query(
+        Quiz.id, Quiz.total_marks, Quiz.question_count,
+        func.coalesce(actual.c.total_marks, 0), func.coalesce(actual.c.question_count, 0)
+    ).outerjoin(actual, actual.c.quiz_id == Quiz.id).filter(
+        (Quiz.total_marks != func.coalesce(actual.c.total_marks, 0)) |
+        (Quiz.question_count != func.coalesce(actual.c.question_count, 0))
+    ).all()
+    return [(quiz_id, (marks, count), (real_marks, real_count))
+            for quiz_id, marks, count, real_marks, real_count in rows]
+
+
+@click.command("repair-quiz-totals")
+@with_appcontext
+@click.option("--check", is_flag=True, help="Only report quizzes with wrong totals.")
+def repair_quiz_totals_command(check):
+    """Verify and fix the stored total marks and question count of every quiz."""
+    added = ensure_quiz_total_columns()
+    if added:
+        click.echo(f"Added columns: {', '.join(added)}")
+    stale = stale_quiz_totals()
+    for quiz_id, stored, actual in stale:
+        click.echo(f"Quiz {quiz_id}: stored marks/questions {stored}, actual {actual}")
+    if stale and not check:
+        db.session.execute(_totals_statement([quiz_id for quiz_id, _, _ in stale]))
+        db.session.commit()
+        click.echo(f"Repaired {len(stale)} quizzes.")
+    elif not stale:
+        click.echo("All quiz totals are correct.")
@@ -0,0 +1,134 @@
+from flask import current_app
+from sqlalchemy import select, update, bindparam
+from models import db, Question, QuestionAttempt, Score
+from grading import CompiledQuestion, apply_marking_policy, invalidate_answer_key
+from percentiles import invalidate_distribution, recompute_percentiles
+from quiz_stats import invalidate_quiz_stats
+from leaderboard import leaderboards
+from rollups import apply_score_deltas
+
+# Rows per executemany UPDATE statement
+BATCH_SIZE = 5000
+
+
+class RegradeResult:
+    """Summary of one regrade run"""
+
+    def __init__(self, question_id):
+        self.question_id = question_id
+        self.attempts_checked = 0
+        self.attempts_changed = 0
+        self.scores_changed = 0
+        self.marks_delta = 0
+
+    def __repr__(self):
+        return (f"<RegradeResult question={self.question_id} checked={self.attempts_checked} "
+                f"changed={self.attempts_changed} scores={self.scores_changed}>")
+
+
+def _chunks(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def regrade_question(question_id, policy=None):
+    """
+    Recompute is_correct/marks_awarded of every attempt at one question and
+    apply the resulting deltas to the parent Scores.
+
+    Attempts are read as plain column tuples and each distinct stored answer is
+    graded once, so the cost is dominated by the executemany UPDATEs of the rows
+    that actually changed. Scores are adjusted in place
+    (total_scored = total_scored + delta) instead of being re-summed.
+    """
+    policy = policy or current_app.config.get("MARKING_POLICY", "standard")
+    question = db.session.get(Question, question_id)
+    if question is None:
+        raise ValueError(f"Question {question_id} does not exist")
+    compiled = CompiledQuestion(question)
+    result = RegradeResult(question_id)
+
+    rows = db.session.execute(
+        select(
+            QuestionAttempt.id,
+            QuestionAttempt.score_id,
+            QuestionAttempt.user_answer,
+            QuestionAttempt.is_correct,
+            QuestionAttempt.marks_awarded,
+            Score.user_id,
+            Score.time_stamp_of_attempt,
+            Score.completion_status
+        ).join(Score, Score.id == QuestionAttempt.score_id)
+        .where(QuestionAttempt.question_id == question_id)
+    ).all()
+
+    graded = {}  # stored answer -> (is_correct, marks_awarded)
+    attempt_updates = []
+    score_deltas = {}  # score_id -> [marks delta, correct delta, user_id, timestamp, completion status]
+    for attempt_id, score_id, user_answer, old_correct, old_marks, user_id, timestamp, status in rows:
+        result.attempts_checked += 1
+        if user_answer not in graded:
+            answered, is_correct, marks_awarded, _ = compiled.grade(user_answer or None)
+            marks_awarded = apply_marking_policy(policy, compiled, answered, is_correct, marks_awarded)
+            graded[user_answer] = (bool(is_correct), float(marks_awarded))
+        is_correct, marks_awarded = graded[user_answer]
+
+        old_correct = bool(old_correct)
+        old_marks = old_marks or 0.0
+        if is_correct == old_correct and marks_awarded == old_marks:
+            continue
+
+        attempt_updates.append({"a_id": attempt_id, "a_correct": is_correct, "a_marks": marks_awarded})
+        delta = score_deltas.setdefault(score_id, [0.0, 0, user_id, timestamp, status])
+        delta[0] += marks_awarded - old_marks
+        delta[1] += int(is_correct) - int(old_correct)
+
+    result.attempts_changed = len(attempt_updates)
+    result.scores_changed = len(score_deltas)
+    result.marks_delta = sum(d[0] for d in score_deltas.values())
+    if not attempt_updates:
+        return result
+
+    attempts = QuestionAttempt.__table__
+    scores = Score.__table__
+    attempt_stmt = update(attempts).where(attempts.c.id == bindparam("a_id")).values(
+        is_correct=bindparam("a_correct"),
+        marks_awarded=bindparam("a_marks")
+    )
+    score_stmt = update(scores).where(scores.c.id == bindparam("s_id")).values(
+        total_scored=scores.c.total_scored + bindparam("s_marks"),
+        questions_correct=scores.c.questions_correct + bindparam("s_correct")
+    )
+    score_updates = [{"s_id": score_id, "s_marks": d[0], "s_correct": d[1]}
+                     for score_id, d in score_deltas.items()]
+
+    try:
+        connection = db.session.connection()
+        for chunk in _chunks(attempt_updates, BATCH_SIZE):
+            connection.execute(attempt_stmt, chunk)
+        for chunk in _chunks(score_updates, BATCH_SIZE):
+            connection.execute(score_stmt, chunk)
+        apply_score_deltas(question.quiz_id, [(timestamp, status, marks_delta, user_id)
+                                              for marks_delta, _, user_id, timestamp, status in score_deltas.values()],
+                           connection)
+        # Stored percentiles were computed from the old scores
+        recompute_percentiles(question.quiz_id, connection, BATCH_SIZE)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    invalidate_answer_key(question.quiz_id)
+    invalidate_distribution(question.quiz_id)
+    invalidate_quiz_stats(question.quiz_id)
+    for marks_delta, _, user_id, timestamp, _ in score_deltas.values():
+        leaderboards.apply(question.quiz_id, user_id, timestamp, marks_delta)
+    current_app.logger.info(f"Regraded question {question_id} ({policy}): {result.attempts_changed}/"
+                            f"{result.attempts_checked} attempts and {result.scores_changed} scores changed")
+    return result
+
+
+def regrade_quiz(quiz_id, policy=None):
+    """Regrade every question of a quiz, e.g. after switching the marking policy"""
+    question_ids = db.session.scalars(select(Question.id).where(Question.quiz_id == quiz_id)).all()
+    return [regrade_question(question_id, policy) for question_id in question_ids]
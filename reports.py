@@ -0,0 +1,157 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import func, case, and_, or_
+from models import db, User, Subject, Chapter, Quiz, Question, Score, QuestionAttempt
+
+DIFFICULTIES = ["Easy", "Medium", "Hard"]
+
+# Rows per page of the attempts table
+PAGE_SIZE = 50
+
+# sort_by value -> (column, descending)
+SORT_COLUMNS = {
+    "user": (User.username, False),
+    "quiz": (Quiz.name, False),
+    "subject": (Subject.name, False),
+    "score": (Score.total_scored, True),
+    "date": (func.coalesce(Score.time_stamp_of_attempt, datetime.min), True),
+    "last_attempt": (func.coalesce(Score.time_stamp_of_attempt, datetime.min), True),
+}
+
+
+def attempts_query(*columns):
+    """Scores joined to their user, quiz, chapter and subject"""
+    return db.session.query(*columns).select_from(Score
+    ).join(User, User.id == Score.user_id
+    ).join(Quiz, Quiz.id == Score.quiz_id
+    ).join(Chapter, Chapter.id == Quiz.chapter_id
+    ).join(Subject, Subject.id == Chapter.subject_id)
+
+
+def apply_attempt_filters(query, username_filter=None, quiz_filter=None, subject_filter=None, date_filter=None):
+    """Apply the admin summary filter bar to a query built on attempts_query()"""
+    if username_filter:
+        query = query.filter(User.id == username_filter)
+    if quiz_filter:
+        query = query.filter(Quiz.id == quiz_filter)
+    if subject_filter:
+        query = query.filter(Subject.id == subject_filter)
+    if date_filter:
+        today = datetime.now().date()
+        if date_filter == "today":
+            query = query.filter(func.date(Score.time_stamp_of_attempt) == today)
+        elif date_filter == "week":
+            week_ago = today - timedelta(days=7)
+            query = query.filter(func.date(Score.time_stamp_of_attempt) >= week_ago)
+        elif date_filter == "month":
+            month_ago = today - timedelta(days=30)
+            query = query.filter(func.date(Score.time_stamp_of_attempt) >= month_ago)
+    return query
+
+
+def encode_cursor(sort_by, value, score_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps({"s": sort_by, "v": value, "id": score_id})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(sort_by, cursor):
+    """Return (value, score_id) for a cursor made with the same sort, else None"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if data["s"] != sort_by:
+            return None
+        value = data["v"]
+        if sort_by in ("date", "last_attempt"):
+            value = datetime.fromisoformat(value)
+        return value, int(data["id"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def attempts_page(filters, sort_by="user", cursor=None, page_size=PAGE_SIZE):
+    """
+    One page of the attempts table using keyset pagination on (sort column, Score.id).
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    sort_by = sort_by if sort_by in SORT_COLUMNS else "user"
+    column, descending = SORT_COLUMNS[sort_by]
+    query = apply_attempt_filters(attempts_query(
+        Score.id.label("score_id"),
+        Score.total_scored,
+        Score.time_spent,
+        Score.time_stamp_of_attempt,
+        Score.completion_status,
+        User.id.label("user_id"),
+        User.username,
+        Quiz.id.label("quiz_id"),
+        Quiz.name.label("quiz_name"),
+        Subject.id.label("subject_id"),
+        Subject.name.label("subject_name"),
+        column.label("sort_value")
+    ), **filters)
+
+    position = decode_cursor(sort_by, cursor) if cursor else None
+    if position:
+        value, score_id = position
+        if descending:
+            query = query.filter(or_(column < value, and_(column == value, Score.id < score_id)))
+        else:
+            query = query.filter(or_(column > value, and_(column == value, Score.id > score_id)))
+
+    if descending:
+        query = query.order_by(column.desc(), Score.id.desc())
+    else:
+        query = query.order_by(column, Score.id)
+
+    rows = query.limit(page_size + 1).all()
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(sort_by, rows[-1].sort_value, rows[-1].score_id)
+    return rows, next_cursor
+
+
+def summary_charts(filters):
+    """All admin summary chart series as GROUP BY aggregates (one query per series)"""
+    user_rows = apply_attempt_filters(attempts_query(
+        User.username, func.avg(Score.total_scored)
+    ), **filters).group_by(User.id, User.username).order_by(User.username).all()
+
+    subject_rows = apply_attempt_filters(attempts_query(
+        Subject.name, func.avg(Score.total_scored)
+    ), **filters).group_by(Subject.id, Subject.name).order_by(Subject.name).all()
+
+    completion_rows = apply_attempt_filters(attempts_query(
+        Score.completion_status, func.count(Score.id)
+    ), **filters).group_by(Score.completion_status).order_by(Score.completion_status).all()
+
+    return {
+        "chart_labels": [r[0] for r in user_rows],
+        "chart_data": [float(r[1] or 0) for r in user_rows],
+        "chart_subject_labels": [r[0] for r in subject_rows],
+        "chart_subject_data": [float(r[1] or 0) for r in subject_rows],
+        "chart_completion_labels": [r[0] for r in completion_rows],
+        "chart_completion_data": [r[1] for r in completion_rows],
+    }
+
+
+def difficulty_stats(user_id=None):
+    """Attempted and correct question counts per difficulty, optionally for one user"""
+    query = db.session.query(
+        Question.difficulty,
+        func.count(QuestionAttempt.id),
+        func.sum(case((QuestionAttempt.is_correct == True, 1), else_=0))
+    ).join(Question, Question.id == QuestionAttempt.question_id
+    ).filter(Question.difficulty.in_(DIFFICULTIES))
+    if user_id is not None:
+        query = query.join(Score, Score.id == QuestionAttempt.score_id).filter(Score.user_id == user_id)
+    stats = {difficulty: (attempted, correct or 0)
+             for difficulty, attempted, correct in query.group_by(Question.difficulty).all()}
+    return {
+        "difficulty_order": DIFFICULTIES,
+        "attempted_list": [stats.get(d, (0, 0))[0] for d in DIFFICULTIES],
+        "correct_list": [stats.get(d, (0, 0))[1] for d in DIFFICULTIES],
+    }
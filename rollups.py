@@ -0,0 +1,280 @@
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event, func, select, delete, literal, inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, User, Subject, Chapter, Quiz, Question, Score, Rollup
+from db_profile import primary_reads
+
+# Data-version counters (scope 'version'): 'data' changes with anything the analytics
+# show, 'catalog' with subjects/chapters/quizzes/questions, 'user:<id>' with that user's
+# scores and 'subject:<id>' with anything under that subject (including its quizzes' scores)
+VERSION_SCOPE = "version"
+
+# Marker row written only by rebuild_rollups: incremental listeners also create entity
+# and score rows, so their presence does not mean the table was ever built from raw data
+REBUILT_MARKER = {"scope": "meta", "scope_key": "rebuilt", "completion_status": ''}
+
+rollups_table = Rollup.__table__
+
+
+def _day_key(timestamp):
+    return timestamp.date().isoformat() if timestamp else ''
+
+
+def _upsert(connection, rows):
+    """Add each row's attempts/score_sum/time_sum to its rollup bucket, creating it if needed"""
+    if not rows:
+        return
+    stmt = sqlite_insert(rollups_table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["scope", "scope_key", "completion_status"],
+        set_={
+            "attempts": rollups_table.c.attempts + stmt.excluded.attempts,
+            "score_sum": rollups_table.c.score_sum + stmt.excluded.score_sum,
+            "time_sum": rollups_table.c.time_sum + stmt.excluded.time_sum,
+        }
+    )
+    connection.execute(stmt, rows)
+
+
+def _score_rows(subject_id, quiz_id, timestamp, status, attempts, score_sum, time_sum):
+    status = status or ''
+    buckets = [("global", ''), ("quiz", str(quiz_id)), ("day", _day_key(timestamp))]
+    if subject_id is not None:
+        buckets.append(("subject", str(subject_id)))
+    return [{"scope": scope, "scope_key": key, "completion_status": status,
+             "attempts": attempts, "score_sum": score_sum, "time_sum": time_sum}
+            for scope, key in buckets]
+
+
+def _subject_for_quiz(connection, quiz_id):
+    return connection.execute(
+        select(Chapter.subject_id).join(Quiz, Quiz.chapter_id == Chapter.id).where(Quiz.id == quiz_id)
+    ).scalar()
+
+
+def bump_versions(connection, *keys):
+    """Increment data-version counters in the current transaction"""
+    _upsert(connection, [{"scope": VERSION_SCOPE, "scope_key": key, "completion_status": '',
+                          "attempts": 1, "score_sum": 0, "time_sum": 0} for key in keys])
+
+
+def version_stamps(keys):
+    """key -> current version counter (0 for a key never bumped)"""
+    keys = list(keys)
+    counters = dict(db.session.query(Rollup.scope_key, Rollup.attempts).filter(
+        Rollup.scope == VERSION_SCOPE, Rollup.scope_key.in_(keys)).all())
+    return {key: counters.get(key, 0) for key in keys}
+
+
+def data_version(*keys):
+    """Current value of each version counter, joined into one token (e.g. for an ETag)"""
+    stamps = version_stamps(keys)
+    return "-".join(str(stamps[key]) for key in keys)
+
+
+def apply_score_deltas(quiz_id, deltas, connection=None):
+    """
+    Apply regrade deltas for scores of one quiz.
+    `deltas` is an iterable of (timestamp, completion_status, score_delta), optionally
+    followed by the user id whose data version should change.
+    """
+    connection = connection or db.session.connection()
+    subject_id = _subject_for_quiz(connection, quiz_id)
+    rows = []
+    users = set()
+    for timestamp, status, score_delta, *user_id in deltas:
+        rows.extend(_score_rows(subject_id, quiz_id, timestamp, status, 0, score_delta, 0))
+        users.update(user_id)
+    _upsert(connection, rows)
+    bump_versions(connection, "data", f"subject:{subject_id}", *[f"user:{user_id}" for user_id in sorted(users)])
+
+
+@event.listens_for(Score, "after_insert")
+def _score_inserted(mapper, connection, score):
+    subject_id = _subject_for_quiz(connection, score.quiz_id)
+    _upsert(connection, _score_rows(
+        subject_id, score.quiz_id, score.time_stamp_of_attempt,
+        score.completion_status, 1, score.total_scored or 0, score.time_spent or 0))
+    bump_versions(connection, "data", f"user:{score.user_id}", f"subject:{subject_id}")
+
+
+@event.listens_for(Score, "after_delete")
+def _score_deleted(mapper, connection, score):
+    subject_id = _subject_for_quiz(connection, score.quiz_id)
+    _upsert(connection, _score_rows(
+        subject_id, score.quiz_id, score.time_stamp_of_attempt,
+        score.completion_status, -1, -(score.total_scored or 0), -(score.time_spent or 0)))
+    bump_versions(connection, "data", f"user:{score.user_id}", f"subject:{subject_id}")
+
+
+# Score columns that pick or fill a rollup bucket
+_BUCKET_ATTRIBUTES = ("quiz_id", "time_stamp_of_attempt", "completion_status", "total_scored", "time_spent")
+
+
+def _previous(score, attribute):
+    history = inspect(score).attrs[attribute].history
+    return history.deleted[0] if history.deleted else getattr(score, attribute)
+
+
+@event.listens_for(Score, "after_update")
+def _score_updated(mapper, connection, score):
+    """Move an ORM-updated score from its old bucket rows to the new ones (Core UPDATEs use apply_score_deltas)"""
+    subject_id = _subject_for_quiz(connection, score.quiz_id)
+    subjects = {subject_id}
+    state = inspect(score)
+    if any(state.attrs[attribute].history.has_changes() for attribute in _BUCKET_ATTRIBUTES):
+        old = {attribute: _previous(score, attribute) for attribute in _BUCKET_ATTRIBUTES}
+        old_subject_id = _subject_for_quiz(connection, old["quiz_id"])
+        subjects.add(old_subject_id)
+        _upsert(connection, _score_rows(
+            old_subject_id, old["quiz_id"], old["time_stamp_of_attempt"], old["completion_status"],
+            -1, -(old["total_scored"] or 0), -(old["time_spent"] or 0)) + _score_rows(
+            subject_id, score.quiz_id, score.time_stamp_of_attempt, score.completion_status,
+            1, score.total_scored or 0, score.time_spent or 0))
+    users = {score.user_id, _previous(score, "user_id")}
+    bump_versions(connection, "data", *[f"user:{user_id}" for user_id in sorted(users)],
+                  *[f"subject:{subject_id}" for subject_id in sorted(subjects, key=str)])
+
+
+def _bucket_value_replaced(target, value, oldvalue, initiator):
+    # active_history loads the previous value so after_update can take it out of its old bucket
+    pass
+
+
+for attribute in _BUCKET_ATTRIBUTES + ("user_id",):
+    event.listen(getattr(Score, attribute), "set", _bucket_value_replaced, active_history=True)
+
+
+def _count_entity(name, amount):
+    def listener(mapper, connection, target):
+        if name == "users" and target.role != "user":
+            return
+        _upsert(connection, [{"scope": "entity", "scope_key": name, "completion_status": '',
+                              "attempts": amount, "score_sum": 0, "time_sum": 0}])
+        if name == "users":
+            bump_versions(connection, "data")
+    return listener
+
+
+for model, name in ((User, "users"), (Quiz, "quizzes"), (Question, "questions")):
+    event.listen(model, "after_insert", _count_entity(name, 1))
+    event.listen(model, "after_delete", _count_entity(name, -1))
+
+
+def _current_and_previous(target, attribute):
+    """Current value of a foreign key plus the one it replaced in this flush, if any"""
+    history = inspect(target).attrs[attribute].history
+    return {value for value in [getattr(target, attribute), *history.deleted] if value is not None}
+
+
+def _affected_subjects(connection, target):
+    """Subjects whose tree contains `target`, before and after this change"""
+    if isinstance(target, Subject):
+        return {target.id}
+    if isinstance(target, Chapter):
+        return _current_and_previous(target, "subject_id")
+    if isinstance(target, Quiz):
+        chapter_ids = _current_and_previous(target, "chapter_id")
+        stmt = select(Chapter.subject_id).where(Chapter.id.in_(chapter_ids))
+    else:
+        quiz_ids = _current_and_previous(target, "quiz_id")
+        stmt = select(Chapter.subject_id).join(Quiz, Quiz.chapter_id == Chapter.id).where(Quiz.id.in_(quiz_ids))
+    return set(connection.execute(stmt).scalars())
+
+
+def _catalog_changed(mapper, connection, target):
+    bump_versions(connection, "data", "catalog",
+                  *[f"subject:{subject_id}" for subject_id in sorted(_affected_subjects(connection, target))])
+
+
+for model in (Subject, Chapter, Quiz, Question):
+    event.listen(model, "after_insert", _catalog_changed)
+    event.listen(model, "after_update", _catalog_changed)
+    event.listen(model, "after_delete", _catalog_changed)
+
+
+def rebuild_rollups():
+    """Regenerate every rollup row from the raw tables"""
+    # Also from views that read a read-only engine: the counts and the upsert use the
+    # primary connection the DELETE runs on
+    with primary_reads():
+        return _rebuild_rollups()
+
+
+def _rebuild_rollups():
+    db.session.execute(delete(Rollup).where(Rollup.scope != VERSION_SCOPE))
+    rows = []
+
+    entity_counts = {
+        "users": db.session.query(func.count(User.id)).filter(User.role == "user").scalar(),
+        "quizzes": db.session.query(func.count(Quiz.id)).scalar(),
+        "questions": db.session.query(func.count(Question.id)).scalar(),
+    }
+    for name, count in entity_counts.items():
+        rows.append({"scope": "entity", "scope_key": name, "completion_status": '',
+                     "attempts": count or 0, "score_sum": 0, "time_sum": 0})
+
+    aggregates = (func.count(Score.id), func.coalesce(func.sum(Score.total_scored), 0),
+                  func.coalesce(func.sum(Score.time_spent), 0))
+    groupings = {
+        "global": db.session.query(literal(''), Score.completion_status, *aggregates)
+            .group_by(Score.completion_status),
+        "quiz": db.session.query(Score.quiz_id, Score.completion_status, *aggregates)
+            .group_by(Score.quiz_id, Score.completion_status),
+        "subject": db.session.query(Chapter.subject_id, Score.completion_status, *aggregates)
+            .join(Quiz, Quiz.id == Score.quiz_id).join(Chapter, Chapter.id == Quiz.chapter_id)
+            .group_by(Chapter.subject_id, Score.completion_status),
+        "day": db.session.query(func.coalesce(func.date(Score.time_stamp_of_attempt), ''),
+                                Score.completion_status, *aggregates)
+            .group_by(func.date(Score.time_stamp_of_attempt), Score.completion_status),
+    }
+    for scope, query in groupings.items():
+        for key, status, attempts, score_sum, time_sum in query.all():
+            rows.append({"scope": scope, "scope_key": str(key), "completion_status": status or '',
+                         "attempts": attempts, "score_sum": score_sum, "time_sum": time_sum})
+
+    _upsert(db.session.connection(), rows + [dict(REBUILT_MARKER, attempts=1, score_sum=0, time_sum=0)])
+    db.session.commit()
+    return len(rows)
+
+
+def _totals(scope, scope_key=''):
+    row = db.session.query(
+        func.sum(Rollup.attempts), func.sum(Rollup.score_sum), func.sum(Rollup.time_sum)
+    ).filter(Rollup.scope == scope, Rollup.scope_key == scope_key).one()
+    return row[0] or 0, row[1] or 0.0, row[2] or 0
+
+
+def dashboard_totals():
+    """Global counters for the admin dashboards, read from a handful of rollup rows"""
+    # Checked on the primary: a database snapshot taken before the first rebuild lacks the marker too
+    with primary_reads():
+        rebuilt = db.session.query(Rollup.id).filter_by(**REBUILT_MARKER).first() is not None
+    if not rebuilt:
+        # First use on a database that predates the rollups table
+        rebuild_rollups()
+    counts = dict(db.session.query(Rollup.scope_key, Rollup.attempts).filter(Rollup.scope == "entity").all())
+    attempts, score_sum, time_sum = _totals("global")
+    return {
+        "total_users": counts.get("users", 0),
+        "total_quizzes": counts.get("quizzes", 0),
+        "total_questions": counts.get("questions", 0),
+        "total_attempts": attempts,
+        "avg_score": score_sum / attempts if attempts else 0.0,
+        "avg_time": time_sum / attempts if attempts else 0.0,
+    }
+
+
+def completion_counts(scope="global", scope_key=''):
+    """Attempts per completion status for one rollup bucket"""
+    return dict(db.session.query(Rollup.completion_status, Rollup.attempts).filter(
+        Rollup.scope == scope, Rollup.scope_key == scope_key, Rollup.attempts > 0).all())
+
+
+@click.command("rebuild-rollups")
+@with_appcontext
+def rebuild_rollups_command():
+    """Regenerate dashboard rollups from the scores table."""
+    count = rebuild_rollups()
+    click.echo(f"Rebuilt {count} rollup rows.")
@@ -1,24 +1,51 @@
-import os
 import random
-from flask import Blueprint, render_template, redirect, url_for, request, session, flash, current_app, jsonify
+from flask import Blueprint, render_template, redirect, url_for, request, session, flash, current_app, jsonify, Response, stream_with_context, g
 from datetime import datetime, timedelta
-from werkzeug.utils import secure_filename
-from models import db, User, Subject, Chapter, Quiz, Question, Score, QuestionAttempt, ScoreComment, UserStrength
+from models import db, User, Subject, Chapter, Quiz, Question, Score, QuestionAttempt, ScoreComment, UserStrength, PendingSubmission, QuizAnalysis, ItemAnalysis, MediaUpload
+from grading import get_answer_key, answers_from_form, grade_submission, record_submission
+from grading_queue import enqueue_submission
+from regrade import regrade_question
+from percentiles import get_distribution
+from leaderboard import leaderboards, SCOPES as LEADERBOARD_SCOPES
+from reports import attempts_page, summary_charts, difficulty_stats
+from rollups import dashboard_totals, rebuild_rollups, data_version, version_stamps
+from user_stats import load_user_stats
+from quiz_stats import load_quiz_stats
+from catalog_stats import load_catalog_counts
+from exports import export_attempts, EXPORT_FORMATS
+from analytics import get_snapshot, analytics_available
+from item_analysis import analyze_quiz, analyze_all_quizzes
+from timelines import score_timeline as timeline_series, time_spent_series, summary_totals
+from quiz_content import get_quiz_content
+from fragment_cache import fragments
+from media_store import store_upload, media_kind_allowed
+from db_profile import analytics_reads
+from snapshot_db import snapshot_reads, snapshot_stream, snapshot_writer, SNAPSHOT_BIND
+from chunked_uploads import UploadError, UploadBusy, start_upload, received_chunks, write_chunk, complete_upload, completed_media_path
 from sqlalchemy import func, case,extract
 import bleach
+from markupsafe import Markup
 from datetime import datetime, timedelta
 from sqlalchemy import func
 app_routes = Blueprint("app_routes", __name__)
 
-# Configuration for image uploads
-UPLOAD_FOLDER = "static/uploads"
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+def store_question_media():
+    """
+    Store the image/audio/video files of a question form in the content-addressed
+    media store. Large files arrive beforehand through the chunked upload API and
+    only their upload id is posted (`<kind>_upload`). Returns {column: media path}
+    for the files that were uploaded.
+    """
+    paths = {}
+    for kind in ("image", "audio", "video"):
+        file = request.files.get(kind)
+        if file and file.filename and media_kind_allowed(file.filename, kind):
+            paths[f"{kind}_path"] = store_upload(file, kind).media_path
+            continue
+        path = completed_media_path(request.form.get(f"{kind}_upload"), session.get("user_id"), kind)
+        if path:
+            paths[f"{kind}_path"] = path
+    return paths
 
 # Context processor to inject responsive design elements
 @app_routes.context_processor
@@ -186,32 +213,30 @@ def reset_password():
 #########################
 
 @app_routes.route("/admin/dashboard")
+@analytics_reads
 def admin_dashboard():
     if session.get("role") != "admin":
         flash("Access denied! Admins only.", "danger")
         return redirect(url_for("app_routes.login"))
     
     try:
-        # Query all subjects
-        subjects = Subject.query.all()
+        # Query all subjects with their chapters
+        subjects = Subject.query.options(joinedload(Subject.chapters)).all()
         
-        total_users = User.query.filter_by(role="user").count()
-        total_quizzes = Quiz.query.count()
-        total_questions = Question.query.count()
-        
-        avg_score_query = db.session.query(func.avg(Score.total_scored)).scalar()
-        try:
-            avg_score = float(avg_score_query) if avg_score_query is not None else 0.0
-        except Exception as e:
-            avg_score = 0.0
+        # Counters come from the rollups table instead of scanning users/quizzes/scores
+        totals = dashboard_totals()
+        # Per-subject and per-chapter counters in one GROUP BY
+        subject_counts, chapter_counts = load_catalog_counts()
         
         return render_template(
             "admin_dashboard.html", 
             subjects=subjects,
-            total_users=total_users,
-            total_quizzes=total_quizzes,
-            total_questions=total_questions,
-            avg_score=avg_score
+            subject_counts=subject_counts,
+            chapter_counts=chapter_counts,
+            total_users=totals["total_users"],
+            total_quizzes=totals["total_quizzes"],
+            total_questions=totals["total_questions"],
+            avg_score=totals["avg_score"]
         )
     except Exception as e:
         flash(f"Error loading dashboard: {str(e)}", "danger")
@@ -226,14 +251,32 @@ def quiz_management():
         return redirect(url_for("app_routes.login"))
     
     try:
-        # Eager-load subjects with their chapters, quizzes, and quiz questions
-        subjects = Subject.query.options(
-            joinedload(Subject.chapters)
-            .joinedload(Chapter.quizzes)
-            .joinedload(Quiz.questions)
-        ).all()
+        subjects = Subject.query.all()
+        # Each subject card is a cached fragment keyed by its version stamp; read
+        # the stamps before the data so a fragment is never older than its key
+        stamps = version_stamps(f"subject:{subject.id}" for subject in subjects)
+        subject_versions = {subject.id: stamps[f"subject:{subject.id}"] for subject in subjects}
+        cached_cards = {key[1]: html for key, html in fragments.get_many(
+            ("quiz_management", subject.id, subject_versions[subject.id]) for subject in subjects).items()}
+        stale_ids = [subject.id for subject in subjects if subject.id not in cached_cards]
+        
+        quiz_stats, subject_counts, chapter_counts = {}, {}, {}
+        if stale_ids:
+            # Eager-load chapters, quizzes, and quiz questions only for subjects that re-render
+            stale_subjects = Subject.query.options(
+                joinedload(Subject.chapters)
+                .joinedload(Chapter.quizzes)
+                .joinedload(Quiz.questions)
+            ).filter(Subject.id.in_(stale_ids)).all()
+            # Attempt metrics for every listed quiz in one grouped query (or from cache)
+            quiz_stats = load_quiz_stats(
+                quiz.id for subject in stale_subjects for chapter in subject.chapters for quiz in chapter.quizzes
+            )
+            subject_counts, chapter_counts = load_catalog_counts(stale_ids)
         
-        return render_template("quiz_management.html", subjects=subjects)
+        return render_template("quiz_management.html", subjects=subjects, subject_versions=subject_versions,
+                               cached_cards=cached_cards, quiz_stats=quiz_stats, subject_counts=subject_counts,
+                               chapter_counts=chapter_counts)
     except Exception as e:
         flash(f"Error loading quiz management: {str(e)}", "danger")
         return redirect(url_for("app_routes.admin_dashboard"))
@@ -242,6 +285,7 @@ def quiz_management():
 
 
 @app_routes.route("/admin/summary", methods=["GET"])
+@snapshot_reads
 def admin_summary():
     # Retrieve filter parameters from query string
     username_filter = request.args.get("username_filter")
@@ -249,108 +293,35 @@ def admin_summary():
     subject_filter = request.args.get("subject_filter")
     date_filter = request.args.get("date_filter")
     sort_by = request.args.get("sort_by", "user")
+    cursor = request.args.get("cursor")
+    filters = {
+        "username_filter": username_filter,
+        "quiz_filter": quiz_filter,
+        "subject_filter": subject_filter,
+        "date_filter": date_filter
+    }
     
-    # Base query for quiz attempts (adjust field names as per your model)
-    query = db.session.query(
-        Score.id.label("score_id"),
-        Score.total_scored,
-        Score.time_spent,
-        Score.time_stamp_of_attempt,
-        Score.completion_status,
-        User.id.label("user_id"),
-        User.username,
-        Quiz.id.label("quiz_id"),
-        Quiz.name.label("quiz_name"),
-        Subject.id.label("subject_id"),
-        Subject.name.label("subject_name")
-    ).join(User, User.id == Score.user_id
-    ).join(Quiz, Quiz.id == Score.quiz_id
-    ).join(Chapter, Chapter.id == Quiz.chapter_id
-    ).join(Subject, Subject.id == Chapter.subject_id)
-    
-    # Apply filters based on parameters
-    if username_filter:
-        query = query.filter(User.id == username_filter)
-    if quiz_filter:
-        query = query.filter(Quiz.id == quiz_filter)
-    if subject_filter:
-        query = query.filter(Subject.id == subject_filter)
-    if date_filter:
-        today = datetime.now().date()
-        if date_filter == "today":
-            query = query.filter(func.date(Score.time_stamp_of_attempt) == today)
-        elif date_filter == "week":
-            week_ago = today - timedelta(days=7)
-            query = query.filter(func.date(Score.time_stamp_of_attempt) >= week_ago)
-        elif date_filter == "month":
-            month_ago = today - timedelta(days=30)
-            query = query.filter(func.date(Score.time_stamp_of_attempt) >= month_ago)
-    
-    # Sorting options
-    if sort_by == "user":
-        query = query.order_by(User.username)
-    elif sort_by == "quiz":
-        query = query.order_by(Quiz.name)
-    elif sort_by == "subject":
-        query = query.order_by(Subject.name)
-    elif sort_by == "score":
-        query = query.order_by(Score.total_scored.desc())
-    elif sort_by == "date" or sort_by == "last_attempt":
-        query = query.order_by(Score.time_stamp_of_attempt.desc())
-    
-    quiz_attempts = query.all()
-    
-    # Global statistics for graphs view
-    avg_score = db.session.query(func.avg(Score.total_scored)).scalar() or 0.0
-    avg_time = (db.session.query(func.avg(Score.time_spent)).scalar() or 0.0) / 60
-    quiz_count = Quiz.query.count()
-    student_count = User.query.filter_by(role="user").count()
-    
-    # For chart data, aggregate as needed (example below)
-    # Aggregate average score per user:
-    user_scores = {}
-    for a in quiz_attempts:
-        user_scores.setdefault(a.username, []).append(a.total_scored)
-    chart_labels = list(user_scores.keys())
-    chart_data = [sum(scores)/len(scores) for scores in user_scores.values()]
-    
-    # Similarly, aggregate subject-based data:
-    subject_scores = {}
-    for a in quiz_attempts:
-        subject_scores.setdefault(a.subject_name, []).append(a.total_scored)
-    chart_subject_labels = list(subject_scores.keys())
-    chart_subject_data = [sum(scores)/len(scores) for scores in subject_scores.values()]
+    # One page of attempts via keyset pagination; the page never loads the full result
+    quiz_attempts, next_cursor = attempts_page(filters, sort_by, cursor)
     
-    # Completion rates (group by completion status)
-    completion_rates = {}
-    for a in quiz_attempts:
-        status = a.completion_status
-        completion_rates[status] = completion_rates.get(status, 0) + 1
-    chart_completion_labels = list(completion_rates.keys())
-    chart_completion_data = [completion_rates[status] for status in chart_completion_labels]
+    # Global statistics for graphs view, read from the rollups table
+    totals = dashboard_totals()
+    avg_score = totals["avg_score"]
+    avg_time = totals["avg_time"] / 60
+    quiz_count = totals["total_quizzes"]
+    student_count = totals["total_users"]
     
-    # Difficulty analysis (assuming you have a QuestionAttempt model to join with)
-    difficulties = ["Easy", "Medium", "Hard"]
-    diff_stats = {d: {"attempted": 0, "correct": 0} for d in difficulties}
-    all_attempts = QuestionAttempt.query.join(Score, QuestionAttempt.score_id == Score.id)\
-                        .filter(Score.user_id.isnot(None)).all()
-    for at in all_attempts:
-        q = Question.query.get(at.question_id)
-        if q and q.difficulty in difficulties:
-            diff_stats[q.difficulty]["attempted"] += 1
-            if at.is_correct:
-                diff_stats[q.difficulty]["correct"] += 1
-    difficulty_order = difficulties
-    attempted_list = [diff_stats[d]["attempted"] for d in difficulties]
-    correct_list = [diff_stats[d]["correct"] for d in difficulties]
+    # Chart series are loaded by the page from admin_summary_charts after the HTML
     
     # For filter dropdowns
-    users = User.query.all()
-    quizzes = Quiz.query.all()
-    subjects = Subject.query.all()
+    users = db.session.query(User.id, User.username).order_by(User.username).all()
+    quizzes = db.session.query(Quiz.id, Quiz.name).order_by(Quiz.name).all()
+    subjects = db.session.query(Subject.id, Subject.name).order_by(Subject.name).all()
     
     return render_template("admin_summary.html", 
                            quiz_attempts=quiz_attempts,
+                           next_cursor=next_cursor,
+                           cursor=cursor,
                            users=users,
                            quizzes=quizzes,
                            subjects=subjects,
@@ -362,17 +333,188 @@ def admin_summary():
                            avg_score=avg_score,
                            avg_time=avg_time,
                            quiz_count=quiz_count,
-                           student_count=student_count,
-                           chart_labels=chart_labels,
-                           chart_data=chart_data,
-                           chart_subject_labels=chart_subject_labels,
-                           chart_subject_data=chart_subject_data,
-                           chart_completion_labels=chart_completion_labels,
-                           chart_completion_data=chart_completion_data,
-                           difficulty_order=difficulty_order,
-                           attempted_list=attempted_list,
-                           correct_list=correct_list)
+                           student_count=student_count)
+
+
+def _conditional_json(etag, build):
+    """
+    JSON response tagged with `etag`; answers 304 without calling `build`
+    when the client already holds this version.
+    """
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    # Cache privately but revalidate every time, so unchanged data costs a 304
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+@app_routes.route("/api/charts/admin_summary")
+@snapshot_reads
+def admin_summary_charts():
+    if session.get("role") != "admin":
+        return jsonify({"error": "Access denied"}), 403
+
+    filters = {
+        "username_filter": request.args.get("username_filter"),
+        "quiz_filter": request.args.get("quiz_filter"),
+        "subject_filter": request.args.get("subject_filter"),
+        "date_filter": request.args.get("date_filter")
+    }
+    # Filters are part of the URL, so the version alone identifies the response
+    version = version_stamps(["data"])["data"]
+    # Vectorized over the cached attempt snapshot when NumPy is installed, brought up to this
+    # version first; a response built without it is tagged apart so it is not kept under the version.
+    # The attempt snapshot is built from live data, so it is skipped while reads come from the
+    # snapshot database and every series stays as of g.data_as_of.
+    snapshot = get_snapshot(min_version=version) if g.data_as_of is None else None
+    etag = f"admin-summary-{version}" + ("" if snapshot is not None else "-sql")
+    if filters["date_filter"]:
+        etag += f"-{datetime.now().date().isoformat()}"  # relative date ranges move at midnight
+
+    def build():
+        # Chart series are GROUP BY aggregates, so the query count does not grow with data size
+        data = summary_charts(filters)
+        if snapshot is not None:
+            data.update(snapshot.difficulty_accuracy())
+            data["score_histogram"] = snapshot.score_histogram()
+            data["time_distribution"] = snapshot.time_distribution()
+        else:
+            data.update(difficulty_stats())
+        data["data_as_of"] = g.data_as_of.isoformat(timespec="seconds") if g.data_as_of else None
+        return data
+
+    return _conditional_json(etag, build)
+
+
+@app_routes.route("/api/charts/admin_dashboard")
+@analytics_reads
+def admin_dashboard_charts():
+    if session.get("role") != "admin":
+        return jsonify({"error": "Access denied"}), 403
+
+    def build():
+        subject_counts, chapter_counts = load_catalog_counts()
+        return {
+            "totals": dashboard_totals(),
+            "subjects": {subject_id: {"quiz_count": c.quiz_count, "question_count": c.question_count}
+                         for subject_id, c in subject_counts.items()},
+            "chapters": {chapter_id: {"question_count": c.question_count, "avg_difficulty": c.avg_difficulty}
+                         for chapter_id, c in chapter_counts.items()},
+        }
+
+    return _conditional_json(f"admin-dashboard-{data_version('data')}", build)
+
+
+@app_routes.route("/api/charts/user_summary")
+@analytics_reads
+def user_summary_charts():
+    if session.get("role") != "user":
+        return jsonify({"error": "Access denied"}), 403
+
+    user_id = session.get("user_id")
+    resolution = request.args.get("timeline", "auto")
+    etag = f"user-summary-{user_id}-{data_version(f'user:{user_id}', 'catalog')}"
+
+    def build():
+        # From SQL rather than the attempt snapshot, which can be older than the attempt just submitted
+        data = difficulty_stats(user_id)
+        # Bucketed/downsampled to a capped point count
+        data["score_timeline"] = timeline_series(user_id, resolution)
+        data["time_spent_data"] = time_spent_series(user_id)
+        return data
 
+    return _conditional_json(etag, build)
+
+
+@app_routes.route("/admin/summary/export", methods=["GET"])
+@snapshot_reads
+def admin_summary_export():
+    if session.get("role") != "admin":
+        flash("Access denied! Admins only.", "danger")
+        return redirect(url_for("app_routes.login"))
+
+    fmt = request.args.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        flash(f"Unknown export format: {fmt}", "danger")
+        return redirect(url_for("app_routes.admin_summary"))
+    include_questions = request.args.get("include_questions") == "1"
+    filters = {
+        "username_filter": request.args.get("username_filter"),
+        "quiz_filter": request.args.get("quiz_filter"),
+        "subject_filter": request.args.get("subject_filter"),
+        "date_filter": request.args.get("date_filter")
+    }
+
+    # Rows are streamed from the database cursor as they are written; nothing is buffered
+    suffix = "_questions" if include_questions else ""
+    filename = f"attempts{suffix}_{datetime.now():%Y%m%d_%H%M%S}.{fmt}"
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    if g.data_as_of:
+        headers["X-Data-As-Of"] = g.data_as_of.isoformat(timespec="seconds")
+    return Response(
+        stream_with_context(snapshot_stream(export_attempts(filters, fmt, include_questions))),
+        mimetype=mimetype,
+        headers=headers
+    )
+
+
+@app_routes.route("/admin/item_analysis")
+@app_routes.route("/admin/item_analysis/<int:quiz_id>")
+@snapshot_reads
+def item_analysis_report(quiz_id=None):
+    if session.get("role") != "admin":
+        flash("Access denied! Admins only.", "danger")
+        return redirect(url_for("app_routes.login"))
+
+    try:
+        # Everything shown here was stored by the last item-analysis run; nothing is computed per request
+        if quiz_id:
+            quiz = Quiz.query.get_or_404(quiz_id)
+            items = db.session.query(ItemAnalysis, Question).join(
+                Question, Question.id == ItemAnalysis.question_id
+            ).filter(ItemAnalysis.quiz_id == quiz_id).order_by(Question.id).all()
+            return render_template("item_analysis.html", quiz=quiz, analysis=quiz.analysis, items=items,
+                                   available=analytics_available())
+
+        quizzes = db.session.query(Quiz, QuizAnalysis).outerjoin(
+            QuizAnalysis, QuizAnalysis.quiz_id == Quiz.id
+        ).order_by(Quiz.name).all()
+        return render_template("item_analysis.html", quizzes=quizzes, available=analytics_available())
+    except Exception as e:
+        flash(f"Error loading item analysis: {str(e)}", "danger")
+        return redirect(url_for("app_routes.admin_dashboard"))
+
+
+@app_routes.route("/admin/item_analysis/run", methods=["POST"])
+def run_item_analysis():
+    if session.get("role") != "admin":
+        flash("Access denied! Admins only.", "danger")
+        return redirect(url_for("app_routes.login"))
+
+    quiz_id = request.form.get("quiz_id", type=int)
+    try:
+        if quiz_id:
+            analyze_quiz(quiz_id)
+        else:
+            count = analyze_all_quizzes()
+        # The report reads the snapshot; have the background writer refresh it now rather than
+        # copying the whole database in this request
+        refreshing = ""
+        if SNAPSHOT_BIND in current_app.extensions["read_binds"]:
+            snapshot_writer.request_snapshot()
+            refreshing = " The report shows it once the analytics snapshot has refreshed, in a few moments."
+        if quiz_id:
+            flash("Item analysis updated." + refreshing, "success")
+            return redirect(url_for("app_routes.item_analysis_report", quiz_id=quiz_id))
+        flash(f"Item analysis updated for {count} quizzes." + refreshing, "success")
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error running item analysis: {str(e)}", "danger")
+    return redirect(url_for("app_routes.item_analysis_report"))
 
 
 @app_routes.route("/admin/add_subject", methods=["GET", "POST"])
@@ -464,10 +606,14 @@ def edit_chapter(chapter_id):
             name = bleach.clean(name)
             description = bleach.clean(description)
             
+            moved = str(chapter.subject_id) != str(subject_id)
             chapter.name = name
             chapter.subject_id = subject_id
             chapter.description = description
             db.session.commit()
+            if moved:
+                leaderboards.invalidate()
+                rebuild_rollups()
             
             flash("Chapter updated successfully!", "success")
             return redirect(url_for("app_routes.admin_dashboard"))
@@ -686,14 +832,8 @@ def add_question(quiz_id):
                             flash("Please select the correct option.", "danger")
                             return render_template("add_question.html", quiz=quiz, quiz_id=quiz_id)
 
-                image_path = None
-                if "image" in request.files:
-                    file = request.files["image"]
-                    if file and file.filename and allowed_file(file.filename):
-                        filename = secure_filename(file.filename)
-                        file_path = os.path.join(UPLOAD_FOLDER, filename)
-                        file.save(file_path)
-                        image_path = os.path.join("uploads", filename)
+                # Identical files are stored once, under their content hash
+                media = store_question_media()
 
                 new_question = Question(
                     quiz_id=quiz_id,
@@ -707,8 +847,8 @@ def add_question(quiz_id):
                     difficulty=difficulty,
                     question_type=question_type,
                     marks=marks,
-                    image_path=image_path,
-                    explanation=solution_text
+                    explanation=solution_text,
+                    **media
                 )
 
                 db.session.add(new_question)
@@ -798,6 +938,7 @@ def delete_quiz(quiz_id):
     # Delete the quiz
     db.session.delete(quiz)
     db.session.commit()
+    leaderboards.invalidate()
     
     flash("Quiz deleted successfully!", "success")
     return redirect(url_for("app_routes.quiz_management"))
@@ -821,7 +962,10 @@ def edit_question(question_id):
             difficulty = request.form.get("difficulty") or "Medium"
             question_type = request.form.get("question_type") or "single"
             marks = int(request.form.get("marks", 1))
+            negative_marks = float(request.form.get("negative_marks") or 0)
+            regrade_policy = request.form.get("regrade_policy") or current_app.config.get("MARKING_POLICY", "standard")
             explanation = request.form.get("explanation", "").strip()
+            previous_key = (question.correct_option, question.question_type, question.marks, question.negative_marks)
             
             if not question_statement or not option1 or not option2:
                 flash("Question and at least two options are required.", "danger")
@@ -843,6 +987,7 @@ def edit_question(question_id):
             question.difficulty = difficulty
             question.question_type = question_type
             question.marks = marks
+            question.negative_marks = negative_marks
             question.explanation = explanation
             
             # Handle different question types properly
@@ -871,17 +1016,19 @@ def edit_question(question_id):
                     return render_template("edit_question.html", question=question)
                 question.correct_option = correct_option
 
-            # Handle image upload if present
-            if "image" in request.files:
-                file = request.files["image"]
-                if file and file.filename and allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    file_path = os.path.join(UPLOAD_FOLDER, filename)
-                    file.save(file_path)
-                    question.image_path = os.path.join("uploads", filename) # Store relative path
+            # Replace any media that was re-uploaded; reference counts follow the columns
+            for column, path in store_question_media().items():
+                setattr(question, column, path)
 
+            # Answer key or marking changed: bring existing attempts and scores up to date in the
+            # same transaction, so a failed regrade leaves neither the edit nor the attempts half-applied
+            result = None
+            if previous_key != (question.correct_option, question.question_type, question.marks, question.negative_marks):
+                result = regrade_question(question.id, regrade_policy)
             db.session.commit()
             flash("Question updated successfully!", "success")
+            if result is not None and result.attempts_changed:
+                flash(f"Regraded {result.attempts_changed} attempts across {result.scores_changed} scores.", "info")
             return redirect(url_for("app_routes.quiz_management"))
         
         return render_template("edit_question.html",question=question)
@@ -891,6 +1038,24 @@ def edit_question(question_id):
         flash(f"Error updating question: {str(e)}", "danger")
         return render_template("edit_question.html", question=question)
   
+@app_routes.route("/admin/regrade_question/<int:question_id>", methods=["POST"])
+def admin_regrade_question(question_id):
+    if session.get("role") != "admin":
+        flash("Access denied! Admins only.", "danger")
+        return redirect(url_for("app_routes.login"))
+    
+    try:
+        Question.query.get_or_404(question_id)
+        policy = request.form.get("policy") or current_app.config.get("MARKING_POLICY", "standard")
+        result = regrade_question(question_id, policy)
+        flash(f"Regraded {result.attempts_changed} of {result.attempts_checked} attempts "
+              f"across {result.scores_changed} scores.", "success")
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error regrading question: {str(e)}", "danger")
+    
+    return redirect(url_for("app_routes.quiz_management"))
+
 @app_routes.route("/admin/delete_question/<int:question_id>", methods=["GET", "POST"])  # Fixed: Added URL parameter and POST method
 def delete_question(question_id):
     if session.get("role") != "admin":
@@ -933,15 +1098,15 @@ def view_users():
             flash("User not found.", "danger")
             return redirect(url_for("app_routes.view_users"))
         # Get all quiz attempts for the given user
-        attempts = Score.query.filter_by(user_id=user_id).order_by(Score.time_stamp_of_attempt.desc()).all()
+        attempts = Score.query.options(joinedload(Score.quiz)).filter_by(user_id=user_id) \
+            .order_by(Score.time_stamp_of_attempt.desc()).all()
         # For each attempt, calculate percentage and max possible score
         detailed_attempts = []
         for attempt in attempts:
-            quiz = Quiz.query.get(attempt.quiz_id)
+            quiz = attempt.quiz
             if not quiz:
                 continue
-            questions = Question.query.filter_by(quiz_id=quiz.id).all()
-            max_score = sum(q.marks for q in questions) if questions else 0
+            max_score = quiz.total_marks
             percentage = (attempt.total_scored / max_score * 100) if max_score > 0 else 0
             detailed_attempts.append({
                 'quiz_name': quiz.name,
@@ -954,9 +1119,10 @@ def view_users():
             })
         return render_template("view_users.html", user=user, attempts=detailed_attempts)
     else:
-        # No user selected, display list of all users.
+        # No user selected, display list of all users with their stats loaded in one batch
         users = User.query.all()
-        return render_template("view_users.html", users=users)
+        user_stats = load_user_stats(u.id for u in users)
+        return render_template("view_users.html", users=users, user_stats=user_stats)
 
 
 @app_routes.route("/admin/add_score_comment_form/<int:score_id>", methods=["GET"])
@@ -1133,17 +1299,17 @@ def user_scores():
         user_id = session.get('user_id')
         
         # Get all scores for the current user
-        user_scores = Score.query.filter_by(user_id=user_id).order_by(Score.time_stamp_of_attempt.desc()).all()
+        user_scores = Score.query.options(joinedload(Score.quiz)).filter_by(user_id=user_id) \
+            .order_by(Score.time_stamp_of_attempt.desc()).all()
         
         scores = []
         for score in user_scores:
-            quiz = Quiz.query.get(score.quiz_id)
+            quiz = score.quiz
             if not quiz:
                 continue
             
             # Calculate score percentage
-            questions = Question.query.filter_by(quiz_id=quiz.id).all()
-            max_possible_score = sum(q.marks for q in questions) if questions else 0
+            max_possible_score = quiz.total_marks
             score_percentage = (score.total_scored / max_possible_score * 100) if max_possible_score > 0 else 0
             
             # Add data for display
@@ -1164,6 +1330,7 @@ def user_scores():
         return redirect(url_for("app_routes.user_dashboard"))
 
 @app_routes.route("/user/summary")
+@analytics_reads
 def user_summary():
     if session.get("role") != "user":
         flash("Access denied! Users only.", "danger")
@@ -1172,61 +1339,20 @@ def user_summary():
     try:
         user_id = session.get("user_id")
         user = User.query.get(user_id)
-        user_scores = Score.query.filter_by(user_id=user_id).order_by(Score.time_stamp_of_attempt.asc()).all()
         
         # === 1) Stat Cards ===
-        quiz_ids = {score.quiz_id for score in user_scores}
-        total_quizzes = len(quiz_ids)
-        average_score = user.average_score if user_scores else 0.0
-        total_questions_attempted = sum(s.total_questions for s in user_scores)
-        total_correct = sum(s.questions_correct for s in user_scores)
-        overall_accuracy = (total_correct / total_questions_attempted * 100) if total_questions_attempted > 0 else 0.0
-
-        # === 2) Time Spent per Quiz (for bar chart) ===
-        time_spent_data = [
-            {"quiz_name": s.quiz.name, "time_spent": round(s.time_spent / 60, 1)}  # in minutes
-            for s in user_scores if s.quiz and s.time_spent is not None
-        ]
-
-        # === 3) Performance Over Time (for line chart) ===
-        score_timeline = [
-            {"date": s.time_stamp_of_attempt.strftime("%Y-%m-%d"), 
-             "score": round((s.total_scored / s.quiz.total_marks * 100), 1) if s.quiz.total_marks > 0 else 0}
-            for s in user_scores if s.quiz
-        ]
-
-        # === 4) Difficulty Level Analysis (Grouped Bar) ===
-        difficulties = ["Easy", "Medium", "Hard"]
-        diff_stats = {d: {"attempted": 0, "correct": 0} for d in difficulties}
-
-        all_attempts = QuestionAttempt.query \
-            .join(Score, QuestionAttempt.score_id == Score.id) \
-            .filter(Score.user_id == user_id).all()
-
-        for attempt in all_attempts:
-            question = Question.query.get(attempt.question_id)
-            if question and question.difficulty in difficulties:
-                diff_stats[question.difficulty]["attempted"] += 1
-                if attempt.is_correct:
-                    diff_stats[question.difficulty]["correct"] += 1
+        totals = summary_totals(user_id)
+        average_score = user.average_score if totals["total_quizzes"] else 0.0
 
-        difficulty_order = difficulties
-        attempted_list = [diff_stats[d]["attempted"] for d in difficulty_order]
-        correct_list = [diff_stats[d]["correct"] for d in difficulty_order]
+        # === 2-4) Charts are loaded by the page from user_summary_charts after the HTML ===
+        timeline_resolution = request.args.get("timeline", "auto")
 
         # === Final: Render template ===
         return render_template(
             "user_summary.html",
-            total_quizzes=total_quizzes,
             average_score=average_score,
-            total_questions_attempted=total_questions_attempted,
-            total_correct=total_correct,
-            overall_accuracy=overall_accuracy,
-            score_timeline=score_timeline,
-            time_spent_data=time_spent_data,
-            difficulty_order=difficulty_order,
-            attempted_list=attempted_list,
-            correct_list=correct_list
+            timeline_resolution=timeline_resolution,
+            **totals
         )
 
     except Exception as e:
@@ -1259,21 +1385,49 @@ def attempt_quiz(quiz_id):
             flash("You have already taken this quiz.", "info")
             return redirect(url_for("app_routes.view_attempt_details", quiz_id=quiz_id))
         
-        # Remove joinedload since Question model doesn't have an "options" attribute.
-        questions = Question.query.filter_by(quiz_id=quiz_id).all()
+        # Serialized and pre-rendered once per question version (warmed before start_time)
+        content = get_quiz_content(quiz_id)
         
-        if not questions:
+        if not content.question_count:
             flash("This quiz has no questions.", "warning")
             return redirect(url_for("app_routes.user_dashboard"))
         
         time_duration = quiz.time_duration or 0
         end_time = datetime.now() + timedelta(minutes=time_duration)
         
-        return render_template("attempt_quiz.html", quiz=quiz, questions=questions, end_time=end_time)
+        return render_template("attempt_quiz.html", quiz=quiz, question_count=content.question_count,
+                               question_block=Markup(content.block()), end_time=end_time)
     except Exception as e:
         flash(f"Error loading quiz: {str(e)}", "danger")
         return redirect(url_for("app_routes.user_dashboard"))
 
+
+@app_routes.route("/api/quiz/<int:quiz_id>/content")
+def quiz_content(quiz_id):
+    if session.get("role") != "user":
+        return jsonify({"error": "Access denied"}), 403
+
+    quiz = db.session.get(Quiz, quiz_id)
+    if quiz is None:
+        return jsonify({"error": "Quiz not found"}), 404
+    now = datetime.now()
+    if (quiz.start_time and now < quiz.start_time) or (quiz.end_time and now > quiz.end_time):
+        return jsonify({"error": "Quiz not available"}), 403
+
+    content = get_quiz_content(quiz_id)
+    if request.if_none_match.contains(content.etag):
+        response = current_app.response_class(status=304)
+    elif "gzip" in request.accept_encodings:
+        # Stored compressed, so the common case is sent without re-encoding
+        response = current_app.response_class(content.payload_gz, mimetype="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = jsonify(content.payload())
+    response.set_etag(content.etag)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
 def search_quizzes():
     if session.get("role") != "user":
         return jsonify({'error': 'Access denied'}), 403
@@ -1330,133 +1484,30 @@ def submit_quiz(quiz_id):
             flash("You have already taken this quiz.", "info")
             return redirect(url_for("app_routes.view_attempt_details", quiz_id=quiz_id))
 
-        # Build time dictionary per question
-        times = {}
-        for key, value in request.form.items():
-            if key.startswith("times["):
-                qid = key[6:-1]
-                try:
-                    times[qid] = int(value.strip())
-                except (ValueError, AttributeError):
-                    times[qid] = 0
-
-        total_score = 0
-        questions_correct = 0
-        questions_answered = 0
-        computed_total_time = 0
-        
-        # Create Score object
-        new_score = Score(
-            quiz_id=quiz_id,
-            user_id=user_id,
-            time_spent=0,
-            time_stamp_of_attempt=now,
-            completion_status="Completed"
-        )
-        db.session.add(new_score)
-        db.session.commit()
-
-        # Evaluate answers
-        current_app.logger.info(f"Processing quiz {quiz_id} for user {user_id}")
-        questions = Question.query.filter_by(quiz_id=quiz_id).all()
-        for question in questions:
-            qid_str = str(question.id)
-            is_correct = False
-            marks_awarded = 0
-            question_type = question.question_type.lower() if question.question_type else ""
-            user_answer = None
-
-            current_app.logger.info(f"Question {question.id}: type={question_type}, statement={question.question_statement[:20]}...")
-
-            if question_type == "single":
-                user_answer = request.form.get(f"answers[{question.id}]")
-                current_app.logger.info(f"Single-type: user_answer={user_answer}, correct_option={question.correct_option}")
-                if user_answer is not None:
-                    questions_answered += 1
-                    computed_total_time += times.get(qid_str, 0)
-                    user_answer = user_answer.strip().lower()
-                    correct_option = question.correct_option.strip() if question.correct_option else ""
-
-                    # Handle correct_option
-                    correct_text = ""
-                    if correct_option.startswith("option") and correct_option[6:].isdigit() and 1 <= int(correct_option[6:]) <= 6:
-                        option_index = correct_option[6:]  # e.g., "4" from "option4"
-                        option_field = f"option{option_index}"
-                        correct_text = getattr(question, option_field, "").strip().lower()
-                        current_app.logger.info(f"Option-based: option_field={option_field}, correct_text={correct_text}")
-                    elif correct_option.isdigit() and 1 <= int(correct_option) <= 6:
-                        option_field = f"option{correct_option}"
-                        correct_text = getattr(question, option_field, "").strip().lower()
-                        current_app.logger.info(f"Index-based: option_field={option_field}, correct_text={correct_text}")
-                    elif correct_option:
-                        correct_text = correct_option.lower()
-                        current_app.logger.info(f"Text-based: correct_text={correct_text}")
-                    else:
-                        current_app.logger.warning(f"Invalid correct_option '{correct_option}' for question {question.id}")
-
-                    # Compare answers
-                    is_correct = user_answer == correct_text and correct_text != ""
-                    marks_awarded = question.marks if is_correct else 0
-                    current_app.logger.info(f"Comparison: user_answer={user_answer}, correct_text={correct_text}, is_correct={is_correct}, marks={marks_awarded}")
-            # Handle other question types (simplified)
-            elif question_type == "true_false":
-                user_answer = request.form.get(f"answers[{question.id}]")
-                if user_answer is not None:
-                    questions_answered += 1
-                    computed_total_time += times.get(qid_str, 0)
-                    is_correct = user_answer.lower() == question.correct_option.lower()
-                    marks_awarded = question.marks if is_correct else 0
-            elif question_type == "multiple":
-                selected_options = request.form.getlist(f"answers[{question.id}][]")
-                if selected_options:
-                    questions_answered += 1
-                    computed_total_time += times.get(qid_str, 0)
-                    correct_set = set(opt.strip().lower() for opt in question.correct_option.split(","))
-                    selected_set = set(opt.strip().lower() for opt in selected_options)
-                    is_correct = correct_set == selected_set
-                    marks_awarded = question.marks if is_correct else question.marks * (len(correct_set & selected_set) / len(correct_set))
-            elif question_type == "integer":
-                user_answer = request.form.get(f"answers[{question.id}]")
-                if user_answer is not None:
-                    questions_answered += 1
-                    computed_total_time += times.get(qid_str, 0)
-                    try:
-                        is_correct = int(user_answer) == int(question.correct_option)
-                        marks_awarded = question.marks if is_correct else 0
-                    except ValueError:
-                        is_correct = False
-                        marks_awarded = 0
-
-            total_score += marks_awarded
-            if is_correct:
-                questions_correct += 1
-
-            # Save answer string
-            stored_user_answer = ", ".join(selected_options) if question_type == "multiple" else (user_answer or "")
-            current_app.logger.info(f"Stored answer: {stored_user_answer}, is_correct={is_correct}")
-
-            # Record attempt
-            db.session.add(QuestionAttempt(
-                score_id=new_score.id,
-                question_id=question.id,
-                user_id=user_id,
-                user_answer=stored_user_answer,
-                is_correct=is_correct,
-                marks_awarded=marks_awarded,
-                time_spent=times.get(qid_str, 0)
-            ))
-
-        final_total_time = total_time_from_form if total_time_from_form > 0 else computed_total_time
-        
-        # Final update
-        new_score.total_scored = total_score
-        new_score.questions_correct = questions_correct
-        new_score.questions_answered = questions_answered
-        new_score.total_questions = len(questions)
-        new_score.time_spent = final_total_time
-
-        db.session.commit()
-        current_app.logger.info(f"Quiz submitted: score={total_score}, correct={questions_correct}/{len(questions)}")
+        queued = PendingSubmission.query.filter(
+            PendingSubmission.quiz_id == quiz_id,
+            PendingSubmission.user_id == user_id,
+            PendingSubmission.status.in_(["pending", "grading"])
+        ).first()
+        if queued:
+            return redirect(url_for("app_routes.pending_results", submission_id=queued.id))
+
+        # Under exam-end load only store the raw answers; the grading pool does the rest
+        if current_app.config.get("ASYNC_GRADING"):
+            pending = enqueue_submission(quiz_id, user_id, request.form, total_time_from_form)
+            flash("Quiz submitted successfully! Your answers are being graded.", "success")
+            return redirect(url_for("app_routes.pending_results", submission_id=pending.id))
+
+        # Grade the whole form in one pass, then write Score and attempts in one transaction
+        answer_key = get_answer_key(quiz_id)
+        answers, times = answers_from_form(answer_key, request.form)
+        graded = grade_submission(answer_key, answers, times)
+
+        final_total_time = total_time_from_form if total_time_from_form > 0 else graded.answered_time
+        new_score = record_submission(quiz_id, user_id, graded, final_total_time, "Completed", now)
+        total_score = graded.total_score
+        current_app.logger.info("Quiz %s submitted by user %s: score=%s, correct=%s/%s",
+                                quiz_id, user_id, total_score, graded.questions_correct, graded.total_questions)
 
         flash(f"Quiz submitted successfully! You scored {total_score:.1f} points.", "success")
         return redirect(url_for("app_routes.quiz_results", score_id=new_score.id))
@@ -1482,62 +1533,27 @@ def quiz_results(score_id):
             return redirect(url_for("app_routes.user_dashboard"))
         
         quiz = Quiz.query.get(score.quiz_id)
-        questions = Question.query.filter_by(quiz_id=quiz.id).all()
-        total_marks = sum(q.marks for q in questions)
+        answer_key = get_answer_key(quiz.id)
+        total_marks = quiz.total_marks
         score_percentage = (score.total_scored / total_marks * 100) if total_marks > 0 else 0
         
-        avg_score = db.session.query(func.avg(Score.total_scored)).filter(
-            Score.quiz_id == quiz.id,
-            Score.user_id != score.user_id
-        ).scalar() or 0
+        # Comparison values come from the in-memory score distribution, not a full aggregate
+        distribution = get_distribution(quiz.id)
+        avg_score = distribution.average(exclude=score.total_scored)
         avg_percentage = (avg_score / total_marks * 100) if total_marks > 0 else 0
+        median_percentage = (distribution.median() / total_marks * 100) if total_marks > 0 else 0
+        rank = distribution.rank(score.total_scored)
+        percentile = score.percentile if score.percentile is not None else distribution.percentile(score.total_scored)
         
         attempts = QuestionAttempt.query.filter_by(score_id=score.id).all()
         
-        def get_correct_answer_text(question):
-            correct_option = (question.correct_option or "").strip()
-            if not correct_option:
-                return ""
-            if question.question_type.lower() == "multiple":
-                tokens = [token.strip() for token in correct_option.split(",") if token.strip()]
-                options = [
-                    (question.option1 or "").strip(),
-                    (question.option2 or "").strip(),
-                    (question.option3 or "").strip(),
-                    (question.option4 or "").strip(),
-                    (question.option5 or "").strip()
-                ]
-                result = []
-                for token in tokens:
-                    if token.isdigit() or (token.lower().startswith("option") and token[6:].isdigit()):
-                        index = int(token[6:] if token.lower().startswith("option") else token) - 1
-                        if 0 <= index < len(options):
-                            result.append(options[index])
-                    else:
-                        result.append(token)
-                return ", ".join(result)
-            else:
-                if correct_option.isdigit() or (correct_option.lower().startswith("option") and correct_option[6:].isdigit()):
-                    index = int(correct_option[6:] if correct_option.lower().startswith("option") else correct_option) - 1
-                    options = [
-                        (question.option1 or "").strip(),
-                        (question.option2 or "").strip(),
-                        (question.option3 or "").strip(),
-                        (question.option4 or "").strip(),
-                        (question.option5 or "").strip()
-                    ]
-                    if 0 <= index < len(options):
-                        return options[index]
-                    return correct_option
-                return correct_option
-        
         enhanced_attempts = []
         for attempt in attempts:
             question = Question.query.get(attempt.question_id)
             enhanced_attempts.append({
                 "attempt": attempt,
                 "question": question,
-                "correct_answer": get_correct_answer_text(question)
+                "correct_answer": answer_key.correct_answer_text(attempt.question_id)
             })
 
         avg_time_per_question = score.time_spent / score.total_questions if score.total_questions > 0 else 0
@@ -1545,15 +1561,15 @@ def quiz_results(score_id):
         min_time = min(times) if times else 0
         max_time = max(times) if times else 0
 
-        for a in enhanced_attempts:
-            print(f"Q: {a['question'].question_statement[:20]}..., Time: {a['attempt'].time_spent}")
-
-
         return render_template("quiz_results.html",
             score=score,
             quiz=quiz,
             score_percentage=score_percentage,
             avg_percentage=avg_percentage,
+            median_percentage=median_percentage,
+            rank=rank,
+            total_attempts=len(distribution),
+            percentile=percentile,
             attempts=enhanced_attempts,
             avg_time_per_question=avg_time_per_question,
             min_time=min_time,
@@ -1564,6 +1580,24 @@ def quiz_results(score_id):
         return redirect(url_for("app_routes.user_dashboard"))
     
 
+@app_routes.route("/user/quiz_results/pending/<int:submission_id>")
+def pending_results(submission_id):
+    if session.get("role") != "user":
+        flash("Access denied! Users only.", "danger")
+        return redirect(url_for("app_routes.login"))
+    
+    pending = PendingSubmission.query.get_or_404(submission_id)
+    if pending.user_id != session.get("user_id"):
+        flash("Access denied! You can only view your own results.", "danger")
+        return redirect(url_for("app_routes.user_dashboard"))
+    
+    if pending.status == "done" and pending.score_id:
+        return redirect(url_for("app_routes.quiz_results", score_id=pending.score_id))
+    
+    quiz = Quiz.query.get(pending.quiz_id)
+    return render_template("quiz_results.html", pending=pending, quiz=quiz)
+
+
 @app_routes.route("/user/view_attempt_details/<int:quiz_id>")
 def view_attempt_details(quiz_id):
     if session.get("role") != "user":
@@ -1640,10 +1674,135 @@ def view_attempt_details(quiz_id):
         return redirect(url_for("app_routes.user_dashboard"))
 
 
+@app_routes.route("/leaderboard")
+@analytics_reads
+def leaderboard():
+    if session.get("role") not in ("user", "admin"):
+        flash("Please log in to view the leaderboard.", "danger")
+        return redirect(url_for("app_routes.login"))
+    
+    try:
+        scope = request.args.get("scope", "week")
+        if scope not in LEADERBOARD_SCOPES:
+            scope = "week"
+        scope_id = request.args.get("id", type=int)
+        page = max(request.args.get("page", 1, type=int), 1)
+        per_page = 20
+        
+        quizzes = Quiz.query.order_by(Quiz.name).all()
+        subjects = Subject.query.order_by(Subject.name).all()
+        if scope == "quiz" and scope_id is None and quizzes:
+            scope_id = quizzes[0].id
+        if scope == "subject" and scope_id is None and subjects:
+            scope_id = subjects[0].id
+        
+        board = leaderboards.get(scope, scope_id)
+        entries = board.page(page, per_page)
+        usernames = dict(db.session.query(User.id, User.username).filter(
+            User.id.in_([user_id for _, user_id, _ in entries])).all())
+        
+        user_id = session.get("user_id")
+        return render_template("leaderboard.html",
+            scope=scope,
+            scope_id=scope_id,
+            quizzes=quizzes,
+            subjects=subjects,
+            entries=[{'rank': rank, 'username': usernames.get(uid, 'Unknown'), 'points': points,
+                      'is_current_user': uid == user_id}
+                     for rank, uid, points in entries],
+            page=page,
+            total_pages=max((len(board) + per_page - 1) // per_page, 1),
+            user_rank=board.rank(user_id),
+            user_points=board.points.get(user_id),
+            total_entries=len(board)
+        )
+    except Exception as e:
+        flash(f"Error loading leaderboard: {str(e)}", "danger")
+        return redirect(url_for("app_routes.login"))
+
+
 #########################
 # API ROUTES (for AJAX)
 #########################
 
+def _upload_status(upload):
+    # Chunks are deleted once assembled
+    received = list(range(upload.chunk_count)) if upload.media_path else received_chunks(upload)
+    return {
+        "id": upload.id,
+        "chunk_size": upload.chunk_size,
+        "chunk_count": upload.chunk_count,
+        "received": received,
+        "missing": sorted(set(range(upload.chunk_count)) - set(received)),
+        "media_path": upload.media_path,
+    }
+
+
+def _own_upload(upload_id):
+    upload = db.session.get(MediaUpload, upload_id)
+    if upload is None or upload.user_id != session.get("user_id"):
+        return None
+    return upload
+
+
+@app_routes.route("/api/uploads", methods=["POST"])
+def create_upload():
+    """Start a resumable upload: {"filename", "size", "kind"} -> chunk size and count"""
+    if session.get("role") != "admin":
+        return jsonify({"error": "Access denied"}), 403
+    data = request.get_json(silent=True) or {}
+    try:
+        upload = start_upload(session["user_id"], data.get("filename"), data.get("size"), data.get("kind"))
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(_upload_status(upload)), 201
+
+
+@app_routes.route("/api/uploads/<upload_id>")
+def upload_status(upload_id):
+    """Which chunks the server already has, so an interrupted client resumes from there"""
+    if session.get("role") != "admin":
+        return jsonify({"error": "Access denied"}), 403
+    upload = _own_upload(upload_id)
+    if upload is None:
+        return jsonify({"error": "Upload not found"}), 404
+    return jsonify(_upload_status(upload))
+
+
+@app_routes.route("/api/uploads/<upload_id>/chunks/<int:index>", methods=["PUT"])
+def upload_chunk(upload_id, index):
+    """Raw chunk bytes in the body, their SHA-256 (hex) in X-Chunk-SHA256. Re-sending a chunk is harmless."""
+    if session.get("role") != "admin":
+        return jsonify({"error": "Access denied"}), 403
+    upload = _own_upload(upload_id)
+    if upload is None:
+        return jsonify({"error": "Upload not found"}), 404
+    try:
+        # request.stream is read piecewise, never buffered whole
+        write_chunk(upload, index, request.stream, request.content_length,
+                    request.headers.get("X-Chunk-SHA256"))
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(_upload_status(upload))
+
+
+@app_routes.route("/api/uploads/<upload_id>/complete", methods=["POST"])
+def finish_upload(upload_id):
+    """Assemble the chunks into the media store; optional {"sha256"} checks the whole file"""
+    if session.get("role") != "admin":
+        return jsonify({"error": "Access denied"}), 403
+    upload = _own_upload(upload_id)
+    if upload is None:
+        return jsonify({"error": "Upload not found"}), 404
+    try:
+        complete_upload(upload, (request.get_json(silent=True) or {}).get("sha256"))
+    except UploadBusy as e:
+        return jsonify({"error": str(e)}), 409
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(_upload_status(upload))
+
+
 @app_routes.route("/api/chapters/<int:subject_id>")  # Fixed: Added URL parameter
 def get_chapters(subject_id):
     try:
@@ -1655,6 +1814,21 @@ def get_chapters(subject_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app_routes.route("/api/submission_status/<int:submission_id>")
+def submission_status(submission_id):
+    """Poll target for the grading... state of quiz_results"""
+    if session.get("role") != "user":
+        return jsonify({'error': 'Access denied'}), 403
+    
+    pending = PendingSubmission.query.get_or_404(submission_id)
+    if pending.user_id != session.get("user_id"):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    response = {'status': pending.status}
+    if pending.status == "done" and pending.score_id:
+        response['redirect'] = url_for('app_routes.quiz_results', score_id=pending.score_id)
+    return jsonify(response)
+
 @app_routes.route("/api/quiz_timeout", methods=["POST"])
 def quiz_timeout():
     """Handle quiz timeout via AJAX"""
@@ -1674,74 +1848,11 @@ def quiz_timeout():
         user_id = session.get('user_id')
         
         # Calculate partial score from answered questions
-        questions = Question.query.filter_by(quiz_id=quiz_id).all()
-        total_score = 0
-        questions_correct = 0
-        questions_answered = len(answers)
-        
-        # Create a new score record
-        new_score = Score(
-            quiz_id=quiz_id,
-            user_id=user_id,
-            time_spent=total_time,
-            time_stamp_of_attempt=datetime.now(),
-            completion_status='Timed Out'
-        )
-        
-        db.session.add(new_score)
-        db.session.commit()
-        
-        # Process answered questions
-        for question in questions:
-            q_id = str(question.id)
-            if q_id in answers and answers[q_id]:
-                user_answer = answers[q_id]
-                
-                # Check if the answer is correct
-                is_correct = False
-                marks_awarded = 0
-                
-                if question.question_type == 'multiple':
-                    correct_options = set(question.correct_option.split(','))
-                    selected_options = set(user_answer.split(','))
-                    
-                    if correct_options == selected_options:
-                        is_correct = True
-                        marks_awarded = question.marks
-                    else:
-                        if correct_options:
-                            common = len(correct_options & selected_options)
-                            total = len(correct_options)
-                            marks_awarded = question.marks * (common / total)
-                else:
-                    is_correct = user_answer == question.correct_option
-                    marks_awarded = question.marks if is_correct else 0
-                
-                if is_correct:
-                    questions_correct += 1
-                
-                total_score += marks_awarded
-                
-                # Record the question attempt
-                attempt = QuestionAttempt(
-                    score_id=new_score.id,
-                    question_id=question.id,
-                    user_id=user_id,
-                    user_answer=user_answer,
-                    is_correct=is_correct,
-                    marks_awarded=marks_awarded,
-                    attempt_time=datetime.now()
-                )
-                
-                db.session.add(attempt)
-        
-        # Update the score with calculated values
-        new_score.total_scored = total_score
-        new_score.questions_correct = questions_correct
-        new_score.questions_answered = questions_answered
-        new_score.total_questions = len(questions)
-        
-        db.session.commit()
+        answer_key = get_answer_key(quiz_id)
+        answers = {int(q_id): answer for q_id, answer in answers.items()
+                   if str(q_id).isdigit() and answer}
+        graded = grade_submission(answer_key, answers, record_unanswered=False)
+        new_score = record_submission(quiz_id, user_id, graded, total_time, 'Timed Out')
         
         return jsonify({
             'success': True,
@@ -0,0 +1,204 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+import click
+from flask import current_app, g
+from flask.cli import with_appcontext
+from sqlalchemy import event
+from sqlalchemy.exc import DisconnectionError
+from db_profile import ANALYTICS_BIND, reading_from, pragma_listener, profile_pragmas, is_file_database
+from models import db
+
+# Flask-SQLAlchemy bind reading the periodic snapshot copy of the database
+SNAPSHOT_BIND = "snapshot"
+
+# Take a new snapshot after this many seconds when the app config does not set
+# SNAPSHOT_DB_INTERVAL (0 disables the snapshot)
+DEFAULT_INTERVAL = 300
+
+# Per-connection PRAGMAs that do not apply to a read-only single-file copy
+_WRITER_PRAGMAS = {"journal_mode", "journal_size_limit", "synchronous", "busy_timeout", "auto_vacuum"}
+
+
+def snapshot_path(app=None):
+    app = app or current_app
+    return app.config.get("SNAPSHOT_DB_PATH") or os.path.join(app.instance_path, "analytics_snapshot.db")
+
+
+def _inode(path):
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+
+def snapshot_time():
+    """When the current snapshot was started (everything committed before is in it), or None"""
+    try:
+        return datetime.fromtimestamp(os.path.getmtime(snapshot_path()))
+    except OSError:
+        return None
+
+
+def take_snapshot():
+    """
+    Copy the live database into the snapshot file with the SQLite online backup
+    API, then swap it in atomically. Returns the snapshot time.
+    """
+    source_path = db.engines[None].url.database
+    target = snapshot_path()
+    partial = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    started = time.time()
+    source = sqlite3.connect(source_path)
+    destination = sqlite3.connect(partial)
+    try:
+        # One step: under WAL that is a single read transaction, which writers do not wait for.
+        # A stepped copy restarts whenever another connection writes, so under load it never ends
+        source.backup(destination, pages=-1)
+        # One self-contained file: no -wal/-shm left behind to mismatch a swapped-in copy
+        destination.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        source.close()
+        destination.close()
+    try:
+        os.utime(partial, (started, started))
+        os.replace(partial, target)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return datetime.fromtimestamp(started)
+
+
+def snapshot_reads(view):
+    """
+    View decorator: queries run on the snapshot when one exists, else on the
+    live analytics engine. g.data_as_of is the snapshot time, or None when live.
+    """
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        as_of = snapshot_time()
+        with reading_from(SNAPSHOT_BIND if as_of else ANALYTICS_BIND) as bind:
+            g.data_as_of = as_of if bind == SNAPSHOT_BIND else None
+            return view(*args, **kwargs)
+    return wrapped
+
+
+def snapshot_stream(rows):
+    """Generator wrapper for streamed responses, which are produced after the view returns"""
+    with reading_from(SNAPSHOT_BIND if snapshot_time() else ANALYTICS_BIND):
+        yield from rows
+
+
+def data_as_of():
+    return g.get("data_as_of")
+
+
+class SnapshotWriter:
+    """Background thread that refreshes the snapshot every SNAPSHOT_DB_INTERVAL seconds, or when asked to"""
+
+    def __init__(self):
+        self.app = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._requested = threading.Event()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions["snapshot_writer"] = self
+        # Started by the first request, so CLI commands and imports stay thread-free
+        app.before_request(self.start)
+
+    def start(self):
+        if self._thread is not None or self.app is None or SNAPSHOT_BIND not in self.app.extensions["read_binds"]:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self._requested.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def request_snapshot(self):
+        """Take a new snapshot in the background now instead of at the next interval"""
+        self.start()
+        self._requested.set()
+
+    def _run(self):
+        interval = self.app.config.get("SNAPSHOT_DB_INTERVAL", DEFAULT_INTERVAL)
+        while not self._stopping.is_set():
+            requested = self._requested.is_set()
+            self._requested.clear()
+            with self.app.app_context():
+                # Every worker process runs a writer; a fresh enough file was written by another one
+                as_of = snapshot_time()
+                age = (datetime.now() - as_of).total_seconds() if as_of else interval
+                if age >= interval or requested:
+                    try:
+                        start = time.perf_counter()
+                        take_snapshot()
+                        current_app.logger.info(f"Analytics snapshot taken in {time.perf_counter() - start:.2f}s")
+                        age = 0
+                    except Exception as e:
+                        current_app.logger.error(f"Error taking analytics snapshot: {str(e)}")
+            self._requested.wait(max(interval - age, 1))
+
+
+snapshot_writer = SnapshotWriter()
+
+
+def configure(app):
+    """Add the snapshot bind to the app config; runs before db.init_app like db_profile.configure"""
+    path = snapshot_path(app)
+    # Opened read-only by URI: connecting before the first snapshot fails instead of creating an empty file
+    bind = {
+        "url": "sqlite:///" + path,
+        "creator": lambda: sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False),
+    }
+    app.config["SQLALCHEMY_BINDS"] = dict(app.config.get("SQLALCHEMY_BINDS") or {}, **{SNAPSHOT_BIND: bind})
+    if app.config.get("SNAPSHOT_DB_INTERVAL", DEFAULT_INTERVAL) and is_file_database(app.config["SQLALCHEMY_DATABASE_URI"]):
+        app.extensions.setdefault("read_binds", set()).add(SNAPSHOT_BIND)
+
+
+def init_app(app):
+    with app.app_context():
+        engine = db.engines[SNAPSHOT_BIND]
+    # The bind has no tables of its own; keep create_all/drop_all off the snapshot
+    db.metadatas.pop(SNAPSHOT_BIND, None)
+    path = snapshot_path(app)
+    pragmas = {name: value for name, value in profile_pragmas(app).items() if name not in _WRITER_PRAGMAS}
+    event.listen(engine, "connect", pragma_listener(pragmas, read_only=True))
+
+    @event.listens_for(engine, "connect")
+    def remember_file(dbapi_connection, connection_record):
+        connection_record.info["snapshot_inode"] = _inode(path)
+
+    @event.listens_for(engine, "checkout")
+    def check_file(dbapi_connection, connection_record, connection_proxy):
+        # Pooled connections still read the replaced file; the pool reconnects to the new one
+        if connection_record.info.get("snapshot_inode") != _inode(path):
+            raise DisconnectionError("Analytics snapshot was replaced")
+
+    snapshot_writer.init_app(app)
+    app.jinja_env.globals["data_as_of"] = data_as_of
+    app.cli.add_command(snapshot_db_command)
+
+
+@click.command("snapshot-db")
+@with_appcontext
+def snapshot_db_command():
+    """Copy the database into the analytics snapshot now."""
+    if SNAPSHOT_BIND not in current_app.extensions["read_binds"]:
+        raise click.UsageError("The analytics snapshot is disabled (SNAPSHOT_DB_INTERVAL = 0 or an in-memory database).")
+    click.echo(f"Analytics snapshot as of {take_snapshot():%Y-%m-%d %H:%M:%S} written to {snapshot_path()}.")
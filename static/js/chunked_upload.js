@@ -0,0 +1,128 @@
+// Resumable chunked uploads for question media (see chunked_uploads.py).
+// A file input marked data-chunked-upload="<kind>" is sent chunk by chunk to
+// /api/uploads before the form is submitted; the form then only carries the
+// upload id in the hidden <kind>_upload field. Interrupted uploads resume from
+// the first missing chunk, also after a page reload (the id is kept in
+// localStorage). Without Web Crypto (plain http off localhost) the input is
+// left alone and the file goes up with the form as before.
+(function () {
+    if (!window.crypto || !window.crypto.subtle || !window.fetch) {
+        return;
+    }
+
+    const MAX_RETRIES = 5;
+
+    function hex(buffer) {
+        return Array.from(new Uint8Array(buffer), b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function request(url, options) {
+        const response = await fetch(url, Object.assign({credentials: 'same-origin'}, options));
+        const body = await response.json().catch(() => ({}));
+        if (!response.ok) {
+            const error = new Error(body.error || response.statusText);
+            error.status = response.status;
+            throw error;
+        }
+        return body;
+    }
+
+    async function withRetries(fn) {
+        for (let attempt = 0; ; attempt++) {
+            try {
+                return await fn();
+            } catch (error) {
+                // 4xx means the request itself is wrong; retrying will not help,
+                // except 409 (another request is completing the upload)
+                if (attempt >= MAX_RETRIES || (error.status >= 400 && error.status < 500 && error.status !== 409)) {
+                    throw error;
+                }
+                await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
+            }
+        }
+    }
+
+    async function resumeOrStart(file, kind) {
+        const key = `chunked-upload:${kind}:${file.name}:${file.size}:${file.lastModified}`;
+        const saved = localStorage.getItem(key);
+        if (saved) {
+            try {
+                return [key, await request(`/api/uploads/${saved}`)];
+            } catch (error) {
+                localStorage.removeItem(key);
+            }
+        }
+        const upload = await request('/api/uploads', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({filename: file.name, size: file.size, kind: kind})
+        });
+        localStorage.setItem(key, upload.id);
+        return [key, upload];
+    }
+
+    async function upload(file, kind, progress) {
+        let [key, status] = await resumeOrStart(file, kind);
+        for (const index of status.missing) {
+            // Only one chunk is in memory at a time
+            const chunk = await file.slice(index * status.chunk_size, (index + 1) * status.chunk_size).arrayBuffer();
+            const checksum = hex(await crypto.subtle.digest('SHA-256', chunk));
+            await withRetries(() => request(`/api/uploads/${status.id}/chunks/${index}`, {
+                method: 'PUT',
+                headers: {'Content-Type': 'application/octet-stream', 'X-Chunk-SHA256': checksum},
+                body: chunk
+            }));
+            progress(status.chunk_count - status.missing.length + status.missing.indexOf(index) + 1, status.chunk_count);
+        }
+        status = await withRetries(() => request(`/api/uploads/${status.id}/complete`, {method: 'POST'}));
+        localStorage.removeItem(key);
+        return status;
+    }
+
+    function attach(input) {
+        const kind = input.dataset.chunkedUpload;
+        const form = input.form;
+        const hidden = document.createElement('input');
+        hidden.type = 'hidden';
+        hidden.name = `${kind}_upload`;
+        const note = document.createElement('small');
+        note.className = 'form-text text-muted';
+        input.after(hidden, note);
+
+        let pending = null;
+        input.addEventListener('change', function () {
+            const file = input.files[0];
+            hidden.value = '';
+            if (!file) {
+                return;
+            }
+            note.textContent = 'Uploading...';
+            pending = upload(file, kind, (done, total) => {
+                note.textContent = `Uploading... ${Math.round(done * 100 / total)}%`;
+            }).then(status => {
+                hidden.value = status.id;
+                note.textContent = 'Upload complete.';
+            }).catch(error => {
+                note.textContent = `Upload failed: ${error.message}. Choose the file again to resume.`;
+            }).finally(() => {
+                pending = null;
+            });
+        });
+
+        form.addEventListener('submit', function (event) {
+            if (pending) {
+                event.preventDefault();
+                note.textContent += ' (wait for the upload to finish before saving)';
+                return;
+            }
+            // The file is already on the server; do not send it again with the form
+            if (hidden.value) {
+                input.disabled = true;
+            }
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('input[type=file][data-chunked-upload]').forEach(attach);
+    });
+})();
@@ -0,0 +1,137 @@
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import func, case
+from models import db, Quiz, Score
+
+# Most points drawn on a timeline chart when the app config does not set TIMELINE_MAX_POINTS
+DEFAULT_MAX_POINTS = 120
+
+# Most quizzes shown on the time-spent bar chart
+MAX_TIME_BARS = 30
+
+RESOLUTIONS = ("auto", "raw", "day", "week", "lttb")
+
+
+def _percentage():
+    """SQL expression for a score as a percentage of its quiz's total marks"""
+    return case((Quiz.total_marks > 0, Score.total_scored * 100.0 / Quiz.total_marks), else_=0)
+
+
+def _user_scores(user_id, *columns):
+    return db.session.query(*columns).select_from(Score).join(
+        Quiz, Quiz.id == Score.quiz_id).filter(Score.user_id == user_id)
+
+
+def _raw_points(user_id):
+    rows = _user_scores(user_id, Score.time_stamp_of_attempt, _percentage()).order_by(
+        Score.time_stamp_of_attempt, Score.id).all()
+    return [(timestamp, float(score)) for timestamp, score in rows if timestamp]
+
+
+def _bucket_points(user_id, bucket):
+    """Average score per day ('%Y-%m-%d') or week ('%Y-%W'), grouped in SQL"""
+    key = func.strftime(bucket, Score.time_stamp_of_attempt)
+    rows = _user_scores(user_id, key, func.min(Score.time_stamp_of_attempt), func.avg(_percentage())).filter(
+        Score.time_stamp_of_attempt.isnot(None)).group_by(key).order_by(key).all()
+    return [(first_timestamp, float(score)) for _, first_timestamp, score in rows]
+
+
+def _bucket_count(user_id, bucket):
+    return _user_scores(user_id, func.count(func.distinct(func.strftime(bucket, Score.time_stamp_of_attempt)))).scalar()
+
+
+def lttb(points, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling of (x, y) points sorted by x.
+    Keeps the first and last point and, per bucket, the point forming the
+    largest triangle with the previous pick and the next bucket's average.
+    """
+    if threshold >= len(points) or threshold < 3:
+        return list(points)
+
+    def x_of(point):
+        x = point[0]
+        return x.timestamp() if isinstance(x, datetime) else x
+
+    sampled = [points[0]]
+    bucket_size = (len(points) - 2) / (threshold - 2)
+    previous = points[0]
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        next_start, next_end = end, min(int((bucket + 2) * bucket_size) + 1, len(points))
+        next_bucket = points[next_start:next_end] or [points[-1]]
+        avg_x = sum(x_of(p) for p in next_bucket) / len(next_bucket)
+        avg_y = sum(p[1] for p in next_bucket) / len(next_bucket)
+
+        best, best_area = None, -1
+        previous_x, previous_y = x_of(previous), previous[1]
+        for point in points[start:end]:
+            area = abs((previous_x - avg_x) * (point[1] - previous_y) -
+                       (previous_x - x_of(point)) * (avg_y - previous_y))
+            if area > best_area:
+                best, best_area = point, area
+        sampled.append(best)
+        previous = best
+    sampled.append(points[-1])
+    return sampled
+
+
+def score_timeline(user_id, resolution="auto", max_points=None):
+    """
+    Score percentage over time for a user, as [{"date", "score"}] with at most
+    `max_points` entries. "auto" returns raw attempts when they fit, otherwise
+    daily then weekly averages, and LTTB over the weekly series as a last resort.
+    """
+    max_points = max_points or current_app.config.get("TIMELINE_MAX_POINTS", DEFAULT_MAX_POINTS)
+    resolution = resolution if resolution in RESOLUTIONS else "auto"
+    label = "%Y-%m-%d"
+
+    if resolution == "auto":
+        total = _user_scores(user_id, func.count(Score.id)).scalar()
+        if total <= max_points:
+            resolution = "raw"
+        elif _bucket_count(user_id, "%Y-%m-%d") <= max_points:
+            resolution = "day"
+        else:
+            resolution = "week"
+
+    if resolution == "raw":
+        points = _raw_points(user_id)
+        label = "%Y-%m-%d %H:%M" if len({p[0].date() for p in points}) < len(points) else label
+    elif resolution == "day":
+        points = _bucket_points(user_id, "%Y-%m-%d")
+    elif resolution == "week":
+        points = _bucket_points(user_id, "%Y-%W")
+        label = "Week of %Y-%m-%d"
+    else:
+        points = _raw_points(user_id)
+
+    # Never hand the chart more than max_points, whatever the resolution
+    points = lttb(points, max_points)
+    return [{"date": timestamp.strftime(label), "score": round(score, 1)} for timestamp, score in points]
+
+
+def time_spent_series(user_id, limit=MAX_TIME_BARS):
+    """Average minutes per quiz for the user's most recently attempted quizzes"""
+    rows = _user_scores(
+        user_id, Quiz.name, func.avg(Score.time_spent), func.max(Score.time_stamp_of_attempt)
+    ).filter(Score.time_spent.isnot(None)).group_by(Quiz.id, Quiz.name).order_by(
+        func.max(Score.time_stamp_of_attempt).desc()).limit(limit).all()
+    return [{"quiz_name": name, "time_spent": round(float(seconds) / 60, 1)}
+            for name, seconds, _ in reversed(rows)]
+
+
+def summary_totals(user_id):
+    """Stat-card counters for user_summary in one aggregate query"""
+    quizzes, questions, correct = db.session.query(
+        func.count(func.distinct(Score.quiz_id)),
+        func.coalesce(func.sum(Score.total_questions), 0),
+        func.coalesce(func.sum(Score.questions_correct), 0)
+    ).filter(Score.user_id == user_id).one()
+    return {
+        "total_quizzes": quizzes,
+        "total_questions_attempted": questions,
+        "total_correct": correct,
+        "overall_accuracy": (correct / questions * 100) if questions > 0 else 0.0,
+    }
@@ -0,0 +1,108 @@
+from math import sqrt
+from sqlalchemy import func, case, tuple_
+from models import db, Subject, Chapter, Quiz, Score, UserStrength
+
+# Keep IN lists well below SQLite's bound parameter limit
+CHUNK_SIZE = 500
+
+
+class UserStats:
+    """Per-user analytics that used to be separate User properties"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.average_score = 0
+        self.quizzes_completed = 0
+        self.strongest_subject = None
+        self.consistency_score = 0.0
+        self.fastest_quiz = None
+        self.slowest_quiz = None
+        self.subject_performance = {}
+
+
+def _accuracy():
+    """SQL expression for Score.accuracy"""
+    return case(
+        (Score.total_questions > 0, Score.questions_correct * 100.0 / Score.total_questions),
+        else_=0
+    )
+
+
+def load_user_stats(user_ids):
+    """
+    Compute UserStats for many users with a fixed number of grouped queries per
+    CHUNK_SIZE users.
+    Returns a dict of user_id -> UserStats (users without scores get defaults).
+    """
+    user_ids = list(user_ids)
+    stats = {user_id: UserStats(user_id) for user_id in user_ids}
+    for start in range(0, len(user_ids), CHUNK_SIZE):
+        _load_chunk(stats, user_ids[start:start + CHUNK_SIZE])
+    return stats
+
+
+def _load_chunk(stats, user_ids):
+    """Fill in stats for one CHUNK_SIZE slice of user ids"""
+    # 1) Counts, score percentage and the sums needed for the accuracy standard deviation
+    accuracy = _accuracy()
+    completed = Score.total_questions > 0
+    timed = Score.time_spent > 0
+    rows = db.session.query(
+        Score.user_id,
+        func.count(Score.id),
+        func.sum(Score.total_scored),
+        func.sum(Quiz.total_marks),
+        func.sum(case((completed, 1), else_=0)),
+        func.sum(case((completed, accuracy), else_=0)),
+        func.sum(case((completed, accuracy * accuracy), else_=0)),
+        func.min(case((timed, Score.time_spent))),
+        func.max(case((timed, Score.time_spent)))
+    ).outerjoin(Quiz, Quiz.id == Score.quiz_id
+    ).filter(Score.user_id.in_(user_ids)
+    ).group_by(Score.user_id).all()
+
+    extremes = {}
+    for user_id, count, scored, possible, n, acc_sum, acc_sq_sum, min_time, max_time in rows:
+        s = stats[user_id]
+        s.quizzes_completed = count
+        s.average_score = (scored / possible) * 100 if possible else 0
+        if n >= 2:
+            variance = (acc_sq_sum - acc_sum * acc_sum / n) / (n - 1)
+            s.consistency_score = sqrt(max(variance, 0.0))
+        if min_time is not None:
+            extremes[(user_id, min_time)] = "fastest_quiz"
+            extremes[(user_id, max_time)] = "slowest_quiz" if (user_id, max_time) not in extremes else "both"
+
+    # 2) Fastest and slowest attempts, loaded as Score objects in one query
+    # Two bound parameters per (user, time) pair
+    pairs = list(extremes)
+    for start in range(0, len(pairs), CHUNK_SIZE // 2):
+        for score in Score.query.filter(
+            tuple_(Score.user_id, Score.time_spent).in_(pairs[start:start + CHUNK_SIZE // 2])
+        ).order_by(Score.id).all():
+            s = stats[score.user_id]
+            kind = extremes[(score.user_id, score.time_spent)]
+            if kind in ("fastest_quiz", "both") and s.fastest_quiz is None:
+                s.fastest_quiz = score
+            if kind in ("slowest_quiz", "both") and s.slowest_quiz is None:
+                s.slowest_quiz = score
+
+    # 3) Average accuracy per subject
+    for user_id, subject_name, avg_accuracy in db.session.query(
+        Score.user_id, Subject.name, func.avg(accuracy)
+    ).join(Quiz, Quiz.id == Score.quiz_id
+    ).join(Chapter, Chapter.id == Quiz.chapter_id
+    ).join(Subject, Subject.id == Chapter.subject_id
+    ).filter(Score.user_id.in_(user_ids)
+    ).group_by(Score.user_id, Subject.name).all():
+        stats[user_id].subject_performance[subject_name] = avg_accuracy
+
+    # 4) Strongest subject from the recorded strengths
+    best = {}
+    for user_id, subject_name, performance in db.session.query(
+        UserStrength.user_id, Subject.name, UserStrength.performance_score
+    ).join(Subject, Subject.id == UserStrength.subject_id
+    ).filter(UserStrength.user_id.in_(user_ids)).all():
+        if user_id not in best or (performance or 0) > best[user_id]:
+            best[user_id] = performance or 0
+            stats[user_id].strongest_subject = subject_name